@@ -0,0 +1,132 @@
+# app/app_config.py
+"""
+Application configuration loading without Streamlit
+config/config.yaml holds the settings and secrets (Elasticsearch, Vertex AI, GCS
+bucket, service account) come from a secrets lookup or environment variables.
+The Streamlit app passes a lookup into st.secrets (see main.load_streamlit_secrets);
+offline jobs use environment variables only through load_job_config, so they run
+on hosts without Streamlit secrets.
+"""
+
+import json
+import os
+from typing import Any, Callable, Dict, Optional
+
+import yaml
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'config.yaml')
+
+# Returns the value at a dotted path of a secrets source (e.g. "elasticsearch.api_key"), or None
+SecretLookup = Callable[[str], Any]
+
+
+def load_config_file(path: str = CONFIG_PATH) -> Dict[str, Any]:
+    """Load config.yaml; raises FileNotFoundError if it is missing"""
+    with open(path, 'r') as file:
+        return yaml.safe_load(file) or {}
+
+
+def load_secrets(lookup: Optional[SecretLookup] = None, require_elasticsearch: bool = True) -> Dict[str, Any]:
+    """
+    Load secrets from lookup (when given) with environment variables as fallback
+
+    Also makes the GCP service account available to the Google clients through
+    GOOGLE_APPLICATION_CREDENTIALS. Raises KeyError naming the missing secret.
+    """
+    def get_secret(key_path: str, env_var: str = None):
+        """Get value from the secrets lookup or environment variable"""
+        value = lookup(key_path) if lookup else None
+        if value is None and env_var and env_var in os.environ:
+            return os.environ[env_var]
+        return value
+
+    # Elastic Cloud Configuration
+    # Support both Serverless (endpoint + API key) and Hosted (cloud_id + username/password)
+    elastic_cloud_id = get_secret("elasticsearch.cloud_id", "ELASTICSEARCH_CLOUD_ID")
+    elastic_endpoint = get_secret("elasticsearch.endpoint", "ELASTICSEARCH_ENDPOINT")  # For Serverless
+    elastic_username = get_secret("elasticsearch.username", "ELASTICSEARCH_USERNAME")
+    elastic_password = get_secret("elasticsearch.password", "ELASTICSEARCH_PASSWORD")
+    elastic_api_key = get_secret("elasticsearch.api_key", "ELASTICSEARCH_API_KEY")  # For Serverless
+
+    # Prioritize Serverless if both are provided
+    if elastic_endpoint and elastic_api_key:
+        # Serverless configuration
+        print("✓ Using Serverless Elasticsearch configuration")
+        elastic_config = {
+            'elastic_cloud_id': None,
+            'elastic_hosts': [elastic_endpoint],
+            'elastic_username': None,
+            'elastic_password': None,
+            'elastic_api_key': elastic_api_key
+        }
+    elif elastic_cloud_id and elastic_username and elastic_password:
+        # Hosted configuration
+        print("✓ Using Hosted Elasticsearch configuration")
+        elastic_config = {
+            'elastic_cloud_id': elastic_cloud_id,
+            'elastic_hosts': None,
+            'elastic_username': elastic_username,
+            'elastic_password': elastic_password,
+            'elastic_api_key': None
+        }
+    elif require_elasticsearch:
+        raise KeyError("elasticsearch configuration: Must provide either (endpoint + api_key) for Serverless or (cloud_id + username + password) for Hosted")
+    else:
+        elastic_config = {}
+
+    # Vertex AI Configurations
+    vertexai_config = {
+        'vertexai_project': get_secret("vertex_ai.VERTEXAI_PROJECT", "VERTEXAI_PROJECT"),
+        'vertexai_location': get_secret("vertex_ai.VERTEXAI_LOCATION", "VERTEXAI_LOCATION"),
+        'vertexai_model_id': get_secret("vertex_ai.VERTEXAI_MODEL_ID", "VERTEXAI_MODEL_ID") or "gemini-2.0-flash-001"
+    }
+
+    # GCS Configuration
+    gcs_config = {
+        'gcs_bucket_name': get_secret("app_config.gcs_bucket_name", "GCS_BUCKET_NAME")
+    }
+
+    _install_google_credentials(lookup)
+
+    return {
+        **elastic_config,
+        **vertexai_config,
+        **gcs_config
+    }
+
+
+def _install_google_credentials(lookup: Optional[SecretLookup]):
+    """Write the service account to gcp_credentials.json and point GOOGLE_APPLICATION_CREDENTIALS at it"""
+    # Try to get from secrets first, then from environment or file
+    credentials = lookup("gcp_service_account") if lookup else None
+    if credentials is not None:
+        credentials = dict(credentials)
+    else:
+        credentials_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+        if credentials_path and os.path.exists(credentials_path):
+            with open(credentials_path, 'r') as f:
+                credentials = json.load(f)
+        elif os.path.exists("gcp_credentials.json"):
+            with open("gcp_credentials.json", 'r') as f:
+                credentials = json.load(f)
+
+    if not credentials:
+        raise KeyError("gcp_service_account: Must provide GCP credentials in secrets, environment variable, or gcp_credentials.json file")
+
+    # Write credentials to temporary file (skip the rewrite when unchanged across reruns)
+    credentials_payload = json.dumps(credentials)
+    existing_payload = None
+    if os.path.exists("gcp_credentials.json"):
+        with open("gcp_credentials.json", "r") as f:
+            existing_payload = f.read()
+    if existing_payload != credentials_payload:
+        with open("gcp_credentials.json", "w") as f:
+            f.write(credentials_payload)
+
+    # Set environment variable
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "gcp_credentials.json"
+
+
+def load_job_config(require_elasticsearch: bool = True) -> Dict[str, Any]:
+    """config.yaml merged with secrets from environment variables, for offline jobs"""
+    return {**load_config_file(), **load_secrets(require_elasticsearch=require_elasticsearch)}
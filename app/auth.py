@@ -3,7 +3,7 @@ import streamlit as st
 import hashlib
 import secrets
 import time
-from typing import Dict, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 import json
 import os
 
@@ -13,6 +13,9 @@ class AuthenticationManager:
         self.session_timeout = 3600  # 1 hour in seconds
         self.max_login_attempts = 5
         self.lockout_duration = 300  # 5 minutes in seconds
+        # Called with the username on logout to persist the user's queued writes
+        # (set by the backend API, see ResearchAssistantAPI.flush_persistence)
+        self.logout_flush: Optional[Callable[[str], Any]] = None
         
     def hash_password(self, password: str, salt: str = None) -> Tuple[str, str]:
         """Hash password with salt using SHA-256"""
@@ -131,6 +134,10 @@ class AuthenticationManager:
     
     def logout(self):
         """Logout user and clear session"""
+        # Make sure the user's queued writes reach storage before the session goes away
+        username = st.session_state.get('username')
+        if username and self.logout_flush is not None:
+            self.logout_flush(username)
         if 'authenticated' in st.session_state:
             del st.session_state.authenticated
         if 'username' in st.session_state:
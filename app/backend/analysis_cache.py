@@ -0,0 +1,150 @@
+# app/backend/analysis_cache.py
+"""
+Analysis Result Cache - Persistent cache of complete keyword analyses
+A full analysis (ES search, metadata reads and an 8k-token generation) is keyed
+by its normalized inputs: sorted keywords, search mode, the resolved date
+window and the version of the paper index. New or re-synced papers change the
+index version, so stale entries are simply never hit again and age out.
+Entries live in SQLite so they are shared by every session and survive restarts.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+DEFAULT_ANALYSIS_CACHE_PATH = os.path.join(".cache", "analyses.sqlite")
+
+
+def analysis_cache_key(keywords: List[str], search_mode: str, date_window: Optional[Dict], index_version: str,
+                       retrieval_config: Optional[Dict] = None, generation_config: Optional[Dict] = None) -> str:
+    """
+    Normalized cache key for an analysis request; retrieval_config holds the ranking
+    settings (date filtering, fusion weights, dense retrieval) that change the paper set,
+    generation_config those that change the report written from it (model, context budgets)
+    """
+    normalized = {
+        'keywords': sorted({keyword.strip().lower() for keyword in keywords}),
+        'search_mode': search_mode,
+        'date_window': date_window or {},
+        'index_version': index_version,
+        'retrieval_config': retrieval_config or {},
+        'generation_config': generation_config or {}
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """SQLite-backed cache bounded by entry count and entry age"""
+
+    def __init__(self, path: str = DEFAULT_ANALYSIS_CACHE_PATH, max_entries: int = 500,
+                 max_age_seconds: float = 7 * 86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        self._db = None
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "cache_key TEXT PRIMARY KEY, payload BLOB, created_at REAL, accessed_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_analyses_accessed ON analyses (accessed_at)")
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Analysis cache unavailable ({path}): {e}")
+            self._db = None
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result (with 'cached_at') or None on miss / expiry"""
+        with self._lock:
+            if self._db is None:
+                return None
+            try:
+                row = self._db.execute(
+                    "SELECT payload, created_at FROM analyses WHERE cache_key = ?", (cache_key,)
+                ).fetchone()
+                if row is None or (time.time() - row[1]) >= self.max_age_seconds:
+                    self._stats['misses'] += 1
+                    return None
+                self._db.execute("UPDATE analyses SET accessed_at = ? WHERE cache_key = ?", (time.time(), cache_key))
+                self._db.commit()
+                result = json.loads(zlib.decompress(row[0]))
+            except (sqlite3.Error, zlib.error, ValueError) as e:
+                print(f"Analysis cache read failed: {e}")
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+        result['cached_at'] = row[1]
+        return result
+
+    def put(self, cache_key: str, result: Dict[str, Any]):
+        """Store a complete analysis result"""
+        payload = zlib.compress(json.dumps(result, separators=(',', ':')).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analyses (cache_key, payload, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (cache_key, payload, now, now)
+                )
+                self._stats['stores'] += 1
+                self._evict(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Analysis cache write failed: {e}")
+
+    def invalidate(self, cache_key: Optional[str] = None):
+        """Drop one entry, or all entries when cache_key is None"""
+        with self._lock:
+            if self._db is None:
+                return
+            if cache_key is None:
+                self._db.execute("DELETE FROM analyses")
+            else:
+                self._db.execute("DELETE FROM analyses WHERE cache_key = ?", (cache_key,))
+            self._db.commit()
+
+    def close(self):
+        """Close the SQLite connection; later lookups miss"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            try:
+                stats['size'] = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0] if self._db else 0
+            except sqlite3.Error:
+                stats['size'] = 0
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used beyond max_entries (caller holds the lock)"""
+        expired = self._db.execute("DELETE FROM analyses WHERE created_at < ?", (now - self.max_age_seconds,)).rowcount
+        count = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        overflow = max(0, count - self.max_entries)
+        if overflow:
+            self._db.execute(
+                "DELETE FROM analyses WHERE cache_key IN "
+                "(SELECT cache_key FROM analyses ORDER BY accessed_at ASC LIMIT ?)", (overflow,)
+            )
+        self._stats['evictions'] += max(0, expired) + overflow
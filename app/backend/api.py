@@ -7,14 +7,16 @@ This handles all data processing, AI calls, GCS operations, and authentication
 import json
 import time
 import os
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
 import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
 from dateutil import parser as date_parser
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+import hashlib
+import threading
 
 import vertexai
 from vertexai.generative_models import GenerativeModel
-from google.cloud import storage
 from google.api_core.exceptions import NotFound
 
 import sys
@@ -23,30 +25,180 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from auth import auth_manager
 from gcs_user_storage import GCSUserStorage
-from elasticsearch_utils import get_es_manager
+from storage_backend import build_storage_backend
+from gcs_client import get_bucket
+from persistence_queue import get_persistence_queue
+from paper_store import PaperContentStore, paper_reference, paper_text
+from elasticsearch_utils import CONTENT_PREVIEW_CHARS, get_es_manager
+from backend.resources import resource_registry
+from backend.paper_metadata import PaperMetadataContext
+from backend.metadata_cache import MetadataCache, DEFAULT_CACHE_PATH
+from backend.titling import extractive_title, is_generic_title
+from backend.analysis_cache import AnalysisCache, DEFAULT_ANALYSIS_CACHE_PATH, analysis_cache_key
+from backend.context_packer import pack_sources, pack_history, count_tokens
+from backend.passages import PassageIndex
+from backend.fusion import weighted_rrf
+from backend.vector_store import DEFAULT_VECTOR_STORE_PATH, current_build, open_vector_store
+from backend.embed_papers import DEFAULT_EMBEDDING_MODEL, encode_texts, load_encoder
+from backend.context_cache import ContextCacheError, ContextCacheExpired, build_context_cache, handle_is_valid
+
+# Fields the search path needs from ES; full 'content' is never shipped
+SEARCH_SOURCE_FIELDS = ['title', 'abstract', 'authors', 'publication_date', 'url', 'doi_url', 'link', 'content_preview']
+
+# Citation rules shared by the full and the cached-context follow-up prompts
+FOLLOW_UP_CITATION_INSTRUCTIONS = """**CITATION INSTRUCTIONS:** When referencing sources, use citation markers in square brackets like [1], [2], [3], etc. Separate multiple citations with individual brackets like [2][3][4]. **IMPORTANT:** Limit citations to a maximum of 3 per sentence. If more than 3 sources support a finding, choose the 3 most relevant or representative sources."""
+
+# System instruction stored with a cached follow-up context
+FOLLOW_UP_SYSTEM_INSTRUCTION = (
+    "You are the Polo-GGB Research Assistant. Answer the user's questions about the paper sources "
+    "in your context, citing them by their SOURCE numbers."
+)
 
 class ResearchAssistantAPI:
     def __init__(self, config: Dict[str, Any]):
         """Initialize the backend API with configuration"""
         self.config = config
         
-        # Initialize services
-        self.gcs_storage = GCSUserStorage(config['gcs_bucket_name'])
+        # Initialize services (shared per process through the resource registry)
+        # The storage backend (GCS, local disk or memory) comes from the 'storage' config section
+        storage_key = {'gcs_bucket_name': config.get('gcs_bucket_name'), 'storage': config.get('storage') or {}}
+        self.storage_backend = resource_registry.get_or_build(
+            'storage_backend', storage_key, lambda: build_storage_backend(config)
+        )
+        self.gcs_storage = resource_registry.get_or_build(
+            'gcs_user_storage',
+            storage_key,
+            lambda: GCSUserStorage(config.get('gcs_bucket_name'), backend=self.storage_backend)
+        )
+        # User documents are written to GCS in the background
+        self.persistence_queue = get_persistence_queue()
+        auth_manager.logout_flush = self.flush_persistence
+        
+        # Content-addressed store of paper texts referenced by conversations
+        self.paper_store = resource_registry.get_or_build(
+            'paper_store',
+            storage_key,
+            lambda: PaperContentStore(self.storage_backend)
+        )
         self.es_manager = get_es_manager(
             cloud_id=config.get('elastic_cloud_id'),
             hosts=config.get('elastic_hosts'),
             username=config.get('elastic_username'),
             password=config.get('elastic_password'),
-            api_key=config.get('elastic_api_key')
+            api_key=config.get('elastic_api_key'),
+            query_cache_ttl=(config.get('search') or {}).get('query_cache_ttl_seconds', 300),
+            query_cache_size=(config.get('search') or {}).get('query_cache_size', 256)
         )
         
+        # Sidecar metadata cache (memory LRU + on-disk SQLite), shared per process
+        cache_config = config.get('metadata_cache') or {}
+        self.metadata_cache = resource_registry.get_or_build(
+            'metadata_cache', cache_config,
+            lambda: MetadataCache(
+                path=cache_config.get('path', DEFAULT_CACHE_PATH),
+                memory_entries=cache_config.get('memory_entries', 2048),
+                disk_entries=cache_config.get('disk_entries', 50000),
+                ttl_seconds=cache_config.get('ttl_seconds', 86400)
+            )
+        )
+        
+        # Whole-analysis result cache (SQLite), shared per process and across restarts
+        analysis_cache_config = config.get('analysis_cache') or {}
+        self.analysis_cache = resource_registry.get_or_build(
+            'analysis_cache', analysis_cache_config,
+            lambda: AnalysisCache(
+                path=analysis_cache_config.get('path', DEFAULT_ANALYSIS_CACHE_PATH),
+                max_entries=analysis_cache_config.get('max_entries', 500),
+                max_age_seconds=analysis_cache_config.get('max_age_seconds', 7 * 86400)
+            )
+        )
+        
+        # Background workers for model calls that must not block the UI (e.g. titles)
+        self._background_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="api-background")
+        # Dense kNN runs here while the keyword _msearch is in flight (kept apart from slow title calls)
+        self._dense_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dense-retrieval")
+        
         # Initialize Vertex AI
+        vertex_config = {
+            'vertexai_project': config['vertexai_project'],
+            'vertexai_location': config['vertexai_location'],
+            'vertexai_model_id': config['vertexai_model_id']
+        }
+        self.model = resource_registry.get_or_build(
+            'vertex_model', vertex_config, lambda: self._build_model(vertex_config)
+        )
+        
+        # Dense retrieval for hybrid search: memory-mapped paper vectors + query encoder,
+        # resolved per query (see _dense_resources) so a rebuilt store is picked up live
+        self.embeddings_config = config.get('embeddings') or {}
+        self._dense_resources()
+        
+        # Passage indexes of recent conversations' papers, shared by all sessions
+        self._passage_indexes = OrderedDict()
+        self._passage_indexes_lock = threading.Lock()
+        
+        # Cached literature context for follow-ups (None when disabled)
+        self.context_cache_config = config.get('context_cache') or {}
+        self.context_cache = build_context_cache(
+            self.context_cache_config, config['vertexai_model_id'], self.generate_ai_response_stream
+        )
+    
+    def close(self):
+        """
+        Stop this instance's background workers (called by the resource registry when a
+        configuration change replaces it); shared resources are closed by the registry
+        """
+        self._background_executor.shutdown(wait=False, cancel_futures=True)
+        self._dense_executor.shutdown(wait=False, cancel_futures=True)
+    
+    @staticmethod
+    def _build_model(vertex_config: Dict[str, Any]) -> GenerativeModel:
+        """Initialize Vertex AI and build the generative model handle"""
         vertexai.init(
-            project=config['vertexai_project'],
-            location=config['vertexai_location']
+            project=vertex_config['vertexai_project'],
+            location=vertex_config['vertexai_location']
         )
-        self.model = GenerativeModel(config['vertexai_model_id'])
+        return GenerativeModel(vertex_config['vertexai_model_id'])
         
+    def _dense_resources(self) -> Tuple[Optional[Any], Optional[Any]]:
+        """
+        Vector store and query encoder for dense retrieval, (None, None) when disabled or
+        unavailable. The store's live build (its CURRENT pointer) is part of the registry
+        key, so after embed_papers.py switches builds the next query opens the new one;
+        queries already running keep the previous build, which stays on disk.
+        """
+        if not self.embeddings_config.get('enabled', False):
+            return None, None
+        store_path = self.embeddings_config.get('store_path', DEFAULT_VECTOR_STORE_PATH)
+        vector_store = resource_registry.get_or_build(
+            'vector_store', {**self.embeddings_config, 'build': current_build(store_path)},
+            lambda: open_vector_store(store_path)
+        )
+        if vector_store is None:
+            return None, None
+        query_encoder = resource_registry.get_or_build(
+            'query_encoder', {'model': vector_store.model_name},
+            lambda: self._build_query_encoder(vector_store.model_name or DEFAULT_EMBEDDING_MODEL)
+        )
+        return vector_store, query_encoder
+    
+    @staticmethod
+    def _build_query_encoder(model_name: str):
+        """Load the sentence-transformers model matching the vector store, or None if unavailable"""
+        try:
+            return load_encoder(model_name)
+        except Exception as e:
+            print(f"Query encoder unavailable ({model_name}): {e}; hybrid search uses keyword results only")
+            return None
+    
+    def get_resource_build_times(self) -> Dict[str, Dict[str, float]]:
+        """Build times of the process-wide shared resources"""
+        return resource_registry.build_times()
+    
+    def get_metadata_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the paper metadata cache"""
+        return self.metadata_cache.stats()
+    
     def authenticate_user(self, username: str, password: str) -> Tuple[bool, str]:
         """Authenticate user and return success status and message"""
         return auth_manager.authenticate_user(username, password)
@@ -64,20 +216,108 @@ class ResearchAssistantAPI:
         return auth_manager.is_session_valid()
     
     def get_user_data(self, username: str) -> Dict[str, Any]:
-        """Get all user data from GCS"""
-        return self.gcs_storage.load_user_data_from_gcs(username)
+        """Get all user data from storage (empty if it could not be loaded)"""
+        return self.gcs_storage.load_user_data_from_gcs(username).value or {}
     
     def save_user_data(self, username: str, data: Dict[str, Any]) -> bool:
-        """Save user data to GCS"""
-        return self.gcs_storage.save_user_data(username, 'user_preferences', data)
+        """Queue a save of the user's preferences to GCS (written in the background)"""
+        snapshot = {key: list(value) if isinstance(value, list) else value for key, value in data.items()}
+        self.persistence_queue.submit(
+            ('user_data', username, 'user_preferences'),
+            lambda: self.gcs_storage.save_user_data(username, 'user_preferences', snapshot)
+        )
+        return True
     
     def save_conversation(self, username: str, conversation_id: str, conversation_data: Dict[str, Any]) -> bool:
-        """Save conversation to GCS"""
-        return self.gcs_storage.save_conversation(username, conversation_id, conversation_data)
+        """
+        Queue a save of a conversation to GCS (written in the background); paper texts go
+        to the paper store and are saved as references
+        """
+        # Copy the containers the UI keeps appending to, so the worker sees this turn's state
+        snapshot = dict(conversation_data)
+        snapshot['messages'] = list(conversation_data.get('messages', []))
+        if 'retrieved_papers' in conversation_data:
+            snapshot['retrieved_papers'] = list(conversation_data['retrieved_papers'] or [])
+        self.persistence_queue.submit(
+            ('conversation', username, conversation_id),
+            lambda: self.gcs_storage.save_conversation(username, conversation_id, self._compact_conversation(snapshot))
+        )
+        return True
+    
+    def flush_persistence(self, username: Optional[str] = None, timeout: Optional[float] = 10.0) -> bool:
+        """Wait for queued writes (of one user, or all) to reach GCS; False on timeout"""
+        if self.persistence_queue.flush(timeout=timeout, owner=username):
+            return True
+        print(f"Pending writes for {username or 'all users'} still queued after {timeout}s")
+        return False
+    
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        """Queue depth, retry counters and flush latency of the background writer"""
+        return self.persistence_queue.stats()
     
-    def delete_conversation(self, username: str, conversation_id: str) -> bool:
-        """Delete conversation from GCS"""
-        return self.gcs_storage.delete_conversation(username, conversation_id)
+    def _compact_conversation(self, conversation: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a conversation whose retrieved papers are references into the paper store"""
+        papers = conversation.get("retrieved_papers")
+        if not papers:
+            return conversation
+        
+        # Only papers carrying their text need storing; unresolved references are kept as they are
+        to_store = [i for i, paper in enumerate(papers) if 'content' in paper or not paper.get('content_ref')]
+        keys = dict(zip(to_store, self.paper_store.put_many([paper_text(papers[i]) for i in to_store])))
+        
+        compact_papers = []
+        for i, paper in enumerate(papers):
+            if i not in keys:
+                compact_papers.append(paper_reference(paper, paper.get('content_ref')))
+            elif keys[i]:
+                compact_papers.append(paper_reference(paper, keys[i]))
+            else:
+                compact_papers.append(paper)  # store unavailable: keep the text inline
+        
+        compact = dict(conversation)
+        compact["retrieved_papers"] = compact_papers
+        return compact
+    
+    def hydrate_conversation_papers(self, conversation: Dict[str, Any]):
+        """
+        Resolve the paper texts of a conversation's paper references in place.
+        References that could not be resolved are left as they are (no 'content'),
+        so a later save keeps their original content_ref.
+        """
+        unresolved = [paper for paper in conversation.get("retrieved_papers") or []
+                      if paper.get('content_ref') and 'content' not in paper]
+        if not unresolved:
+            return
+        texts = self.paper_store.get_many(paper['content_ref'] for paper in unresolved)
+        missing = 0
+        for paper in unresolved:
+            text = texts.get(paper['content_ref'])
+            if text is None:
+                missing += 1
+                continue
+            paper['content'] = text.get('content', '')
+            if text.get('abstract'):
+                paper.setdefault('metadata', {})['abstract'] = text['abstract']
+        if missing:
+            print(f"Could not resolve {missing}/{len(unresolved)} paper texts; keeping their references")
+    
+    def load_conversation(self, username: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Load the full body of a conversation from storage (None if it could not be loaded)"""
+        return self.gcs_storage.load_conversation(username, conversation_id).value
+    
+    def delete_conversation(self, username: str, conversation_id: str,
+                            conversation: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Queue deletion of a conversation from GCS; supersedes a pending save of it.
+        The provider's cached context of the conversation (when given) is deleted too.
+        """
+        if conversation is not None:
+            self._drop_context_cache(conversation)
+        self.persistence_queue.submit(
+            ('conversation', username, conversation_id),
+            lambda: self.gcs_storage.delete_conversation(username, conversation_id)
+        )
+        return True
     
     def generate_ai_response(self, prompt: str) -> Optional[str]:
         """Generate AI response using Vertex AI"""
@@ -89,51 +329,375 @@ class ResearchAssistantAPI:
             print(f"AI API error: {e}")
             return None
     
-    def search_papers(self, keywords: List[str], time_filter_type: str, search_mode: str = "all_keywords") -> Tuple[Optional[str], List[Dict], int]:
-        """Search papers and generate analysis"""
-        if not keywords:
+    def generate_ai_response_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Generate AI response using Vertex AI, yielding text chunks as they arrive.
+        Errors propagate to the caller, which decides how to report a broken stream.
+        """
+        generation_config = {"temperature": 0.2, "max_output_tokens": 8192}
+        responses = self.model.generate_content([prompt], generation_config=generation_config, stream=True)
+        for chunk in responses:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk without text parts (e.g. final chunk carrying only finish metadata)
+                continue
+            if text:
+                yield text
+    
+    def search_papers(self, keywords: List[str], time_filter_type: str, search_mode: str = "all_keywords",
+                      force_refresh: bool = False) -> Tuple[Optional[str], List[Dict], int]:
+        """Search papers and generate analysis (served from the analysis cache when possible)"""
+        if not force_refresh:
+            cached = self.get_cached_analysis(keywords, time_filter_type, search_mode)
+            if cached:
+                return cached['analysis'], cached['papers'], cached['total_found']
+        
+        prepared = self.prepare_analysis(keywords, time_filter_type, search_mode)
+        if not prepared:
             return None, [], 0
         
-        # Process time filter
-        time_filter_dict = self._get_time_filter_dict(time_filter_type)
+        # Stage 5: generate analysis
+        raw_analysis = self.generate_ai_response(prepared['prompt'])
         
-        # Perform search with higher limit for OR searches
-        n_results = 200 if search_mode == "any_keyword" else 100
-        all_papers, total_found = self._perform_hybrid_search(
-            keywords, 
-            time_filter_dict=None,  # No ES time filtering
-            n_results=n_results, 
-            max_final_results=15,
-            search_mode=search_mode
+        # Stage 6: make citations clickable and render references
+        analysis = None
+        if raw_analysis:
+            analysis = self.finalize_analysis(prepared, raw_analysis)
+            self.cache_analysis(prepared, time_filter_type, raw_analysis, analysis)
+        
+        return analysis, prepared['papers_for_references'], prepared['total_found']
+    
+    def get_cached_analysis(self, keywords: List[str], time_filter_type: str, search_mode: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached analysis for these inputs, or None.
+        The result holds 'analysis', 'raw_analysis', 'papers', 'total_found' and 'cached_at'.
+        """
+        if not keywords:
+            return None
+        return self.analysis_cache.get(self._analysis_cache_key(keywords, time_filter_type, search_mode))
+    
+    def cache_analysis(self, prepared: Dict[str, Any], time_filter_type: str, raw_analysis: str, analysis: str):
+        """Store a finished analysis in the analysis cache"""
+        cache_key = self._analysis_cache_key(prepared['keywords'], time_filter_type, prepared['search_mode'])
+        self.analysis_cache.put(cache_key, {
+            'analysis': analysis,
+            'raw_analysis': raw_analysis,
+            'papers': prepared['papers_for_references'],
+            'total_found': prepared['total_found']
+        })
+    
+    def get_analysis_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the analysis cache"""
+        return self.analysis_cache.stats()
+    
+    def get_search_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the Elasticsearch query result cache"""
+        return self.es_manager.query_cache_stats()
+    
+    def is_admin(self, username: Optional[str]) -> bool:
+        """Whether username is an administrator (admin_users), e.g. may bypass the analysis cache"""
+        admin_users = self.config.get('admin_users', ['admin'])
+        return bool(username) and username in admin_users
+    
+    def _analysis_cache_key(self, keywords: List[str], time_filter_type: str, search_mode: str) -> str:
+        """
+        Normalized cache key: keywords, mode, resolved date window, index version, retrieval
+        settings, model and context budgets
+        """
+        return analysis_cache_key(
+            keywords, search_mode, self._get_time_filter_dict(time_filter_type), self.es_manager.get_index_version(),
+            self._retrieval_config(),
+            {'model': self.config['vertexai_model_id'], 'context': self.config.get('context') or {}}
         )
+    
+    def _retrieval_config(self) -> Dict[str, Any]:
+        """Settings that change which papers an analysis is built from"""
+        dense = None
+        vector_store, query_encoder = self._dense_resources()
+        if vector_store is not None and query_encoder is not None:
+            dense = {'model': vector_store.model_name, 'papers': len(vector_store), 'build': vector_store.build_path}
+        return {
+            'trust_es_metadata': self._trust_es_metadata(),
+            'fusion_weights': (self.config.get('search') or {}).get('fusion_weights') or {},
+            'dense': dense
+        }
+    
+    def prepare_analysis(self, keywords: List[str], time_filter_type: str, search_mode: str = "all_keywords") -> Optional[Dict[str, Any]]:
+        """
+        Run the retrieval stages of an analysis and build its prompt.
+        Returns None when no papers match; otherwise a dict with the prompt, the papers
+        used for analysis and references, and the total number of papers found.
+        """
+        if not keywords:
+            return None
+        
+        # When sidecars have been synced into ES (backend/metadata_sync.py), dates and
+        # links are trusted from ES and GCS is not touched on the search path
+        trust_es_metadata = self._trust_es_metadata()
         
-        # Apply GCS-based time filtering if needed
-        if time_filter_type != "All time" and all_papers:
-            all_papers = self._filter_papers_by_gcs_dates(all_papers, time_filter_type)
-            total_found = len(all_papers)
+        # One metadata context per request: every sidecar is read at most once
+        metadata_context = PaperMetadataContext(self.config['gcs_bucket_name'], cache=self.metadata_cache)
+        
+        # Stage 1: retrieval (ES range filter on publication_date in trusted mode)
+        time_filter_dict = self._get_time_filter_dict(time_filter_type) if trust_es_metadata else None
+        all_papers, total_found = self._retrieve_papers(keywords, search_mode, time_filter_dict)
+        
+        # Stage 2: GCS-based time filtering if needed
+        if not trust_es_metadata and time_filter_type != "All time" and all_papers:
+            all_papers = self._filter_papers_by_gcs_dates(all_papers, time_filter_type, metadata_context)
+            total_found = self._keyword_match_count(all_papers)
         
         if not all_papers:
-            return None, [], 0
+            return None
         
-        # Prepare papers for analysis
-        if search_mode == "any_keyword":
-            top_papers_for_analysis = all_papers[:15]
-            papers_for_references = all_papers[:15]  # Only show 15 papers used in analysis
+        # Stage 3: selection of papers for the prompt and the references
+        top_papers_for_analysis, papers_for_references = self._select_papers(all_papers, search_mode)
+        self._fill_missing_previews(top_papers_for_analysis + papers_for_references)
+        
+        # Stage 4: overlay sidecar metadata (already resolved by the date filter when it ran)
+        if not trust_es_metadata:
+            top_papers_for_analysis = self._reload_paper_metadata(top_papers_for_analysis, metadata_context)
+            papers_for_references = self._reload_paper_metadata(papers_for_references, metadata_context)
+        
+        return {
+            'prompt': self._build_analysis_prompt(top_papers_for_analysis, keywords, search_mode),
+            'keywords': keywords,
+            'search_mode': search_mode,
+            'top_papers_for_analysis': top_papers_for_analysis,
+            'papers_for_references': papers_for_references,
+            'total_found': total_found
+        }
+    
+    def finalize_analysis(self, prepared: Dict[str, Any], analysis_text: str) -> str:
+        """Make citations clickable and append the references section to a generated analysis"""
+        return self._display_citations_separately(
+            analysis_text, prepared['papers_for_references'], prepared['top_papers_for_analysis'], prepared['search_mode']
+        )
+    
+    def build_follow_up_prompt(self, conversation: Dict[str, Any]) -> str:
+        """
+        Build the full prompt answering the last user message: chat history plus the
+        paper passages most relevant to the question (the packed paper context when
+        no passage matches)
+        """
+        self.hydrate_conversation_papers(conversation)
+        passage_context = self._follow_up_passage_context(conversation)
+        if passage_context:
+            literature_section = f"""--- RELEVANT PASSAGES FROM THE PAPER SOURCES ---
+{passage_context}
+--- END RELEVANT PASSAGES ---"""
         else:
-            top_papers_for_analysis = all_papers
-            papers_for_references = all_papers
+            literature_section = f"""--- FULL LITERATURE CONTEXT FOR THIS ANALYSIS ---
+{self._follow_up_literature_context(conversation)}
+--- END FULL LITERATURE CONTEXT FOR THIS ANALYSIS ---"""
+        
+        return f"""Continue our conversation. You are the Polo-GGB Research Assistant.
+Your task is to answer the user's last message based on the chat history and the context from the paper sources provided below.
+
+{FOLLOW_UP_CITATION_INSTRUCTIONS}
+
+--- CHAT HISTORY ---
+{self._follow_up_chat_history(conversation)}
+--- END CHAT HISTORY ---
+
+{literature_section}
+
+Assistant Response:"""
+    
+    def generate_follow_up_stream(self, conversation: Dict[str, Any]) -> Iterator[str]:
+        """
+        Answer the last user message of a conversation, yielding text chunks.
+        With context caching enabled the literature context is cached once per
+        conversation (handle kept in conversation['context_cache']) and each turn
+        only sends the chat history. If the provider has dropped the cache or cannot
+        use it (permissions, quota, unsupported model), the turn falls back to a full
+        resend and a new cache is tried next turn.
+        """
+        self.hydrate_conversation_papers(conversation)
+        handle = self._ensure_context_cache(conversation)
+        if handle:
+            generation_config = {"temperature": 0.2, "max_output_tokens": 8192}
+            # The cached context holds the paper overviews; passages add depth from the full texts
+            passage_context = self._follow_up_passage_context(conversation)
+            passage_section = ""
+            if passage_context:
+                passage_section = f"""--- RELEVANT PASSAGES FROM THE PAPER SOURCES ---
+{passage_context}
+--- END RELEVANT PASSAGES ---
+
+"""
+            prompt = f"""Continue our conversation. Answer the user's last message based on the chat history below and the literature context you were given.
+
+{FOLLOW_UP_CITATION_INSTRUCTIONS}
+
+--- CHAT HISTORY ---
+{self._follow_up_chat_history(conversation)}
+--- END CHAT HISTORY ---
+
+{passage_section}Assistant Response:"""
+            started = False
+            try:
+                for chunk in self.context_cache.generate_stream(handle, prompt, generation_config):
+                    started = True
+                    yield chunk
+                return
+            except ContextCacheExpired:
+                if started:
+                    raise
+                print(f"Cached context {handle.get('name')} expired; resending the full context")
+                self._drop_context_cache(conversation)
+            except ContextCacheError as e:
+                if started:
+                    raise
+                print(f"Cached context {handle.get('name')} unusable ({e}); resending the full context")
+                self._drop_context_cache(conversation)
         
-        # Generate analysis
-        analysis = self._generate_analysis(top_papers_for_analysis, keywords, search_mode)
+        yield from self.generate_ai_response_stream(self.build_follow_up_prompt(conversation))
+    
+    def _ensure_context_cache(self, conversation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return a usable cached-context handle for a conversation, creating one if needed"""
+        if self.context_cache is None or not conversation.get("retrieved_papers"):
+            return None
         
-        # Reload metadata and make citations clickable
-        papers_for_references = self._reload_paper_metadata(papers_for_references)
-        top_papers_for_analysis = self._reload_paper_metadata(top_papers_for_analysis)
+        model_id = self.config['vertexai_model_id']
+        handle = conversation.get('context_cache')
+        if handle_is_valid(handle) and handle.get('model') == model_id:
+            return handle
+        # An expired handle or one for another model is replaced (or dropped below)
+        self._drop_context_cache(conversation)
         
-        if analysis:
-            analysis = self._display_citations_separately(analysis, papers_for_references, top_papers_for_analysis, search_mode)
+        context = self._follow_up_literature_context(conversation)
+        # Providers reject (or bill a minimum for) small caches; those are cheaper to resend
+        if count_tokens(context) < int(self.context_cache_config.get('min_tokens', 4096)):
+            return None
         
-        return analysis, papers_for_references, total_found
+        try:
+            handle = self.context_cache.create(
+                FOLLOW_UP_SYSTEM_INSTRUCTION, context, int(self.context_cache_config.get('ttl_seconds', 3600))
+            )
+        except ContextCacheError as e:
+            print(f"Could not create cached context: {e}")
+            return None
+        handle['model'] = model_id
+        conversation['context_cache'] = handle
+        return handle
+    
+    def _drop_context_cache(self, conversation: Dict[str, Any]):
+        """Remove a conversation's cached-context handle and delete the provider's cached content"""
+        handle = conversation.pop('context_cache', None)
+        if not handle or self.context_cache is None:
+            return
+        try:
+            self.context_cache.delete(handle)
+        except ContextCacheError as e:
+            print(f"Could not delete cached context {handle.get('name')}: {e}")
+    
+    def release_context_caches(self, conversations: Iterable[Dict[str, Any]]):
+        """Delete the provider's cached contexts of conversations, e.g. when their user logs out"""
+        for conversation in conversations:
+            self._drop_context_cache(conversation)
+    
+    def _follow_up_chat_history(self, conversation: Dict[str, Any]) -> str:
+        """Chat history packed into the history token budget"""
+        history = pack_history(
+            conversation.get("messages", []),
+            self._context_budget('history_budget_tokens', 6000),
+            max_message_tokens=self._context_budget('history_message_tokens', 2000)
+        )
+        if history['dropped']:
+            print(f"Follow-up context: dropped {history['dropped']} older chat messages to fit the history budget")
+        return history['text']
+    
+    def _follow_up_literature_context(self, conversation: Dict[str, Any]) -> str:
+        """Paper sources of a conversation, identical on every turn"""
+        if not conversation.get("retrieved_papers"):
+            return ""
+        full_context = "Here is the full context of every paper found in the initial analysis:\n\n"
+        full_context += self._pack_paper_context(
+            conversation["retrieved_papers"], self._context_budget('follow_up_budget_tokens', 24000)
+        )
+        return full_context
+    
+    def _follow_up_passage_context(self, conversation: Dict[str, Any]) -> str:
+        """
+        Top-k passages for the last user message, grouped under their original
+        SOURCE numbers so citations still match the references list
+        """
+        papers = conversation.get("retrieved_papers") or []
+        questions = [m.get("content", "") for m in conversation.get("messages", []) if m.get("role") == "user"]
+        if not papers or not questions:
+            return ""
+        
+        passage_index = self._get_passage_index(papers)
+        passages = passage_index.search(
+            questions[-1],
+            top_k=self._context_budget('follow_up_passages', 12),
+            max_per_source=self._context_budget('follow_up_passages_per_source', 3)
+        )
+        if not passages:
+            return ""
+        
+        by_source = defaultdict(list)
+        best_score = defaultdict(float)
+        for passage in passages:
+            by_source[passage['source_index']].append(passage['text'])
+            best_score[passage['source_index']] = max(best_score[passage['source_index']], passage['score'])
+        
+        # Pack into the follow-up budget like the full paper context; better-matching sources keep more
+        source_indexes = sorted(by_source)
+        sources = []
+        for source_index in source_indexes:
+            meta = papers[source_index].get('metadata', {})
+            sources.append({
+                'title': meta.get('title', 'N/A'),
+                'link': self._get_paper_link(meta),
+                'content': "\n...\n".join(by_source[source_index]),
+                'score': best_score[source_index]
+            })
+        packed = pack_sources(sources, self._context_budget('follow_up_budget_tokens', 24000))
+        if packed['dropped'] or packed['trimmed']:
+            print(f"Packed passages of {len(packed['sources'])}/{len(sources)} sources into ~{packed['used_tokens']} tokens")
+        
+        context = ""
+        for source in packed['sources']:
+            context += f"SOURCE [{source_indexes[source['index']]+1}]:\n"
+            context += f"Title: {source['title']}\n"
+            context += f"Link: {source['link']}\n"
+            context += "Passages:\n" + source['content'] + "\n---\n\n"
+        return context
+    
+    def _get_passage_index(self, papers: List[Dict]) -> PassageIndex:
+        """BM25 passage index over the full texts of papers, built once per paper set"""
+        paper_ids = [paper.get('paper_id') or '' for paper in papers]
+        index_key = hashlib.sha1("\n".join(paper_ids).encode('utf-8')).hexdigest()
+        with self._passage_indexes_lock:
+            passage_index = self._passage_indexes.get(index_key)
+            if passage_index is not None:
+                self._passage_indexes.move_to_end(index_key)
+                return passage_index
+        
+        # Full texts come from ES in one round trip; the stored preview is the fallback
+        contents = self.es_manager.get_paper_contents([pid for pid in paper_ids if pid])
+        documents = []
+        for paper, paper_id in zip(papers, paper_ids):
+            meta = paper.get('metadata', {})
+            body = contents.get(paper_id) or paper.get('content') or ''
+            documents.append(f"{meta.get('title', '')}. {meta.get('abstract', '')}\n{body}")
+        passage_index = PassageIndex(documents)
+        
+        with self._passage_indexes_lock:
+            self._passage_indexes[index_key] = passage_index
+            self._passage_indexes.move_to_end(index_key)
+            while len(self._passage_indexes) > self._context_budget('passage_index_cache_size', 32):
+                self._passage_indexes.popitem(last=False)
+        return passage_index
+    
+    def finalize_follow_up(self, conversation: Dict[str, Any], response_text: str) -> str:
+        """Make citations in a follow-up answer clickable (no references section)"""
+        retrieved_papers = conversation.get("retrieved_papers", [])
+        search_mode = conversation.get("search_mode", "all_keywords")
+        return self._display_citations_separately(response_text, retrieved_papers, retrieved_papers, search_mode, include_references=False)
     
     def generate_custom_summary(self, uploaded_papers: List[Dict]) -> Optional[str]:
         """Generate summary of uploaded papers"""
@@ -206,8 +770,12 @@ class ResearchAssistantAPI:
             print(f"Error processing PDF: {e}")
             return None
     
-    def generate_conversation_title(self, conversation_history: str) -> str:
-        """Generate conversation title using AI"""
+    def generate_conversation_title(self, conversation_history: str, keywords: Optional[List[str]] = None,
+                                    papers: Optional[List[Dict]] = None) -> str:
+        """Generate conversation title using AI, or locally when titles.mode is 'extractive'"""
+        if keywords and self._title_mode() == "extractive":
+            return extractive_title(keywords, papers or [])
+        
         prompt = f"""Create a unique, descriptive title for this research analysis conversation. 
 Make it specific and distinguishable from other analyses. Include key topics, methods, or diseases mentioned.
 Keep it under 8 words and make it memorable.
@@ -217,16 +785,30 @@ Conversation content:
 
 Title:"""
         title = self.generate_ai_response(prompt)
-        if title:
-            return title.strip().replace('"', '')
-        return "Research Analysis"
+        title = title.strip().replace('"', '') if title else "Research Analysis"
+        
+        # If AI title is too generic, create a better one from keywords and paper topics
+        if keywords and is_generic_title(title):
+            return extractive_title(keywords, papers or [])
+        return title
+    
+    def submit_conversation_title(self, conversation_history: str, keywords: List[str], papers: List[Dict]) -> Future:
+        """Start title generation in the background and return its Future"""
+        if self._title_mode() == "extractive":
+            # No model call: resolve immediately
+            future = Future()
+            future.set_result(extractive_title(keywords, papers))
+            return future
+        return self._background_executor.submit(self.generate_conversation_title, conversation_history, keywords, papers)
+    
+    def _title_mode(self) -> str:
+        """Title generation mode: 'llm' (default) or 'extractive'"""
+        return (self.config.get('titles') or {}).get('mode', 'llm')
     
     def get_pdf_from_gcs(self, bucket_name: str, blob_name: str) -> Optional[bytes]:
         """Get PDF bytes from GCS"""
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_name)
+            blob = get_bucket(bucket_name).blob(blob_name)
             return blob.download_as_bytes()
         except NotFound:
             print(f"File not found in GCS: {blob_name}")
@@ -235,6 +817,31 @@ Title:"""
             print(f"Failed to download from GCS: {e}")
             return None
     
+    def get_pdf_signed_urls(self, paper_ids: List[str], expiration_minutes: int = 15) -> Dict[str, Optional[str]]:
+        """
+        Generate short-lived V4 signed download URLs for a batch of paper PDFs.
+        Signing happens locally with the service account key, so no PDF bytes (and
+        no GCS request) are involved; a paper maps to None when signing fails.
+        """
+        bucket = get_bucket(self.config['gcs_bucket_name'])
+        expiration = datetime.timedelta(minutes=expiration_minutes)
+        urls = {}
+        for paper_id in paper_ids:
+            if not paper_id:
+                continue
+            try:
+                filename = os.path.basename(paper_id).replace('"', '')
+                urls[paper_id] = bucket.blob(paper_id).generate_signed_url(
+                    version="v4",
+                    expiration=expiration,
+                    method="GET",
+                    response_disposition=f'attachment; filename="{filename}"'
+                )
+            except Exception as e:
+                print(f"Failed to sign download URL for {paper_id}: {e}")
+                urls[paper_id] = None
+        return urls
+    
     # Private helper methods
     def _get_time_filter_dict(self, time_filter_type: str) -> Optional[Dict]:
         """Get time filter dictionary"""
@@ -262,94 +869,212 @@ Title:"""
             return {"gte": f"01 {month_abbr} 2025", "lt": f"01 {next_month_abbr} {next_year}"}
         return None
     
+    def _trust_es_metadata(self) -> bool:
+        """Whether ES documents carry synced sidecar dates and links"""
+        return bool((self.config.get('search') or {}).get('trust_es_metadata', False))
+    
+    def _retrieve_papers(self, keywords: List[str], search_mode: str,
+                         time_filter_dict: Optional[Dict] = None) -> Tuple[List[Dict], int]:
+        """Retrieve candidate papers from Elasticsearch"""
+        # Higher limit for OR searches
+        n_results = 200 if search_mode == "any_keyword" else 100
+        return self._perform_hybrid_search(
+            keywords, 
+            time_filter_dict=time_filter_dict,  # None unless ES metadata is trusted
+            n_results=n_results, 
+            max_final_results=15,
+            search_mode=search_mode
+        )
+    
+    def _select_papers(self, all_papers: List[Dict], search_mode: str) -> Tuple[List[Dict], List[Dict]]:
+        """Select the papers used for analysis and for the references section"""
+        if search_mode == "any_keyword":
+            top_papers_for_analysis = all_papers[:15]
+            papers_for_references = all_papers[:15]  # Only show 15 papers used in analysis
+        else:
+            top_papers_for_analysis = all_papers
+            papers_for_references = all_papers
+        return top_papers_for_analysis, papers_for_references
+    
     def _perform_hybrid_search(self, keywords: List[str], time_filter_dict: Optional[Dict], 
                               n_results: int, max_final_results: int, search_mode: str) -> Tuple[List[Dict], int]:
-        """Perform hybrid search"""
+        """
+        Perform hybrid search: ES keyword ranking fused with the dense kNN ranking. The
+        dense kNN runs concurrently with the keyword _msearch, so it adds no latency
+        unless it is the slower of the two.
+        """
+        dense_future = self._dense_executor.submit(self._dense_ranking, keywords, n_results)
         operator = "AND" if search_mode == "all_keywords" else "OR"
+        hit_lists = self._keyword_rankings(keywords, operator, time_filter_dict, n_results)
+        dense_ranking = dense_future.result()
         
         if search_mode == "all_keywords":
-            return self._perform_and_search(keywords, time_filter_dict, n_results, 0.005, max_final_results)
+            return self._perform_and_search(hit_lists, 0.005, max_final_results, dense_ranking, time_filter_dict)
         else:
-            return self._perform_or_search(keywords, time_filter_dict, n_results)
+            return self._perform_or_search(hit_lists, time_filter_dict, n_results, dense_ranking)
     
-    def _perform_and_search(self, keywords: List[str], time_filter_dict: Optional[Dict], 
-                           n_results: int, score_threshold: float, max_final_results: int) -> Tuple[List[Dict], int]:
-        """Perform AND search"""
-        es_results = self.es_manager.search_papers(keywords, time_filter=time_filter_dict, size=n_results, operator="AND")
-        valid_paper_ids = {hit['_id'] for hit in es_results}
+    def _dense_ranking(self, keywords: List[str], top_k: int) -> List[str]:
+        """Paper ids ranked by embedding similarity to the keywords (empty when dense retrieval is off)"""
+        if not keywords:
+            return []
+        vector_store, query_encoder = self._dense_resources()
+        if vector_store is None or query_encoder is None:
+            return []
+        try:
+            started = time.time()
+            query_vector = encode_texts(query_encoder, [" ".join(keywords)])[0]
+            ranking = [paper_id for paper_id, _ in vector_store.search(query_vector, top_k)]
+            print(f"Dense kNN over {len(vector_store)} papers took {(time.time() - started) * 1000:.0f} ms")
+            return ranking
+        except Exception as e:
+            print(f"Dense retrieval failed: {e}")
+            return []
+    
+    def _perform_and_search(self, hit_lists: Dict[str, List[Dict]], score_threshold: float, max_final_results: int,
+                           dense_ranking: Optional[List[str]] = None,
+                           time_filter_dict: Optional[Dict] = None) -> Tuple[List[Dict], int]:
+        """
+        Perform AND search over the "AND" keyword rankings; per-keyword and dense ranks
+        only reorder papers that match every keyword
+        """
+        es_results = hit_lists['combined']
+        valid_paper_ids = [hit['_id'] for hit in es_results]
         total_papers_found = len(valid_paper_ids)
         
         if not valid_paper_ids:
             return [], 0
         
-        fused_scores = defaultdict(lambda: {'score': 0, 'doc': None})
-        k = 60
+        fused = self._fuse_rankings(hit_lists, dense_ranking, candidates=valid_paper_ids)
+        scores = dict(zip(fused['ids'], fused['scores']))
+        top_ids = [paper_id for paper_id in fused['ids'] if scores[paper_id] >= score_threshold][:max_final_results]
+        docs = self._documents_for(hit_lists['combined'], top_ids, time_filter_dict)
+        final_paper_list = self._fused_papers(fused, docs, top_ids)
         
-        for i, hit in enumerate(es_results):
-            rank = i + 1
-            paper_id = hit['_id']
-            fused_scores[paper_id]['score'] += 1 / (k + rank)
-            doc_content = {'paper_id': paper_id, 'metadata': hit['_source'], 'content': hit['_source'].get('content', '')}
-            fused_scores[paper_id]['doc'] = doc_content
-        
-        valid_fused_results = [item for item in fused_scores.values() if item['doc'] is not None]
-        sorted_fused_results = sorted(valid_fused_results, key=lambda x: x['score'], reverse=True)
+        return final_paper_list, total_papers_found
+    
+    def _perform_or_search(self, hit_lists: Dict[str, List[Dict]], time_filter_dict: Optional[Dict], n_results: int,
+                           dense_ranking: Optional[List[str]] = None) -> Tuple[List[Dict], int]:
+        """
+        Perform OR search over the "OR" keyword rankings; papers ranked by any keyword query
+        or by the dense ranking are fused by RRF and the top n_results are returned
+        """
+        keyword_ids = list(dict.fromkeys(hit['_id'] for hits in hit_lists.values() for hit in hits))
+        candidates = list(dict.fromkeys(keyword_ids + list(dense_ranking or [])))
+        fused = self._fuse_rankings(hit_lists, dense_ranking, candidates=candidates)
+        top_ids = fused['ids'][:n_results]
         
-        final_paper_list = [
-            item['doc'] for item in sorted_fused_results 
-            if item['score'] >= score_threshold
-        ][:max_final_results]
+        docs = self._documents_for(hit_lists['combined'], top_ids, time_filter_dict)
         
-        return final_paper_list, total_papers_found
+        # "Found" counts keyword matches; papers only the dense ranking added are extra candidates
+        return self._fused_papers(fused, docs, top_ids), len(keyword_ids)
     
-    def _perform_or_search(self, keywords: List[str], time_filter_dict: Optional[Dict], n_results: int) -> Tuple[List[Dict], int]:
-        """Perform OR search"""
-        es_results = self.es_manager.search_papers(keywords, time_filter=time_filter_dict, size=n_results, operator="OR")
-        
-        all_papers = []
-        for hit in es_results:
-            paper_id = hit['_id']
-            relevance_score = hit.get('_score', 0.0)
-            doc_content = {
-                'paper_id': paper_id, 
-                'metadata': hit['_source'], 
-                'content': hit['_source'].get('content', ''),
-                'relevance_score': relevance_score
-            }
-            all_papers.append(doc_content)
+    def _keyword_rankings(self, keywords: List[str], operator: str, time_filter_dict: Optional[Dict],
+                          n_results: int) -> Dict[str, List[Dict]]:
+        """
+        Hits of the combined keyword query and of one query per keyword, fetched in a
+        single _msearch round trip. Keys: 'combined' and 'keyword:<keyword>'. Only the
+        combined query returns documents; per-keyword hits, and any hits answered by the
+        query cache, carry ids and scores only (see _documents_for).
+        """
+        searches = [(keywords, operator)]
+        if len(keywords) > 1:
+            searches += [([keyword], "OR", False) for keyword in keywords]
+        hit_lists = self.es_manager.msearch_papers(searches, time_filter=time_filter_dict, size=n_results,
+                                                   source_fields=SEARCH_SOURCE_FIELDS)
+        rankings = {'combined': hit_lists[0]}
+        for keyword, hits in zip(keywords if len(keywords) > 1 else [], hit_lists[1:]):
+            rankings[f"keyword:{keyword}"] = hits
+        return rankings
+    
+    def _documents_for(self, hits: List[Dict], ids: List[str], time_filter_dict: Optional[Dict]) -> Dict[str, Dict]:
+        """
+        Paper dicts for ids: taken from hits that carry a _source, the rest fetched by id
+        in one request (through ES, so the date filter also applies to dense-only papers)
+        """
+        docs = {hit['_id']: self._hit_to_paper(hit) for hit in hits if '_source' in hit}
+        missing = [paper_id for paper_id in ids if paper_id not in docs]
+        for hit in self.es_manager.get_papers_by_ids(missing, time_filter=time_filter_dict,
+                                                     source_fields=SEARCH_SOURCE_FIELDS):
+            docs[hit['_id']] = self._hit_to_paper(hit)
+        return docs
+    
+    def _fuse_rankings(self, hit_lists: Dict[str, List[Dict]], dense_ranking: Optional[List[str]],
+                       candidates: List[str]) -> Dict:
+        """Weighted RRF over the keyword hit lists and the dense ranking (see weighted_rrf)"""
+        weights_config = (self.config.get('search') or {}).get('fusion_weights') or {}
+        rankings = {name: [hit['_id'] for hit in hits] for name, hits in hit_lists.items()}
+        weights = {name: weights_config.get('combined', 1.0) if name == 'combined' else weights_config.get('keyword', 0.5)
+                   for name in rankings}
+        if dense_ranking:
+            rankings['dense'] = dense_ranking
+            weights['dense'] = weights_config.get('dense', 1.0)
         
-        all_papers.sort(key=lambda x: x.get('relevance_score', 0.0), reverse=True)
-        return all_papers, len(all_papers)
+        return weighted_rrf(rankings, weights, candidates=candidates)
     
-    def _filter_papers_by_gcs_dates(self, papers: List[Dict], time_filter_type: str) -> List[Dict]:
+    @staticmethod
+    def _fused_papers(fused: Dict, docs: Dict[str, Dict], ids: List[str]) -> List[Dict]:
+        """
+        Papers for ids (in fused order) that have a document; each carries its fused
+        'relevance_score' and the per-list 'relevance_breakdown'
+        """
+        scores = dict(zip(fused['ids'], fused['scores']))
+        papers = []
+        for paper_id in ids:
+            if paper_id not in docs:
+                continue
+            score = scores[paper_id]
+            doc = docs[paper_id]
+            doc['relevance_score'] = score
+            doc['relevance_breakdown'] = {name: round(value, 6) for name, value in fused['contributions'][paper_id].items()}
+            papers.append(doc)
+        return papers
+    
+    @staticmethod
+    def _keyword_match_count(papers: List[Dict]) -> int:
+        """Number of papers ranked by a keyword query (not only by the dense ranking)"""
+        return sum(1 for paper in papers if set(paper.get('relevance_breakdown') or {'combined': 0}) - {'dense'})
+    
+    def _hit_to_paper(self, hit: Dict) -> Dict:
+        """
+        Convert an ES hit into a paper dict; 'content' carries the precomputed preview, or
+        None for documents indexed before content_preview existed (see _fill_missing_previews)
+        """
+        metadata = dict(hit.get('_source', {}))
+        content = metadata.pop('content_preview', None)
+        if content is None:
+            content = metadata.pop('content', None)
+        return {'paper_id': hit['_id'], 'metadata': metadata, 'content': content}
+    
+    def _fill_missing_previews(self, papers: List[Dict]):
+        """
+        Fetch the full content (truncated to the preview length) in one mget for papers whose
+        document has no content_preview yet, i.e. was not reached by backfill_content_preview
+        """
+        missing = [paper for paper in papers if paper.get('content') is None]
+        if not missing:
+            return
+        contents = self.es_manager.get_paper_contents([paper['paper_id'] for paper in missing])
+        for paper in missing:
+            paper['content'] = contents.get(paper['paper_id'], '')[:CONTENT_PREVIEW_CHARS]
+    
+    def _filter_papers_by_gcs_dates(self, papers: List[Dict], time_filter_type: str,
+                                    metadata_context: Optional[PaperMetadataContext] = None) -> List[Dict]:
         """Filter papers by GCS dates"""
         if not papers:
             return papers
         
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.config['gcs_bucket_name'])
+            if metadata_context is None:
+                metadata_context = PaperMetadataContext(self.config['gcs_bucket_name'], cache=self.metadata_cache)
+            metadata_context.resolve(papers)
             
             filtered_papers = []
             for paper in papers:
-                paper_id = paper.get('paper_id')
-                if paper_id:
-                    json_filename = paper_id.rsplit('.', 1)[0] + '.metadata.json'
-                    json_blob = bucket.blob(json_filename)
-                    
-                    if json_blob.exists():
-                        try:
-                            json_content = json_blob.download_as_string()
-                            json_metadata = json.loads(json_content)
-                            publication_date = json_metadata.get('publication_date', '')
-                            
-                            if self._matches_time_filter(publication_date, time_filter_type):
-                                filtered_papers.append(paper)
-                        except Exception:
-                            filtered_papers.append(paper)
-                    else:
-                        filtered_papers.append(paper)
-                else:
+                json_metadata = metadata_context.get(paper.get('paper_id'))
+                if json_metadata is None:
+                    # No sidecar (or no paper id): keep the paper
+                    filtered_papers.append(paper)
+                elif self._matches_time_filter(json_metadata.get('publication_date', ''), time_filter_type):
                     filtered_papers.append(paper)
             
             return filtered_papers
@@ -381,19 +1106,10 @@ Title:"""
         except Exception:
             return False
     
-    def _generate_analysis(self, papers: List[Dict], keywords: List[str], search_mode: str) -> Optional[str]:
-        """Generate analysis using AI"""
+    def _build_analysis_prompt(self, papers: List[Dict], keywords: List[str], search_mode: str) -> str:
+        """Build the analysis prompt from the paper sources"""
         context = "You are a world-class scientific analyst and expert research assistant. Your primary objective is to generate the most detailed and extensive report possible based on the following scientific paper excerpts.\n\n"
-        
-        for i, result in enumerate(papers):
-            meta = result.get('metadata', {})
-            title = meta.get('title', 'N/A')
-            link = self._get_paper_link(meta)
-            content_preview = (meta.get('abstract') or result.get('content') or '')[:4000]
-            context += f"SOURCE [{i+1}]:\n"
-            context += f"Title: {title}\n"
-            context += f"Link: {link}\n"
-            context += f"Content: {content_preview}\n---\n\n"
+        context += self._pack_paper_context(papers, self._context_budget('analysis_budget_tokens', 24000))
         
         prompt = f"""{context}
 ---
@@ -419,7 +1135,38 @@ Identify the top 3-5 most impactful papers from the sources and provide a detail
 
 **CRITICAL INSTRUCTION FOR CITATIONS:** At the end of every sentence or key finding that you derive from a source, you **MUST** include a citation marker referencing the source's number in brackets. For example: `This new method improves risk prediction [1].` Multiple sources can be cited like `This was observed in several cohorts [2][3].` **IMPORTANT:** Always separate multiple citations with individual brackets, like `[2][3][4]` NOT `[234]`. **CRUCIAL:** In the Key Paper Summaries section, do NOT add citation numbers to the paper titles - only add citations at the end of the summary paragraphs. **FORMATTING RULE:** All citations MUST be in square brackets [1], [2], [3], etc. - never use unbracketed numbers for citations. **CITATION LIMIT:** Maximum 3 citations per sentence. If more than 3 sources support a finding, choose the 3 most relevant or representative sources.
 """
-        return self.generate_ai_response(prompt)
+        return prompt
+    
+    def _context_budget(self, key: str, default: int) -> int:
+        """Token budget from the 'context' config section"""
+        return int((self.config.get('context') or {}).get(key, default))
+    
+    def _pack_paper_context(self, papers: List[Dict], budget_tokens: int) -> str:
+        """
+        Render paper sources within a token budget. Sources keep their original
+        numbering so citations still match the references list.
+        """
+        sources = []
+        for paper in papers:
+            meta = paper.get('metadata', {})
+            sources.append({
+                'title': meta.get('title', 'N/A'),
+                'link': self._get_paper_link(meta),
+                'content': meta.get('abstract') or paper.get('content') or '',
+                'score': paper.get('relevance_score')
+            })
+        packed = pack_sources(sources, budget_tokens)
+        if packed['dropped'] or packed['trimmed']:
+            print(f"Packed {len(packed['sources'])}/{len(sources)} sources into ~{packed['used_tokens']} tokens; "
+                  f"trimmed {[i + 1 for i in packed['trimmed']]}, dropped {[i + 1 for i in packed['dropped']]}")
+        
+        context = ""
+        for source in packed['sources']:
+            context += f"SOURCE [{source['index']+1}]:\n"
+            context += f"Title: {source['title']}\n"
+            context += f"Link: {source['link']}\n"
+            context += f"Content: {source['content']}\n---\n\n"
+        return context
     
     def _get_paper_link(self, metadata: Dict) -> str:
         """Get paper link from metadata"""
@@ -432,42 +1179,16 @@ Identify the top 3-5 most impactful papers from the sources and provide a detail
                 return link
         return "Not available"
     
-    def _reload_paper_metadata(self, papers: List[Dict]) -> List[Dict]:
+    def _reload_paper_metadata(self, papers: List[Dict],
+                               metadata_context: Optional[PaperMetadataContext] = None) -> List[Dict]:
         """Reload paper metadata from GCS"""
         if not papers:
             return papers
         
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.config['gcs_bucket_name'])
-            
-            updated_papers = []
-            for paper in papers:
-                paper_id = paper.get('paper_id')
-                if paper_id:
-                    json_filename = paper_id.rsplit('.', 1)[0] + '.metadata.json'
-                    json_blob = bucket.blob(json_filename)
-                    
-                    if json_blob.exists():
-                        try:
-                            json_content = json_blob.download_as_string()
-                            json_metadata = json.loads(json_content)
-                            
-                            updated_metadata = paper.get('metadata', {}).copy()
-                            updated_metadata.update(json_metadata)
-                            updated_metadata['paper_id'] = paper_id
-                            
-                            updated_paper = paper.copy()
-                            updated_paper['metadata'] = updated_metadata
-                            updated_papers.append(updated_paper)
-                        except Exception:
-                            updated_papers.append(paper)
-                    else:
-                        updated_papers.append(paper)
-                else:
-                    updated_papers.append(paper)
-            
-            return updated_papers
+            if metadata_context is None:
+                metadata_context = PaperMetadataContext(self.config['gcs_bucket_name'], cache=self.metadata_cache)
+            return metadata_context.enrich(papers)
         except Exception:
             return papers
     
@@ -0,0 +1,152 @@
+# app/backend/context_cache.py
+"""
+Model Context Cache - Reuse the static literature context across follow-up turns
+The paper sources of a conversation never change after the initial analysis,
+so they are uploaded once as cached content and each follow-up only sends the
+new turn. A conversation stores a small handle ({'name', 'expires_at'}); when
+the handle has expired (or the provider no longer knows it) the caller falls
+back to resending the full context. Cached content is billed while it lives,
+so the caller deletes a handle's content once the handle is replaced or its
+conversation goes away.
+
+Two backends share the same interface:
+- VertexContextCache: Vertex AI cached content (vertexai.preview.caching)
+- LocalContextCache: in-process fake that prepends the stored context to the
+  prompt, for local development and tests
+"""
+
+import datetime
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from google.api_core.exceptions import NotFound
+
+# Handles this close to expiry are treated as expired to avoid mid-request expiry
+EXPIRY_MARGIN_SECONDS = 60
+
+
+class ContextCacheError(Exception):
+    """The cached context cannot be used (permissions, quota, unsupported model, ...)"""
+
+
+class ContextCacheExpired(ContextCacheError):
+    """The cached context referenced by a handle no longer exists"""
+
+
+def handle_is_valid(handle: Optional[Dict[str, Any]]) -> bool:
+    """True if a stored handle exists and is not (about to be) expired"""
+    return bool(handle) and handle.get('expires_at', 0) - time.time() > EXPIRY_MARGIN_SECONDS
+
+
+class ContextCacheBackend(ABC):
+    """Interface of a cached-context provider"""
+
+    @abstractmethod
+    def create(self, system_instruction: str, context: str, ttl_seconds: int) -> Dict[str, Any]:
+        """Cache context and return a handle; raises ContextCacheError if caching is not possible"""
+
+    @abstractmethod
+    def generate_stream(self, handle: Dict[str, Any], prompt: str, generation_config: Dict[str, Any]) -> Iterator[str]:
+        """
+        Generate with the cached context prepended; raises ContextCacheExpired if it is gone
+        and ContextCacheError if it cannot be used for another reason
+        """
+
+    @abstractmethod
+    def delete(self, handle: Dict[str, Any]):
+        """Delete the cached context of a handle (no-op if it is already gone); raises ContextCacheError"""
+
+
+class VertexContextCache(ContextCacheBackend):
+    """Vertex AI cached content"""
+
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+
+    def create(self, system_instruction: str, context: str, ttl_seconds: int) -> Dict[str, Any]:
+        from vertexai.preview import caching
+
+        try:
+            cached_content = caching.CachedContent.create(
+                model_name=self.model_id,
+                system_instruction=system_instruction,
+                contents=[context],
+                ttl=datetime.timedelta(seconds=ttl_seconds)
+            )
+        except Exception as e:
+            # e.g. context below the provider's minimum cacheable size
+            raise ContextCacheError(str(e))
+        return {'name': cached_content.name, 'expires_at': time.time() + ttl_seconds}
+
+    def generate_stream(self, handle: Dict[str, Any], prompt: str, generation_config: Dict[str, Any]) -> Iterator[str]:
+        from vertexai.preview.generative_models import GenerativeModel
+
+        try:
+            model = GenerativeModel.from_cached_content(cached_content=handle['name'])
+            responses = model.generate_content([prompt], generation_config=generation_config, stream=True)
+            for chunk in responses:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue
+                if text:
+                    yield text
+        except NotFound as e:
+            raise ContextCacheExpired(str(e))
+        except Exception as e:
+            raise ContextCacheError(str(e))
+
+    def delete(self, handle: Dict[str, Any]):
+        from vertexai.preview import caching
+
+        try:
+            caching.CachedContent(cached_content_name=handle['name']).delete()
+        except NotFound:
+            pass  # expired or deleted already
+        except Exception as e:
+            raise ContextCacheError(str(e))
+
+
+class LocalContextCache(ContextCacheBackend):
+    """In-process stand-in for a provider cache; stores the context and prepends it to prompts"""
+
+    def __init__(self, generate_stream_fn: Callable[[str], Iterator[str]]):
+        self._generate_stream_fn = generate_stream_fn
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, system_instruction: str, context: str, ttl_seconds: int) -> Dict[str, Any]:
+        name = f"local/{uuid.uuid4().hex}"
+        expires_at = time.time() + ttl_seconds
+        with self._lock:
+            # Drop expired entries so the fake does not grow without bound
+            now = time.time()
+            for key in [key for key, entry in self._entries.items() if entry['expires_at'] <= now]:
+                del self._entries[key]
+            self._entries[name] = {'system_instruction': system_instruction, 'context': context, 'expires_at': expires_at}
+        return {'name': name, 'expires_at': expires_at}
+
+    def generate_stream(self, handle: Dict[str, Any], prompt: str, generation_config: Dict[str, Any]) -> Iterator[str]:
+        with self._lock:
+            entry = self._entries.get(handle.get('name'))
+        if entry is None or entry['expires_at'] <= time.time():
+            raise ContextCacheExpired(handle.get('name', ''))
+        full_prompt = f"{entry['system_instruction']}\n\n{entry['context']}\n\n{prompt}"
+        return self._generate_stream_fn(full_prompt)
+
+    def delete(self, handle: Dict[str, Any]):
+        with self._lock:
+            self._entries.pop(handle.get('name'), None)
+
+
+def build_context_cache(cache_config: Dict[str, Any], model_id: str,
+                        generate_stream_fn: Callable[[str], Iterator[str]]) -> Optional[ContextCacheBackend]:
+    """Create the configured backend ('vertex' or 'local'), or None when disabled"""
+    if not cache_config.get('enabled', False):
+        return None
+    if cache_config.get('backend', 'vertex') == 'local':
+        return LocalContextCache(generate_stream_fn)
+    return VertexContextCache(model_id)
@@ -0,0 +1,186 @@
+# app/backend/context_packer.py
+"""
+Context Packer - Token-budgeted prompt context for analyses and follow-ups
+Counts tokens locally with a fast approximate tokenizer, allocates a token
+budget across paper sources in proportion to their relevance, trims each
+source at sentence boundaries and reports what was trimmed or dropped. Chat
+history is packed newest-first into its own budget.
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+# Word pieces and single punctuation marks; long words are charged extra
+# tokens to approximate subword (SentencePiece/BPE) splitting.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_CHARS_PER_SUBWORD = 6
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Tokens used by the "SOURCE [n]: / Title: / Link: / Content:" scaffolding of one source
+SOURCE_OVERHEAD_TOKENS = 16
+# Sources that cannot get at least this many content tokens are dropped rather than shown as a stub
+MIN_SOURCE_TOKENS = 64
+
+
+def count_tokens(text: str) -> int:
+    """Approximate number of model tokens in text"""
+    if not text:
+        return 0
+    return sum(1 + (len(piece) - 1) // _CHARS_PER_SUBWORD for piece in _TOKEN_RE.findall(text))
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Trim text to at most max_tokens, cutting at a sentence boundary when possible
+
+    Falls back to a word boundary when even the first sentence does not fit.
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_END_RE.split(text):
+        cost = count_tokens(sentence)
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    if kept:
+        return " ".join(kept)
+
+    # First sentence alone is over budget: cut at a word boundary
+    words = []
+    used = 0
+    for word in text.split():
+        cost = count_tokens(word)
+        if used + cost > max_tokens:
+            break
+        words.append(word)
+        used += cost
+    return " ".join(words)
+
+
+def _allocate(weights: List[float], caps: List[int], budget: int) -> List[int]:
+    """Water-fill budget across items in proportion to weights, never exceeding each cap"""
+    allocation = [0] * len(weights)
+    active = [i for i in range(len(weights)) if caps[i] > 0]
+    remaining = budget
+    while active and remaining > 0:
+        total_weight = sum(weights[i] for i in active) or float(len(active))
+        saturated = []
+        distributed = 0
+        for i in active:
+            share = weights[i] / total_weight if total_weight else 1.0 / len(active)
+            grant = min(caps[i] - allocation[i], int(math.floor(remaining * share)))
+            allocation[i] += grant
+            distributed += grant
+            if allocation[i] >= caps[i]:
+                saturated.append(i)
+        remaining -= distributed
+        if not saturated:
+            break
+        active = [i for i in active if i not in saturated]
+    return allocation
+
+
+def pack_sources(sources: List[Dict[str, Any]], budget_tokens: int,
+                 min_source_tokens: int = MIN_SOURCE_TOKENS) -> Dict[str, Any]:
+    """
+    Fit paper sources into a token budget
+
+    Args:
+        sources: Dicts with 'title', 'link', 'content' and optional 'score' (higher is more
+            relevant); the list order is the citation order
+        budget_tokens: Total tokens available for all sources, scaffolding included
+        min_source_tokens: Minimum content tokens a kept source must receive
+
+    Returns:
+        Dict with 'sources' (kept sources in citation order, each with 'index', 'title',
+        'link', 'content', 'tokens', 'trimmed'), 'dropped' (indexes of dropped sources),
+        'trimmed' (indexes of shortened sources) and 'used_tokens'
+    """
+    if not sources:
+        return {'sources': [], 'dropped': [], 'trimmed': [], 'used_tokens': 0}
+
+    # Missing scores fall back to rank order
+    weights = []
+    for rank, source in enumerate(sources):
+        score = source.get('score')
+        weights.append(float(score) if score is not None and score > 0 else 1.0 / (rank + 1))
+
+    headers = [SOURCE_OVERHEAD_TOKENS + count_tokens(source.get('title', '')) + count_tokens(source.get('link', ''))
+               for source in sources]
+    content_tokens = [count_tokens(source.get('content', '')) for source in sources]
+
+    # Admit sources by relevance while each can still get its header plus a minimal excerpt
+    by_relevance = sorted(range(len(sources)), key=lambda i: weights[i], reverse=True)
+    floors = [min(tokens, min_source_tokens) for tokens in content_tokens]
+    kept, dropped = [], []
+    reserved = 0
+    for i in by_relevance:
+        needed = headers[i] + floors[i]
+        if reserved + needed <= budget_tokens:
+            kept.append(i)
+            reserved += needed
+        else:
+            dropped.append(i)
+
+    # Every kept source gets its reserved minimum; the rest of the budget is shared by relevance
+    extra = _allocate([weights[i] for i in kept], [content_tokens[i] - floors[i] for i in kept],
+                      budget_tokens - reserved)
+    allocation = [floors[i] + grant for i, grant in zip(kept, extra)]
+
+    packed, trimmed = [], []
+    used = 0
+    for i, tokens in sorted(zip(kept, allocation)):
+        source = sources[i]
+        content = source.get('content', '') or ''
+        if tokens < content_tokens[i]:
+            content = trim_to_tokens(content, tokens)
+            trimmed.append(i)
+        cost = count_tokens(content)
+        used += headers[i] + cost
+        packed.append({
+            'index': i,
+            'title': source.get('title', 'N/A'),
+            'link': source.get('link', 'Not available'),
+            'content': content,
+            'tokens': cost,
+            'trimmed': i in trimmed
+        })
+
+    return {'sources': packed, 'dropped': sorted(dropped), 'trimmed': trimmed, 'used_tokens': used}
+
+
+def pack_history(messages: List[Dict[str, Any]], budget_tokens: int,
+                 max_message_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Keep the most recent chat messages that fit in budget_tokens
+
+    The last message (the question being answered) is always kept, trimmed if necessary.
+    Older messages longer than max_message_tokens are trimmed before being considered.
+
+    Returns:
+        Dict with 'text' ("role: content" lines, oldest first), 'kept' and 'dropped' counts
+    """
+    lines: List[str] = []
+    used = 0
+    for position, message in enumerate(reversed(messages)):
+        content = message.get('content', '')
+        if max_message_tokens and position > 0:
+            content = trim_to_tokens(content, max_message_tokens)
+        line = f"{message.get('role', 'user')}: {content}"
+        cost = count_tokens(line)
+        if used + cost > budget_tokens:
+            if position == 0:
+                line = trim_to_tokens(line, budget_tokens)
+                lines.append(line)
+            break
+        lines.append(line)
+        used += cost
+
+    return {'text': "\n".join(reversed(lines)), 'kept': len(lines), 'dropped': len(messages) - len(lines)}
@@ -0,0 +1,133 @@
+# app/backend/embed_papers.py
+"""
+Offline Paper Embedding Job
+Encodes every indexed paper (title + abstract, or the content preview when the
+abstract is missing) with a sentence-transformers model in CPU batches and
+writes the memory-mapped vector store used by hybrid search. Vectors of papers
+already in the store are reused, so re-running after an ingest only encodes
+the new papers.
+
+Run as a job from the repository root:
+    python app/backend/embed_papers.py [--rebuild]
+Settings come from config/config.yaml and secrets from environment variables
+(see app_config.load_secrets); Streamlit secrets are not needed.
+"""
+
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.vector_store import DEFAULT_VECTOR_STORE_PATH, open_vector_store, write_vector_store
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = 64
+EMBED_SOURCE_FIELDS = ['title', 'abstract', 'content_preview']
+
+
+def load_encoder(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """Load a sentence-transformers model on CPU"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def paper_embedding_text(source: Dict[str, Any]) -> str:
+    """Text embedded for a paper"""
+    body = source.get('abstract') or source.get('content_preview') or ''
+    return f"{source.get('title', '')}. {body}".strip()
+
+
+def encode_texts(encoder, texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """L2-normalized float32 embeddings, one row per text"""
+    return encoder.encode(
+        texts, batch_size=batch_size, normalize_embeddings=True,
+        convert_to_numpy=True, show_progress_bar=False
+    ).astype(np.float32)
+
+
+def build_vector_store(es_manager, path: str = DEFAULT_VECTOR_STORE_PATH,
+                       model_name: str = DEFAULT_EMBEDDING_MODEL, batch_size: int = EMBED_BATCH_SIZE,
+                       index_name: str = "papers", rebuild: bool = False) -> Dict[str, Any]:
+    """
+    Embed all papers of an index into the vector store at path
+
+    Args:
+        es_manager: ElasticsearchManager instance
+        path: Vector store directory
+        model_name: sentence-transformers model
+        batch_size: Papers encoded per batch
+        index_name: Index to read papers from
+        rebuild: Re-encode every paper instead of reusing stored vectors
+
+    Returns:
+        Dict with total/encoded/reused counts and the elapsed seconds
+    """
+    started = time.time()
+    existing = None if rebuild else open_vector_store(path)
+    reusable = existing.vectors_by_id() if existing is not None and existing.model_name == model_name else {}
+
+    encoder = load_encoder(model_name)
+    ids: List[str] = []
+    rows: List[np.ndarray] = []
+    pending_ids: List[str] = []
+    pending_texts: List[str] = []
+    stats = {'total': 0, 'encoded': 0, 'reused': 0}
+
+    def flush():
+        if not pending_texts:
+            return
+        vectors = encode_texts(encoder, pending_texts, batch_size)
+        ids.extend(pending_ids)
+        rows.extend(vectors)
+        stats['encoded'] += len(pending_texts)
+        pending_ids.clear()
+        pending_texts.clear()
+        print(f"Encoded {stats['encoded']} papers ({stats['reused']} reused)")
+
+    for paper_id, source in es_manager.iter_papers(EMBED_SOURCE_FIELDS, index_name=index_name):
+        stats['total'] += 1
+        vector = reusable.get(paper_id)
+        if vector is not None:
+            ids.append(paper_id)
+            rows.append(np.array(vector, dtype=np.float32))
+            stats['reused'] += 1
+            continue
+        pending_ids.append(paper_id)
+        pending_texts.append(paper_embedding_text(source))
+        if len(pending_texts) >= batch_size * 16:
+            flush()
+    flush()
+
+    dimension = encoder.get_sentence_embedding_dimension()
+    matrix = np.vstack(rows) if rows else np.zeros((0, dimension), dtype=np.float32)
+    write_vector_store(path, ids, matrix, model_name)
+    stats['seconds'] = time.time() - started
+    return stats
+
+
+if __name__ == "__main__":
+    from app_config import load_job_config
+    from elasticsearch_utils import ElasticsearchManager
+
+    secrets = load_job_config()
+    embeddings_config = secrets.get('embeddings') or {}
+    manager = ElasticsearchManager(
+        cloud_id=secrets.get('elastic_cloud_id'),
+        hosts=secrets.get('elastic_hosts'),
+        username=secrets.get('elastic_username'),
+        password=secrets.get('elastic_password'),
+        api_key=secrets.get('elastic_api_key')
+    )
+    result = build_vector_store(
+        manager,
+        path=embeddings_config.get('store_path', DEFAULT_VECTOR_STORE_PATH),
+        model_name=embeddings_config.get('model', DEFAULT_EMBEDDING_MODEL),
+        batch_size=embeddings_config.get('batch_size', EMBED_BATCH_SIZE),
+        rebuild='--rebuild' in sys.argv
+    )
+    print(f"Vector store ready: {result['total']} papers ({result['encoded']} encoded, "
+          f"{result['reused']} reused) in {result['seconds']:.1f}s")
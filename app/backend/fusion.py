@@ -0,0 +1,64 @@
+# app/backend/fusion.py
+"""
+Rank Fusion - Weighted reciprocal rank fusion over several ranked lists
+Each list (the combined keyword query, one query per keyword, the dense kNN
+ranking, ...) contributes weight / (k + rank) to every paper it ranks. Scores
+are computed as one (lists x papers) matrix so fusing hundreds of candidates
+from a dozen lists stays a handful of NumPy operations, and the matrix rows
+double as the per-list contribution breakdown of each paper's score.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RRF_K = 60
+
+
+def weighted_rrf(rankings: Dict[str, List[str]], weights: Optional[Dict[str, float]] = None,
+                 k: int = RRF_K, candidates: Optional[List[str]] = None) -> Dict:
+    """
+    Fuse ranked id lists by weighted RRF
+
+    Args:
+        rankings: List name -> paper ids, best first
+        weights: List name -> weight (1.0 when missing)
+        k: RRF smoothing constant
+        candidates: Restrict the result to these ids (e.g. papers matching every
+            keyword); by default every id of every list is a candidate
+
+    Returns:
+        Dict with 'ids' (best first), 'scores' (fused score per id, same order) and
+        'contributions' (id -> {list name: contribution} for lists that ranked it)
+    """
+    weights = weights or {}
+    names = [name for name, ranking in rankings.items() if ranking]
+
+    if candidates is None:
+        candidates = list(dict.fromkeys(paper_id for name in names for paper_id in rankings[name]))
+    if not candidates:
+        return {'ids': [], 'scores': [], 'contributions': {}}
+    column = {paper_id: i for i, paper_id in enumerate(candidates)}
+
+    matrix = np.zeros((len(names), len(candidates)), dtype=np.float64)
+    for row, name in enumerate(names):
+        ranking = rankings[name]
+        ranks = np.arange(1, len(ranking) + 1, dtype=np.float64)
+        columns = np.fromiter((column.get(paper_id, -1) for paper_id in ranking), dtype=np.int64, count=len(ranking))
+        ranked = columns >= 0
+        matrix[row, columns[ranked]] = weights.get(name, 1.0) / (k + ranks[ranked])
+
+    fused = matrix.sum(axis=0)
+    # Stable sort keeps the candidates' own order for ties
+    order = np.argsort(-fused, kind="stable")
+
+    contributions = {}
+    for i in order:
+        nonzero = np.nonzero(matrix[:, i])[0]
+        contributions[candidates[i]] = {names[row]: float(matrix[row, i]) for row in nonzero}
+
+    return {
+        'ids': [candidates[i] for i in order],
+        'scores': [float(fused[i]) for i in order],
+        'contributions': contributions
+    }
@@ -0,0 +1,198 @@
+# app/backend/metadata_cache.py
+"""
+Paper Metadata Cache - Two-tier (memory LRU + SQLite) cache for sidecar metadata
+Sidecars almost never change, so a cached entry younger than the TTL is served
+without touching GCS. Older entries are revalidated with a conditional download
+against the GCS object generation: an unchanged object costs a 304 instead of
+a full download.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "paper_metadata.sqlite")
+# A full disk tier is trimmed to this fraction of disk_entries, so evictions (and
+# the row count that follows them) happen once per batch of writes, not per write
+DISK_EVICT_TO = 0.9
+
+
+class MetadataCache:
+    """
+    Bounded LRU in memory backed by a bounded SQLite table on disk
+
+    Entries are dicts with 'metadata' (sidecar dict or None when the sidecar does
+    not exist), 'generation' (GCS object generation or None) and 'fetched_at'.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, memory_entries: int = 2048,
+                 disk_entries: int = 50000, ttl_seconds: float = 86400):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'refreshed': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0
+        }
+
+        self._db = None
+        # Running row count of the disk tier; recounted only after evictions
+        self._disk_size = 0
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sidecars ("
+                "paper_id TEXT PRIMARY KEY, metadata TEXT, generation INTEGER, "
+                "fetched_at REAL, accessed_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_sidecars_accessed ON sidecars (accessed_at)")
+            self._db.commit()
+            self._disk_size = self._disk_count()
+        except sqlite3.Error as e:
+            # Degrade to a memory-only cache rather than failing searches
+            print(f"Metadata cache disk tier unavailable ({path}): {e}")
+            self._db = None
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        """True if the entry is young enough to be served without revalidation"""
+        return (time.time() - entry['fetched_at']) < self.ttl_seconds
+
+    def get(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for paper_id from memory, then disk; None on miss"""
+        with self._lock:
+            entry = self._memory.get(paper_id)
+            if entry is not None:
+                self._memory.move_to_end(paper_id)
+                self._stats['memory_hits'] += 1
+                return entry
+
+            entry = self._read_disk(paper_id)
+            if entry is not None:
+                self._stats['disk_hits'] += 1
+                self._remember(paper_id, entry)
+                return entry
+
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, paper_id: str, metadata: Optional[Dict], generation: Optional[int]):
+        """Store a freshly downloaded sidecar (metadata None caches its absence)"""
+        entry = {'metadata': metadata, 'generation': generation, 'fetched_at': time.time()}
+        with self._lock:
+            self._stats['refreshed'] += 1
+            self._remember(paper_id, entry)
+            self._write_disk(paper_id, entry)
+
+    def touch(self, paper_id: str, entry: Dict[str, Any]):
+        """Mark a stale entry as revalidated (object generation unchanged)"""
+        refreshed = dict(entry, fetched_at=time.time())
+        with self._lock:
+            self._stats['revalidated'] += 1
+            self._remember(paper_id, refreshed)
+            self._write_disk(paper_id, refreshed)
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM sidecars")
+                self._db.commit()
+            self._disk_size = 0
+
+    def close(self):
+        """Close the disk tier; the memory tier keeps serving until the cache is dropped"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes, for sizing the cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_size'] = len(self._memory)
+            stats['disk_size'] = self._disk_size
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    # Internal helpers (callers hold self._lock)
+    def _remember(self, paper_id: str, entry: Dict[str, Any]):
+        self._memory[paper_id] = entry
+        self._memory.move_to_end(paper_id)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._stats['memory_evictions'] += 1
+
+    def _read_disk(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT metadata, generation, fetched_at FROM sidecars WHERE paper_id = ?", (paper_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE sidecars SET accessed_at = ? WHERE paper_id = ?", (time.time(), paper_id))
+            self._db.commit()
+            metadata = json.loads(row[0]) if row[0] is not None else None
+            return {'metadata': metadata, 'generation': row[1], 'fetched_at': row[2]}
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Metadata cache read failed for {paper_id}: {e}")
+            return None
+
+    def _write_disk(self, paper_id: str, entry: Dict[str, Any]):
+        if self._db is None:
+            return
+        try:
+            payload = json.dumps(entry['metadata'], separators=(',', ':')) if entry['metadata'] is not None else None
+            values = (payload, entry['generation'], entry['fetched_at'], time.time(), paper_id)
+            # Update first (a primary key lookup), so the running count only grows on inserts
+            updated = self._db.execute(
+                "UPDATE sidecars SET metadata = ?, generation = ?, fetched_at = ?, accessed_at = ? WHERE paper_id = ?",
+                values
+            ).rowcount
+            if not updated:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sidecars (metadata, generation, fetched_at, accessed_at, paper_id) "
+                    "VALUES (?, ?, ?, ?, ?)", values
+                )
+                self._disk_size += 1
+            if self._disk_size > self.disk_entries:
+                # Recount first: other processes may share the file
+                overflow = self._disk_count() - int(self.disk_entries * DISK_EVICT_TO)
+                if overflow > 0:
+                    self._db.execute(
+                        "DELETE FROM sidecars WHERE paper_id IN "
+                        "(SELECT paper_id FROM sidecars ORDER BY accessed_at ASC LIMIT ?)", (overflow,)
+                    )
+                    self._stats['disk_evictions'] += overflow
+                self._disk_size = self._disk_count()
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Metadata cache write failed for {paper_id}: {e}")
+
+    def _disk_count(self) -> int:
+        if self._db is None:
+            return 0
+        try:
+            return self._db.execute("SELECT COUNT(*) FROM sidecars").fetchone()[0]
+        except sqlite3.Error:
+            return 0
@@ -0,0 +1,130 @@
+# app/backend/metadata_sync.py
+"""
+Sidecar -> Elasticsearch Metadata Sync
+Merges every paper's .metadata.json sidecar into its Elasticsearch document so
+the search path can trust ES for publication dates and links (see the
+'search.trust_es_metadata' config flag) and skip GCS entirely.
+
+Run as a job from the repository root:
+    python app/backend/metadata_sync.py
+Settings come from config/config.yaml and secrets from environment variables
+(see app_config.load_secrets); Streamlit secrets are not needed.
+The job also backfills 'content_preview' for documents indexed before it existed.
+"""
+
+import datetime
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dateutil import parser as date_parser
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gcs_client import get_bucket
+from backend.paper_metadata import load_sidecars
+from backend.metadata_cache import MetadataCache
+
+SYNC_BATCH_SIZE = 500
+
+
+def normalize_publication_date(value: Any) -> Optional[str]:
+    """Return value as yyyy-MM-dd (the format declared in the ES mapping), or None if unparsable"""
+    if not value:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.datetime.utcfromtimestamp(value / 1000).strftime("%Y-%m-%d")
+    try:
+        return date_parser.parse(str(value)).strftime("%Y-%m-%d")
+    except (ValueError, OverflowError):
+        return None
+
+
+def sidecar_to_es_fields(sidecar: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate a sidecar into the partial document merged into ES"""
+    fields = dict(sidecar)
+    fields.pop('paper_id', None)
+    fields.pop('content', None)
+
+    publication_date = normalize_publication_date(sidecar.get('publication_date'))
+    if publication_date:
+        fields['publication_date'] = publication_date
+    else:
+        # An unparsable date would be rejected by the date mapping
+        fields.pop('publication_date', None)
+
+    fields['metadata_synced_at'] = int(time.time() * 1000)
+    return fields
+
+
+def _batched(iterator: Iterator[str], size: int) -> Iterator[List[str]]:
+    batch = []
+    for item in iterator:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sync_sidecars_to_es(es_manager, bucket_name: str, index_name: str = "papers",
+                        batch_size: int = SYNC_BATCH_SIZE, cache: Optional[MetadataCache] = None) -> Dict[str, Any]:
+    """
+    Merge the sidecar of every indexed paper into its ES document
+
+    Args:
+        es_manager: ElasticsearchManager instance
+        bucket_name: GCS bucket holding the papers and their sidecars
+        index_name: Index to update
+        batch_size: Number of papers whose sidecars are fetched and written per batch
+        cache: Optional MetadataCache used for the sidecar reads
+
+    Returns:
+        Dict with scanned/updated/missing counts and the per-document failures
+    """
+    bucket = get_bucket(bucket_name)
+    stats = {'scanned': 0, 'updated': 0, 'missing_sidecar': 0, 'failed': []}
+
+    for paper_ids in _batched(es_manager.iter_paper_ids(index_name), batch_size):
+        stats['scanned'] += len(paper_ids)
+        sidecars = load_sidecars(bucket, paper_ids, cache=cache)
+
+        updates: List[Tuple[str, Dict[str, Any]]] = []
+        for paper_id in paper_ids:
+            sidecar = sidecars.get(paper_id)
+            if sidecar is None:
+                stats['missing_sidecar'] += 1
+                continue
+            updates.append((paper_id, sidecar_to_es_fields(sidecar)))
+
+        if updates:
+            result = es_manager.update_papers_metadata(updates, index_name=index_name, chunk_size=batch_size)
+            stats['updated'] += result['updated']
+            stats['failed'].extend(result['failed'])
+
+        print(f"Synced {stats['updated']}/{stats['scanned']} papers "
+              f"({stats['missing_sidecar']} without sidecar, {len(stats['failed'])} failed)")
+
+    return stats
+
+
+if __name__ == "__main__":
+    from app_config import load_job_config
+    from elasticsearch_utils import ElasticsearchManager
+
+    secrets = load_job_config()
+    manager = ElasticsearchManager(
+        cloud_id=secrets.get('elastic_cloud_id'),
+        hosts=secrets.get('elastic_hosts'),
+        username=secrets.get('elastic_username'),
+        password=secrets.get('elastic_password'),
+        api_key=secrets.get('elastic_api_key')
+    )
+    result = sync_sidecars_to_es(manager, secrets['gcs_bucket_name'])
+    for failure in result['failed']:
+        print(f"Failed to sync {failure['paper_id']}: {failure['error']}")
+
+    backfill = manager.backfill_content_preview()
+    print(f"Backfilled content_preview on {backfill['updated']} papers")
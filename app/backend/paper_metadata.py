@@ -0,0 +1,158 @@
+# app/backend/paper_metadata.py
+"""
+Paper Metadata Sidecars - Bulk loading of <paper>.metadata.json files from GCS
+Each paper PDF in the bucket has a JSON sidecar next to it with the fresh
+publication date and link fields. Sidecars are fetched concurrently with a
+single request per blob; a missing sidecar is reported as None. When a
+MetadataCache is supplied it is consulted first.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from google.api_core.exceptions import NotFound, NotModified
+
+from gcs_client import get_bucket
+from backend.metadata_cache import MetadataCache
+
+# Kept below gcs_client.GCS_POOL_MAXSIZE so workers never wait on a connection
+SIDECAR_MAX_WORKERS = 16
+
+
+def sidecar_blob_name(paper_id: str) -> str:
+    """Return the sidecar blob name for a paper PDF blob name"""
+    return paper_id.rsplit('.', 1)[0] + '.metadata.json'
+
+
+def _download_sidecar(bucket, paper_id: str, if_generation_not_match: Optional[int] = None) -> Tuple[Optional[Dict], Optional[int]]:
+    """
+    Download one sidecar and return (metadata, generation); (None, None) if it does not exist
+
+    Raises NotModified when if_generation_not_match is given and the object is
+    unchanged; other transport errors propagate to the caller.
+    """
+    blob = bucket.blob(sidecar_blob_name(paper_id))
+    try:
+        content = blob.download_as_bytes(if_generation_not_match=if_generation_not_match)
+    except NotFound:
+        return None, None
+
+    try:
+        metadata = json.loads(content)
+    except ValueError as e:
+        print(f"Invalid metadata sidecar for {paper_id}: {e}")
+        return None, blob.generation
+    return (metadata if isinstance(metadata, dict) else None), blob.generation
+
+
+def _fetch_sidecar(bucket, paper_id: str) -> Optional[Dict]:
+    """Download and parse one sidecar; None if it does not exist or is unreadable"""
+    try:
+        metadata, _ = _download_sidecar(bucket, paper_id)
+        return metadata
+    except Exception as e:
+        print(f"Failed to load metadata sidecar for {paper_id}: {e}")
+        return None
+
+
+def _fetch_sidecar_cached(bucket, paper_id: str, cache: MetadataCache) -> Optional[Dict]:
+    """Serve a sidecar from the cache, revalidating stale entries against the object generation"""
+    entry = cache.get(paper_id)
+    if entry is not None and cache.is_fresh(entry):
+        return entry['metadata']
+
+    generation = entry['generation'] if entry is not None else None
+    try:
+        metadata, new_generation = _download_sidecar(bucket, paper_id, if_generation_not_match=generation)
+    except NotModified:
+        cache.touch(paper_id, entry)
+        return entry['metadata']
+    except Exception as e:
+        # Transient failure: keep serving the last known sidecar, if any
+        print(f"Failed to load metadata sidecar for {paper_id}: {e}")
+        return entry['metadata'] if entry is not None else None
+
+    cache.put(paper_id, metadata, new_generation)
+    return metadata
+
+
+def load_sidecars(bucket, paper_ids: Iterable[str], max_workers: int = SIDECAR_MAX_WORKERS,
+                  cache: Optional[MetadataCache] = None) -> Dict[str, Optional[Dict]]:
+    """
+    Fetch the metadata sidecars of many papers concurrently
+
+    Args:
+        bucket: GCS bucket handle holding the papers
+        paper_ids: Paper blob names (duplicates and empty ids are ignored)
+        max_workers: Upper bound on concurrent GCS requests
+        cache: Optional MetadataCache consulted before GCS
+
+    Returns:
+        Dict mapping each paper_id to its sidecar dict, or None when missing
+    """
+    unique_ids: List[str] = list(dict.fromkeys(pid for pid in paper_ids if pid))
+    if not unique_ids:
+        return {}
+
+    if cache is not None:
+        fetch = lambda pid: _fetch_sidecar_cached(bucket, pid, cache)
+    else:
+        fetch = lambda pid: _fetch_sidecar(bucket, pid)
+
+    workers = max(1, min(max_workers, len(unique_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(fetch, unique_ids)
+        return dict(zip(unique_ids, results))
+
+
+class PaperMetadataContext:
+    """
+    Per-request view of paper sidecars
+    Every stage of a search (date filter, prompt builder, reference renderer)
+    reads sidecars through the same context, so each sidecar is fetched at most
+    once per request regardless of how many stages ask for it.
+    """
+
+    def __init__(self, bucket_name: str, cache: Optional[MetadataCache] = None):
+        self.bucket_name = bucket_name
+        self.cache = cache
+        self._sidecars: Dict[str, Optional[Dict]] = {}
+        self.fetched_count = 0
+
+    def resolve(self, papers: List[Dict]):
+        """Fetch, in one concurrent batch, the sidecars not yet known for papers"""
+        missing = [paper.get('paper_id') for paper in papers
+                   if paper.get('paper_id') and paper.get('paper_id') not in self._sidecars]
+        if not missing:
+            return
+        sidecars = load_sidecars(get_bucket(self.bucket_name), missing, cache=self.cache)
+        self.fetched_count += len(sidecars)
+        self._sidecars.update(sidecars)
+
+    def get(self, paper_id: Optional[str]) -> Optional[Dict]:
+        """Return the resolved sidecar for paper_id (None if missing or not resolved)"""
+        if not paper_id:
+            return None
+        return self._sidecars.get(paper_id)
+
+    def enrich(self, papers: List[Dict]) -> List[Dict]:
+        """Return copies of papers whose metadata is overlaid with their sidecar"""
+        self.resolve(papers)
+
+        updated_papers = []
+        for paper in papers:
+            paper_id = paper.get('paper_id')
+            json_metadata = self.get(paper_id)
+            if json_metadata is None:
+                updated_papers.append(paper)
+                continue
+
+            updated_metadata = paper.get('metadata', {}).copy()
+            updated_metadata.update(json_metadata)
+            updated_metadata['paper_id'] = paper_id
+
+            updated_paper = paper.copy()
+            updated_paper['metadata'] = updated_metadata
+            updated_papers.append(updated_paper)
+        return updated_papers
@@ -0,0 +1,165 @@
+# app/backend/passages.py
+"""
+Passage Retrieval - Question-specific context for follow-ups
+Splits the full text of a conversation's papers into overlapping passages and
+ranks them against a follow-up question with an in-memory BM25 index, so a
+follow-up prompt carries the few passages that answer the question (including
+ones deep inside a paper) instead of every paper's first few thousand characters.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from backend.context_packer import count_tokens
+
+_TERM_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Terms too common in questions and papers to carry any signal
+STOPWORDS = frozenset("""
+a about above after all also an and any are as at be been being between both but by can could did do does
+doing during each few for from further had has have having how if in into is it its itself more most no nor
+not of on once only or other our out over own same should so some such than that the their them then there
+these they this those through to too under until up very was we were what when where which while who whom
+why will with would you your paper papers study studies
+""".split())
+
+PASSAGE_TOKENS = 200
+PASSAGE_OVERLAP_TOKENS = 40
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased index terms of text without stopwords"""
+    return [term for term in _TERM_RE.findall((text or '').lower()) if term not in STOPWORDS]
+
+
+def _split_long_sentence(sentence: str, max_tokens: int) -> List[str]:
+    """
+    Cut a sentence longer than max_tokens into word-bounded pieces of at most max_tokens
+    (a single word over the limit, such as an unbroken sequence string, is cut by characters)
+    """
+    pieces, words, used = [], [], 0
+    tokens = []
+    for word in sentence.split():
+        cost = count_tokens(word)
+        if cost > max_tokens:
+            step = max(1, len(word) * max_tokens // cost)
+            tokens.extend(word[start:start + step] for start in range(0, len(word), step))
+        else:
+            tokens.append(word)
+    for word in tokens:
+        cost = count_tokens(word)
+        if words and used + cost > max_tokens:
+            pieces.append(" ".join(words))
+            words, used = [], 0
+        words.append(word)
+        used += cost
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def split_passages(text: str, passage_tokens: int = PASSAGE_TOKENS,
+                   overlap_tokens: int = PASSAGE_OVERLAP_TOKENS) -> List[str]:
+    """
+    Split text into passages of about passage_tokens, cut at sentence boundaries
+
+    Consecutive passages share up to overlap_tokens of trailing sentences so an
+    answer spanning a boundary is still found in one passage. Sentences longer than
+    a passage (e.g. text without punctuation) are cut at word boundaries.
+    """
+    sentences = []
+    for sentence in _SENTENCE_END_RE.split(text or ''):
+        if not sentence.strip():
+            continue
+        if count_tokens(sentence) > passage_tokens:
+            sentences.extend(_split_long_sentence(sentence, passage_tokens))
+        else:
+            sentences.append(sentence)
+    passages = []
+    current: List[Tuple[str, int]] = []
+    used = 0
+    for sentence in sentences:
+        cost = count_tokens(sentence)
+        if current and used + cost > passage_tokens:
+            passages.append(" ".join(s for s, _ in current))
+            # Carry the tail of the previous passage over as overlap (leaving room for this sentence)
+            carried, carried_tokens = [], 0
+            for s, c in reversed(current):
+                if carried_tokens + c > min(overlap_tokens, passage_tokens - cost):
+                    break
+                carried.insert(0, (s, c))
+                carried_tokens += c
+            current, used = carried, carried_tokens
+        current.append((sentence, cost))
+        used += cost
+    if current:
+        passages.append(" ".join(s for s, _ in current))
+    return passages
+
+
+class PassageIndex:
+    """BM25 index over the passages of a fixed set of papers"""
+
+    def __init__(self, documents: List[str], passage_tokens: int = PASSAGE_TOKENS,
+                 overlap_tokens: int = PASSAGE_OVERLAP_TOKENS, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            documents: Full text per paper; the position of a document is its source index
+            passage_tokens: Target passage size in tokens
+            overlap_tokens: Tokens shared by consecutive passages
+        """
+        self.k1 = k1
+        self.b = b
+        self.passages: List[Tuple[int, str]] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+
+        for source_index, text in enumerate(documents):
+            for passage in split_passages(text, passage_tokens, overlap_tokens):
+                passage_id = len(self.passages)
+                terms = tokenize(passage)
+                self.passages.append((source_index, passage))
+                self._lengths.append(len(terms))
+                for term, frequency in Counter(terms).items():
+                    self._postings[term].append((passage_id, frequency))
+
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def search(self, query: str, top_k: int = 12, max_per_source: int = 3) -> List[Dict]:
+        """
+        Return the top_k passages for query as dicts with 'source_index', 'text' and 'score'
+
+        At most max_per_source passages are taken from one paper so a single long
+        paper can't crowd out the others.
+        """
+        if not self.passages:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        passage_count = len(self.passages)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (passage_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for passage_id, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[passage_id] / (self._average_length or 1.0))
+                scores[passage_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        results = []
+        per_source: Counter = Counter()
+        for passage_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            source_index, text = self.passages[passage_id]
+            if per_source[source_index] >= max_per_source:
+                continue
+            per_source[source_index] += 1
+            results.append({'source_index': source_index, 'text': text, 'score': score})
+            if len(results) >= top_k:
+                break
+        return results
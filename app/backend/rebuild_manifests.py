@@ -0,0 +1,41 @@
+# app/backend/rebuild_manifests.py
+"""
+Conversation Manifest Rebuild
+Recreates each user's conversation manifest (user-data/users/<name>/manifest.json)
+from their stored conversations. Login reads only the manifest, so run this
+for existing users after the manifest was introduced, or to repair a manifest
+that drifted (e.g. after conversations were edited directly in the bucket).
+
+Run as a job from the repository root:
+    python app/backend/rebuild_manifests.py [username ...]
+Without usernames, every user in the bucket is rebuilt. The storage backend
+(GCS, local disk) is taken from the 'storage' section of config.yaml and the
+bucket from the GCS_BUCKET_NAME environment variable; Streamlit secrets are not needed.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gcs_user_storage import GCSUserStorage
+from storage_backend import build_storage_backend
+
+
+def rebuild_manifests(storage: GCSUserStorage, usernames=None) -> dict:
+    """Rebuild the manifests of the given users (all users when None); returns entries per user"""
+    results = {}
+    for username in usernames or storage.list_users():
+        try:
+            results[username] = storage.rebuild_manifest(username)
+            print(f"Rebuilt manifest for {username}: {results[username]} conversations")
+        except Exception as e:
+            print(f"Failed to rebuild manifest for {username}: {e}")
+    return results
+
+
+if __name__ == "__main__":
+    from app_config import load_job_config
+
+    config = load_job_config(require_elasticsearch=False)
+    storage = GCSUserStorage(config.get('gcs_bucket_name'), backend=build_storage_backend(config))
+    rebuild_manifests(storage, sys.argv[1:] or None)
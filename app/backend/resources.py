@@ -0,0 +1,118 @@
+# app/backend/resources.py
+"""
+Process-wide Resource Registry - Builds expensive clients once per process
+Streamlit re-executes the script on every interaction, so anything built inside
+main() is rebuilt on every click. Resources registered here survive reruns and
+are shared by all sessions of the process; they are rebuilt only when the
+configuration they were built from changes or when explicitly invalidated.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+def config_hash(config: Any) -> str:
+    """Stable hash of a (JSON-like) configuration value"""
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def close_resource(resource: Any):
+    """Release a resource through its close() or shutdown() hook, if it has one"""
+    close = getattr(resource, 'close', None) or getattr(resource, 'shutdown', None)
+    if not callable(close):
+        return
+    try:
+        close()
+    except Exception as e:
+        print(f"Failed to close {type(resource).__name__}: {e}")
+
+
+class ResourceRegistry:
+    """
+    Thread-safe registry of named resources keyed by configuration hash
+    Builders run outside the registry lock, under a per-name lock, so building one
+    resource never blocks lookups of the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # Per-name build locks; reentrant so a builder may look up its own name
+        self._build_locks: Dict[str, threading.RLock] = {}
+
+    def get_or_build(self, name: str, config: Any, builder: Callable[[], Any]) -> Any:
+        """
+        Return the resource registered under name, building it if missing
+
+        Args:
+            name: Registry key (e.g. 'api', 'vertex_model')
+            config: Configuration the resource depends on; a different hash triggers a rebuild
+            builder: Zero-argument callable that constructs the resource
+
+        Returns:
+            The cached or freshly built resource
+        """
+        digest = config_hash(config)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry['config_hash'] == digest:
+                return entry['resource']
+            build_lock = self._build_locks.setdefault(name, threading.RLock())
+
+        with build_lock:
+            # Another session may have built it while this one waited
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry['config_hash'] == digest:
+                    return entry['resource']
+
+            if entry is not None:
+                print(f"Configuration changed for resource '{name}', rebuilding")
+
+            start = time.perf_counter()
+            resource = builder()
+            build_seconds = time.perf_counter() - start
+
+            with self._lock:
+                replaced = self._entries.get(name)
+                self._entries[name] = {
+                    'resource': resource,
+                    'config_hash': digest,
+                    'built_at': time.time(),
+                    'build_seconds': build_seconds
+                }
+            print(f"Built resource '{name}' in {build_seconds * 1000:.0f} ms")
+
+        if replaced is not None and replaced['resource'] is not resource:
+            close_resource(replaced['resource'])
+        return resource
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drop (and close) one resource, or all of them, so the next access rebuilds it"""
+        with self._lock:
+            if name is None:
+                dropped = list(self._entries.values())
+                self._entries.clear()
+            else:
+                dropped = [self._entries.pop(name)] if name in self._entries else []
+        for entry in dropped:
+            close_resource(entry['resource'])
+
+    def build_times(self) -> Dict[str, Dict[str, float]]:
+        """Return build timestamp and duration for every registered resource"""
+        with self._lock:
+            return {
+                name: {
+                    'built_at': entry['built_at'],
+                    'build_seconds': entry['build_seconds']
+                }
+                for name, entry in self._entries.items()
+            }
+
+
+# Single registry shared by the whole process
+resource_registry = ResourceRegistry()
@@ -0,0 +1,58 @@
+# app/backend/titling.py
+"""
+Conversation Titles - Local extractive titler
+Builds a conversation title from the selected keywords and the disease most
+often mentioned in the top retrieved papers, without any model call. Also used
+as the fallback when an LLM-generated title is too generic.
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional
+
+GENERIC_TITLES = ["Research Analysis", "Analysis", "Research"]
+
+# (label, lowercase terms) checked in order against paper titles / analysis text
+DISEASE_TERMS = [
+    ('Lung Cancer', ['lung cancer', 'nsclc']),
+    ('Breast Cancer', ['breast cancer']),
+    ('CAD', ['coronary', 'cad']),
+    ('Diabetes', ['diabetes']),
+    ("Alzheimer's", ['alzheimer']),
+]
+
+
+def is_generic_title(title: Optional[str]) -> bool:
+    """True if a title is missing or too generic to tell analyses apart"""
+    return not title or title in GENERIC_TITLES or len(title.split()) < 3
+
+
+def detect_disease(text: str) -> Optional[str]:
+    """Return the first known disease mentioned in text, if any"""
+    text_lower = (text or '').lower()
+    for label, terms in DISEASE_TERMS:
+        if any(term in text_lower for term in terms):
+            return label
+    return None
+
+
+def extractive_title(keywords: List[str], papers: List[Dict]) -> str:
+    """
+    Build a title such as "PRS, GWAS, Risk: Diabetes Analysis"
+
+    Args:
+        keywords: Keywords selected for the analysis (the first three are used)
+        papers: Retrieved papers; the titles of the top three are scanned for diseases
+    """
+    keyword_str = ", ".join(keywords[:3])
+
+    diseases = []
+    for paper in papers[:3]:
+        disease = detect_disease(paper.get('metadata', {}).get('title', ''))
+        if disease:
+            diseases.append(disease)
+
+    if diseases:
+        # Use most common disease
+        main_disease = Counter(diseases).most_common(1)[0][0]
+        return f"{keyword_str}: {main_disease} Analysis"
+    return f"{keyword_str} Analysis"
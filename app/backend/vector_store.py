@@ -0,0 +1,142 @@
+# app/backend/vector_store.py
+"""
+Paper Vector Store - Memory-mapped dense embeddings for hybrid search
+Stores one L2-normalized embedding per paper in a float32 NumPy matrix that is
+memory-mapped at query time, so a process opens a 100k-paper store instantly
+and the OS page cache shares it between processes. A kNN query is a single
+matrix-vector product plus a partial sort.
+
+Layout of a store directory:
+    CURRENT         - name of the live build, switched atomically after a build
+    builds/<name>/  - one directory per build:
+        embeddings.npy  - float32 matrix, one row per paper
+        ids.json        - paper ids in row order
+        manifest.json   - embedding model name, dimension, count, hash of the ids, build time
+
+A reader resolves CURRENT once and opens all three files of that build, so it
+never pairs the vectors of one build with the ids of another. Long-lived readers
+compare current_build() with their build_path to pick up a new build. Stores written
+before builds were versioned (the three files directly in the store directory)
+are still readable.
+
+Built offline by backend/embed_papers.py.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_VECTOR_STORE_PATH = os.path.join(".cache", "paper_vectors")
+# Builds kept on disk: the live one and its predecessor, which readers that resolved
+# CURRENT just before the switch may still be opening
+KEEP_BUILDS = 2
+
+
+def _ids_hash(ids: List[str]) -> str:
+    return hashlib.sha256(json.dumps(ids, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def current_build(path: str) -> Optional[str]:
+    """Name of the live build of a store (None for unversioned or missing stores); one small file read"""
+    try:
+        with open(os.path.join(path, "CURRENT"), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _current_build_path(path: str) -> str:
+    """Directory of the live build (the store directory itself for unversioned stores)"""
+    build = current_build(path)
+    if build is None:
+        return path
+    return os.path.join(path, "builds", build)
+
+
+class VectorStore:
+    """Read-only view of a store directory"""
+
+    def __init__(self, path: str = DEFAULT_VECTOR_STORE_PATH):
+        self.path = path
+        self.build_path = _current_build_path(path)
+        with open(os.path.join(self.build_path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest: Dict[str, Any] = json.load(f)
+        with open(os.path.join(self.build_path, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids: List[str] = json.load(f)
+        self.matrix = np.load(os.path.join(self.build_path, "embeddings.npy"), mmap_mode="r")
+        if self.matrix.shape[0] != len(self.ids) or self.manifest.get("count", len(self.ids)) != len(self.ids):
+            raise ValueError(f"Vector store {self.build_path} is inconsistent: {self.matrix.shape[0]} vectors "
+                             f"for {len(self.ids)} ids, manifest count {self.manifest.get('count')}")
+        if "ids_sha256" in self.manifest and self.manifest["ids_sha256"] != _ids_hash(self.ids):
+            raise ValueError(f"Vector store {self.build_path} is inconsistent: ids do not match the manifest")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def model_name(self) -> str:
+        return self.manifest.get("model", "")
+
+    def search(self, query_vector: np.ndarray, top_k: int = 100) -> List[Tuple[str, float]]:
+        """Return the top_k (paper_id, cosine similarity) pairs for a normalized query vector"""
+        if not self.ids or top_k <= 0:
+            return []
+        scores = self.matrix @ np.asarray(query_vector, dtype=np.float32)
+        top_k = min(top_k, scores.shape[0])
+        # argpartition is O(n); only the k winners are sorted
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ordered = candidates[np.argsort(-scores[candidates])]
+        return [(self.ids[i], float(scores[i])) for i in ordered]
+
+    def vectors_by_id(self) -> Dict[str, np.ndarray]:
+        """Map of paper id -> stored vector (used to reuse embeddings on rebuild)"""
+        return {paper_id: self.matrix[row] for row, paper_id in enumerate(self.ids)}
+
+
+def open_vector_store(path: str = DEFAULT_VECTOR_STORE_PATH) -> Optional[VectorStore]:
+    """Open a store, or return None if it has not been built yet"""
+    try:
+        return VectorStore(path)
+    except FileNotFoundError:
+        print(f"No vector store at {path}; hybrid search uses keyword results only")
+        return None
+    except (ValueError, OSError) as e:
+        print(f"Vector store at {path} unusable: {e}")
+        return None
+
+
+def write_vector_store(path: str, ids: List[str], matrix: np.ndarray, model_name: str):
+    """Write a store as a new build and switch CURRENT to it in one atomic rename"""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    manifest = {
+        "model": model_name,
+        "dimension": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "count": len(ids),
+        "ids_sha256": _ids_hash(ids),
+        "built_at": time.time()
+    }
+
+    builds_path = os.path.join(path, "builds")
+    build = f"{time.time_ns()}-{os.getpid()}"
+    build_path = os.path.join(builds_path, build)
+    os.makedirs(build_path)
+    np.save(os.path.join(build_path, "embeddings.npy"), matrix)
+    with open(os.path.join(build_path, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    with open(os.path.join(build_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    pointer_tmp = os.path.join(path, f"CURRENT.{os.getpid()}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(build)
+    os.replace(pointer_tmp, os.path.join(path, "CURRENT"))
+
+    # Build names sort by creation time; open memory maps of removed builds stay valid
+    for old_build in sorted(os.listdir(builds_path))[:-KEEP_BUILDS]:
+        if old_build != build:
+            shutil.rmtree(os.path.join(builds_path, old_build), ignore_errors=True)
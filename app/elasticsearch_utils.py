@@ -1,17 +1,38 @@
 # app/elasticsearch_utils.py
 # suitable for Elasticsearch 8.0.0 and main.py v2
 
+import json
+import threading
+import time
+from collections import OrderedDict
 import streamlit as st
-from elasticsearch import Elasticsearch
-from typing import List, Dict, Any
+from elasticsearch import Elasticsearch, helpers
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Optional, Union
+
+# Number of leading characters of 'content' precomputed into 'content_preview'
+# at index time; searches return the preview instead of the full text.
+CONTENT_PREVIEW_CHARS = 4000
 
 class ElasticsearchManager:
     """
     Manages all interactions with the Elasticsearch cluster, including
     indexing documents and performing searches.
     Supports both Serverless (hosts + api_key) and Hosted (cloud_id + username/password) deployments.
+    Raises ConnectionError when the cluster cannot be reached.
     """
-    def __init__(self, cloud_id: str = None, hosts: list = None, username: str = None, password: str = None, api_key: str = None):
+    def __init__(self, cloud_id: str = None, hosts: list = None, username: str = None, password: str = None, api_key: str = None,
+                 query_cache_ttl: float = 300, query_cache_size: int = 256):
+        self._index_versions = {}
+
+        # In-process query result cache of hit ids and scores; entries are valid for
+        # query_cache_ttl seconds and only while no write has gone through this manager
+        # since they were stored
+        self.query_cache_ttl = query_cache_ttl
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._write_generation = 0
+        self._query_cache_stats = {'hits': 0, 'misses': 0, 'expired': 0, 'invalidated': 0, 'evictions': 0}
         try:
             # Support both Serverless (hosts + api_key) and Hosted (cloud_id + username/password)
             if hosts and api_key:
@@ -38,10 +59,11 @@ class ElasticsearchManager:
             print("✓ Successfully connected to Elasticsearch")
             self.create_index_if_not_exists("papers")
         except Exception as e:
+            # Raised rather than st.stop() so offline jobs abort too; the app reports it
+            # when initialising (see main.main)
             error_msg = f"Could not connect to Elasticsearch: {e}"
             print(f"✗ {error_msg}")
-            st.error(error_msg)
-            st.stop()
+            raise ConnectionError(error_msg) from e
 
     def create_index_if_not_exists(self, index_name: str):
         if not self.es_client.indices.exists(index=index_name):
@@ -50,6 +72,7 @@ class ElasticsearchManager:
                     "title": {"type": "text", "analyzer": "english"},
                     "abstract": {"type": "text", "analyzer": "english"},
                     "content": {"type": "text", "analyzer": "english"},
+                    "content_preview": {"type": "text", "index": False},
                     "publication_date": {"type": "date", "format": "yyyy-MM-dd||dd MMM yyyy||epoch_millis"},
                     "url": {"type": "keyword"},
                     "doi_url": {"type": "keyword"},
@@ -61,6 +84,45 @@ class ElasticsearchManager:
                 print(f"Index '{index_name}' created successfully.")
             except Exception as e:
                 st.error(f"Failed to create index '{index_name}': {e}")
+        else:
+            # Additive mapping update for indices created before content_preview existed
+            try:
+                self.es_client.indices.put_mapping(
+                    index=index_name,
+                    properties={"content_preview": {"type": "text", "index": False}}
+                )
+            except Exception as e:
+                print(f"Could not update mapping of index '{index_name}': {e}")
+
+    @staticmethod
+    def build_document(metadata: Dict[str, Any], content: str) -> Dict[str, Any]:
+        """
+        Builds the indexed document: metadata plus full content and its precomputed preview.
+        """
+        document = metadata.copy()
+        document['content'] = content
+        document['content_preview'] = (content or '')[:CONTENT_PREVIEW_CHARS]
+        return document
+
+    def backfill_content_preview(self, index_name: str = "papers") -> Dict[str, Any]:
+        """
+        Computes 'content_preview' server-side for documents indexed without it.
+        """
+        response = self.es_client.update_by_query(
+            index=index_name,
+            query={"bool": {"must_not": {"exists": {"field": "content_preview"}}}},
+            script={
+                "lang": "painless",
+                "source": "String c = ctx._source.content; "
+                          "if (c == null) { ctx._source.content_preview = ''; } "
+                          "else { ctx._source.content_preview = c.substring(0, (int) Math.min(params.n, c.length())); }",
+                "params": {"n": CONTENT_PREVIEW_CHARS}
+            },
+            conflicts="proceed",
+            wait_for_completion=True
+        )
+        self.bump_write_generation()
+        return {'updated': response.get('updated', 0), 'failures': response.get('failures', [])}
 
     # THIS IS THE CRITICAL FIX. THIS FUNCTION IS CORRECT.
     def index_paper(self, paper_id: str, metadata: Dict[str, Any], content: str, index_name: str = "papers"):
@@ -69,18 +131,224 @@ class ElasticsearchManager:
         """
         try:
             # Create a single document for indexing by starting with the metadata
-            # and adding the full text content.
-            document = metadata.copy()
-            document['content'] = content
+            # and adding the full text content and its preview.
+            document = self.build_document(metadata, content)
             
             # Complete document indexing, ensuring the 'link' key is saved.
             self.es_client.index(index=index_name, id=paper_id, document=document)
+            self.bump_write_generation()
         except Exception as e:
             st.error(f"Failed to index paper {paper_id}: {e}")
 
-    def search_papers(self, keywords: List[str], time_filter: Dict = None, size: int = 10, operator: str = "AND") -> List[Dict[str, Any]]:
-        if not keywords:
+    def get_index_version(self, index_name: str = "papers", max_age_seconds: float = 60) -> str:
+        """
+        Returns a cheap version string for the index contents: document count plus the
+        latest metadata sync time. Cached for max_age_seconds to keep it off the hot path.
+        """
+        cached = self._index_versions.get(index_name)
+        if cached and time.time() - cached[1] < max_age_seconds:
+            return cached[0]
+        try:
+            response = self.es_client.search(
+                index=index_name, size=0, track_total_hits=True,
+                aggs={"last_sync": {"max": {"field": "metadata_synced_at"}}}
+            )
+            total = response.get('hits', {}).get('total', {}).get('value', 0)
+            last_sync = response.get('aggregations', {}).get('last_sync', {}).get('value') or 0
+            version = f"{total}:{int(last_sync)}"
+        except Exception as e:
+            print(f"Could not determine version of index '{index_name}': {e}")
+            version = "unknown"
+        self._index_versions[index_name] = (version, time.time())
+        return version
+
+    def iter_paper_ids(self, index_name: str = "papers") -> Iterator[str]:
+        """
+        Yields the id of every document in the index (scroll, no _source).
+        """
+        for hit in helpers.scan(self.es_client, index=index_name, query={"query": {"match_all": {}}}, _source=False):
+            yield hit['_id']
+
+    def iter_papers(self, source_fields: List[str], index_name: str = "papers") -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yields (id, _source) for every document, limited to source_fields (scroll).
+        """
+        for hit in helpers.scan(self.es_client, index=index_name, query={"query": {"match_all": {}}}, _source=source_fields):
+            yield hit['_id'], hit.get('_source', {})
+
+    def get_papers_by_ids(self, paper_ids: List[str], time_filter: Dict = None,
+                          source_fields: Optional[List[str]] = None, index_name: str = "papers") -> List[Dict[str, Any]]:
+        """
+        Returns the hits for the given ids that also pass the publication date filter.
+        """
+        if not paper_ids:
+            return []
+        query = {"bool": {"filter": [{"ids": {"values": list(paper_ids)}}]}}
+        if time_filter:
+            query["bool"]["filter"].append({"range": {"publication_date": time_filter}})
+        body = {"query": query, "size": len(paper_ids)}
+        if source_fields is not None:
+            body["_source"] = source_fields
+        try:
+            response = self.es_client.search(index=index_name, body=body)
+            return response.get('hits', {}).get('hits', [])
+        except Exception as e:
+            print(f"Failed to fetch papers by id: {e}")
             return []
+
+    def get_paper_contents(self, paper_ids: List[str], index_name: str = "papers") -> Dict[str, str]:
+        """
+        Returns the full 'content' of the given papers in one mget round trip.
+        Papers that are missing (or have no content) are left out.
+        """
+        if not paper_ids:
+            return {}
+        try:
+            response = self.es_client.mget(index=index_name, ids=list(paper_ids), _source=["content"])
+        except Exception as e:
+            print(f"Failed to fetch paper contents: {e}")
+            return {}
+        contents = {}
+        for doc in response.get('docs', []):
+            content = doc.get('_source', {}).get('content') if doc.get('found') else None
+            if content:
+                contents[doc['_id']] = content
+        return contents
+
+    def update_papers_metadata(self, updates: Iterable[Tuple[str, Dict[str, Any]]], index_name: str = "papers",
+                               chunk_size: int = 500) -> Dict[str, Any]:
+        """
+        Merges partial metadata into existing paper documents with bulk update requests.
+        Returns the number of updated documents and the per-document failures.
+        """
+        actions = (
+            {"_op_type": "update", "_index": index_name, "_id": paper_id, "doc": fields}
+            for paper_id, fields in updates
+        )
+        updated = 0
+        failed = []
+        for ok, item in helpers.streaming_bulk(self.es_client, actions, chunk_size=chunk_size,
+                                               raise_on_error=False, raise_on_exception=False):
+            if ok:
+                updated += 1
+            else:
+                result = item.get('update', {})
+                failed.append({'paper_id': result.get('_id'), 'error': result.get('error')})
+        self.bump_write_generation()
+        return {'updated': updated, 'failed': failed}
+
+    def index_papers_bulk(self, papers: Iterable[Tuple[str, Dict[str, Any], str]], index_name: str = "papers",
+                          chunk_size: int = 500, max_chunk_bytes: int = 50 * 1024 * 1024,
+                          thread_count: int = 4, queue_size: int = 4, disable_refresh: bool = True) -> Dict[str, Any]:
+        """
+        Indexes many papers through the bulk API with parallel workers.
+
+        papers is any iterable or generator of (paper_id, metadata, content); it is
+        consumed lazily, so arbitrarily large backfills stream in constant memory.
+        Index refresh is disabled for the duration of the load and restored afterwards.
+        Failures are returned as data ({'paper_id', 'error'}) rather than reported to the UI.
+        """
+        actions = (
+            {"_op_type": "index", "_index": index_name, "_id": paper_id,
+             "_source": self.build_document(metadata, content)}
+            for paper_id, metadata, content in papers
+        )
+
+        start = time.time()
+        refresh_changed, previous_refresh = self._disable_refresh(index_name) if disable_refresh else (False, None)
+        indexed = 0
+        failed = []
+        try:
+            for ok, item in helpers.parallel_bulk(self.es_client, actions, thread_count=thread_count,
+                                                  chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                                                  queue_size=queue_size, raise_on_error=False,
+                                                  raise_on_exception=False):
+                if ok:
+                    indexed += 1
+                else:
+                    result = item.get('index', {})
+                    failed.append({'paper_id': result.get('_id'), 'error': result.get('error')})
+        finally:
+            if refresh_changed:
+                self._restore_refresh(index_name, previous_refresh)
+            self.bump_write_generation()
+
+        return {'indexed': indexed, 'failed': failed, 'seconds': time.time() - start}
+
+    def _disable_refresh(self, index_name: str) -> Tuple[bool, Optional[str]]:
+        """
+        Turns off periodic refresh; returns (changed, previous refresh_interval).
+        Deployments that do not allow the setting (e.g. Serverless) are left untouched.
+        """
+        try:
+            settings = self.es_client.indices.get_settings(index=index_name, name="index.refresh_interval")
+            previous = (settings.get(index_name, {}).get('settings', {})
+                        .get('index', {}).get('refresh_interval'))
+            self.es_client.indices.put_settings(index=index_name, settings={"index": {"refresh_interval": "-1"}})
+            return True, previous
+        except Exception as e:
+            print(f"Could not disable refresh on '{index_name}': {e}")
+            return False, None
+
+    def _restore_refresh(self, index_name: str, previous_refresh: Optional[str]):
+        """
+        Restores refresh_interval (None resets it to the cluster default) and refreshes once.
+        """
+        try:
+            self.es_client.indices.put_settings(index=index_name, settings={"index": {"refresh_interval": previous_refresh}})
+            self.es_client.indices.refresh(index=index_name)
+        except Exception as e:
+            print(f"Could not restore refresh on '{index_name}': {e}")
+
+    def msearch_papers(self, searches: List[Tuple], time_filter: Dict = None, size: int = 10,
+                       source_fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Runs several keyword searches in a single _msearch round trip.
+        Each search is (keywords, operator) or (keywords, operator, source): source overrides
+        source_fields for that search, and False returns only ids and scores.
+        Returns one hit list per search, in order; searches answered by the query cache
+        are not sent, and a failed search yields an empty list. The cache keeps only ids
+        and scores, so cached hits carry no _source; callers fetch the fields they need
+        with get_papers_by_ids.
+        """
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(searches)
+        body = []
+        pending = []
+        for position, search in enumerate(searches):
+            keywords, operator = search[0], search[1]
+            source = search[2] if len(search) > 2 else source_fields
+            if not keywords:
+                results[position] = []
+                continue
+            cache_key = self._search_cache_key(keywords, time_filter, size, operator)
+            cached_hits = self._get_cached_query(cache_key)
+            if cached_hits is not None:
+                results[position] = cached_hits
+                continue
+            body.append({"index": "papers"})
+            body.append(self._build_search_query(keywords, time_filter, size, operator, source))
+            pending.append((position, cache_key))
+        
+        if pending:
+            try:
+                generation = self._write_generation
+                response = self.es_client.msearch(body=body)
+                for (position, cache_key), item in zip(pending, response.get('responses', [])):
+                    if 'error' in item:
+                        print(f"Elasticsearch subquery failed: {item['error']}")
+                        results[position] = []
+                        continue
+                    hits = item.get('hits', {}).get('hits', [])
+                    self._store_cached_query(cache_key, hits, generation)
+                    results[position] = hits
+            except Exception as e:
+                st.error(f"An error occurred during Elasticsearch search: {e}")
+        
+        return [hits if hits is not None else [] for hits in results]
+
+    @staticmethod
+    def _build_search_query(keywords: List[str], time_filter: Optional[Dict], size: int, operator: str,
+                            source_fields: Union[List[str], bool, None]) -> Dict[str, Any]:
         bool_operator = "must" if operator.upper() == "AND" else "should"
         
         # The base query structure
@@ -97,6 +365,9 @@ class ElasticsearchManager:
             "size": size
         }
         
+        if source_fields is not None:
+            query["_source"] = source_fields
+        
         # For OR queries, we need to specify minimum_should_match to ensure at least one keyword matches
         if operator.upper() == "OR":
             query["query"]["bool"]["minimum_should_match"] = 1
@@ -106,15 +377,77 @@ class ElasticsearchManager:
                     "publication_date": time_filter
                 }
             })
-        try:
-            response = self.es_client.search(index="papers", body=query)
-            return response.get('hits', {}).get('hits', [])
-        except Exception as e:
-            st.error(f"An error occurred during Elasticsearch search: {e}")
-            return []
+        return query
+
+    @staticmethod
+    def _search_cache_key(keywords: List[str], time_filter: Optional[Dict], size: int, operator: str) -> str:
+        # _source is not part of the key: cached entries hold only ids and scores
+        return json.dumps({
+            'keywords': sorted(keywords),
+            'operator': operator.upper(),
+            'filter': time_filter,
+            'size': size
+        }, sort_keys=True)
+
+    def bump_write_generation(self):
+        """
+        Marks every cached query result as stale; called after any write to the index.
+        """
+        with self._query_cache_lock:
+            self._write_generation += 1
+
+    def query_cache_stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters of the query result cache.
+        """
+        with self._query_cache_lock:
+            stats = dict(self._query_cache_stats)
+            stats['size'] = len(self._query_cache)
+            stats['write_generation'] = self._write_generation
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _get_cached_query(self, cache_key: str) -> Optional[List[Dict[str, Any]]]:
+        with self._query_cache_lock:
+            entry = self._query_cache.get(cache_key)
+            if entry is None:
+                self._query_cache_stats['misses'] += 1
+                return None
+            if entry['generation'] != self._write_generation:
+                del self._query_cache[cache_key]
+                self._query_cache_stats['invalidated'] += 1
+                self._query_cache_stats['misses'] += 1
+                return None
+            if time.time() - entry['stored_at'] >= self.query_cache_ttl:
+                del self._query_cache[cache_key]
+                self._query_cache_stats['expired'] += 1
+                self._query_cache_stats['misses'] += 1
+                return None
+            self._query_cache.move_to_end(cache_key)
+            self._query_cache_stats['hits'] += 1
+            compact_hits = entry['hits']
+        # Fresh hit dicts per caller, without _source (see msearch_papers)
+        return [{'_id': hit_id, '_score': score} for hit_id, score in compact_hits]
+
+    def _store_cached_query(self, cache_key: str, hits: List[Dict[str, Any]], generation: int):
+        if self.query_cache_ttl <= 0:
+            return
+        # Only ids and scores are kept; documents are fetched by id when needed
+        compact_hits = [(hit['_id'], hit.get('_score', 0.0)) for hit in hits]
+        with self._query_cache_lock:
+            if generation != self._write_generation:
+                # A write raced with this search; don't cache a possibly stale result
+                return
+            self._query_cache[cache_key] = {'hits': compact_hits, 'generation': generation, 'stored_at': time.time()}
+            self._query_cache.move_to_end(cache_key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+                self._query_cache_stats['evictions'] += 1
 
 @st.cache_resource
-def get_es_manager(cloud_id: str = None, hosts: list = None, username: str = None, password: str = None, api_key: str = None) -> ElasticsearchManager:
+def get_es_manager(cloud_id: str = None, hosts: list = None, username: str = None, password: str = None, api_key: str = None,
+                   query_cache_ttl: float = 300, query_cache_size: int = 256) -> ElasticsearchManager:
     """
     A cached factory function to get an instance of the ElasticsearchManager.
     Supports both Serverless (hosts + api_key) and Hosted (cloud_id + username + password).
@@ -124,6 +457,8 @@ def get_es_manager(cloud_id: str = None, hosts: list = None, username: str = Non
         hosts=hosts, 
         username=username, 
         password=password, 
-        api_key=api_key
+        api_key=api_key,
+        query_cache_ttl=query_cache_ttl,
+        query_cache_size=query_cache_size
     )
     return es_manager
\ No newline at end of file
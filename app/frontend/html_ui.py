@@ -17,14 +17,24 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.api import ResearchAssistantAPI
+from backend.titling import extractive_title
 from auth import show_login_page, show_logout_button
 from utils.static_assets import StaticAssetsManager
 
+# Interval at which the sidebar checks for finished background chat titles
+TITLE_POLL_SECONDS = 2
+# Background titles still pending after this long are dropped (the extractive title stays)
+TITLE_MAX_WAIT_SECONDS = 120
+# PDFs fetched on demand kept in the session (oldest dropped first)
+FETCHED_PDFS_LIMIT = 5
+
 class HTMLResearchAssistantUI:
     def __init__(self, api: ResearchAssistantAPI):
         """Initialize HTML-based UI with backend API"""
         self.api = api
         
+        # Placeholder holding the full-screen loading overlay for this script run
+        self._loading_overlay = None
         # Initialize static assets manager
         self.assets_manager = StaticAssetsManager()
         
@@ -131,25 +141,19 @@ class HTMLResearchAssistantUI:
         st.session_state[user_key] = value
         
         # Auto-sync to backend for important data (EXCLUDE active_conversation_id - it should never be persisted)
-        if key in ['conversations', 'selected_keywords', 'search_mode', 'uploaded_papers', 'custom_summary_chat', 'time_filter']:
+        # Saves are queued and coalesced by the backend, so this never waits on GCS.
+        # Conversations are not part of the preferences; they are saved one by one via save_conversation
+        if key in ['selected_keywords', 'search_mode', 'uploaded_papers', 'custom_summary_chat', 'time_filter']:
             username = st.session_state.get('username')
             if username and username != 'default':
                 try:
-                    # Simple rate limiting to avoid GCS 429 errors
-                    rate_key = f"last_backend_sync_{username}"
-                    now_ts = time.time()
-                    last_sync = st.session_state.get(rate_key, 0)
-                    # Always allow immediate syncs for conversations; throttle others to once per 5s
-                    must_sync = key == 'conversations' or (now_ts - last_sync) >= 5.0
-                    if must_sync:
-                        user_data = {
-                            'selected_keywords': self.get_user_session('selected_keywords', []),
-                            'search_mode': self.get_user_session('search_mode', 'all_keywords'),
-                            'uploaded_papers': self.get_user_session('uploaded_papers', []),
-                            'custom_summary_chat': self.get_user_session('custom_summary_chat', [])
-                        }
-                        self.api.save_user_data(username, user_data)
-                        st.session_state[rate_key] = now_ts
+                    user_data = {
+                        'selected_keywords': self.get_user_session('selected_keywords', []),
+                        'search_mode': self.get_user_session('search_mode', 'all_keywords'),
+                        'uploaded_papers': self.get_user_session('uploaded_papers', []),
+                        'custom_summary_chat': self.get_user_session('custom_summary_chat', [])
+                    }
+                    self.api.save_user_data(username, user_data)
                 except Exception as e:
                     print(f"Failed to sync to backend: {e}")
     
@@ -177,7 +181,8 @@ class HTMLResearchAssistantUI:
             loading_subtext = st.session_state.get('loading_subtext', 'Please wait while we work on your request')
             loading_progress = st.session_state.get('loading_progress', '')
             
-            st.markdown(f"""
+            self._loading_overlay = st.empty()
+            self._loading_overlay.markdown(f"""
             <div class="loading-overlay show">
                 <div class="loading-content">
                     <div class="loading-spinner"></div>
@@ -195,6 +200,9 @@ class HTMLResearchAssistantUI:
         # Get current state
         active_conversation_id = self.get_user_session('active_conversation_id')
         conversations = self.get_user_session('conversations', {})
+        if active_conversation_id and not self._ensure_conversation_loaded(active_conversation_id):
+            active_conversation_id = None
+            conversations = self.get_user_session('conversations', {})
 
         # If a keyword search was scheduled on previous click, run it now while overlay is visible
         if st.session_state.get('do_keyword_search'):
@@ -202,8 +210,9 @@ class HTMLResearchAssistantUI:
                 pending_keywords = st.session_state.get('pending_keywords', [])
                 pending_time = st.session_state.get('pending_time_filter', 'Current year')
                 pending_mode = st.session_state.get('pending_search_mode', 'all_keywords')
+                pending_force_refresh = st.session_state.get('pending_force_refresh', False)
 
-                success = self.process_keyword_search(pending_keywords, pending_time, pending_mode)
+                success = self.process_keyword_search(pending_keywords, pending_time, pending_mode, pending_force_refresh)
 
                 # Clear loading and flags
                 st.session_state['is_loading'] = False
@@ -211,6 +220,7 @@ class HTMLResearchAssistantUI:
                 st.session_state.pop('pending_keywords', None)
                 st.session_state.pop('pending_time_filter', None)
                 st.session_state.pop('pending_search_mode', None)
+                st.session_state.pop('pending_force_refresh', None)
 
                 if success:
                     st.rerun()
@@ -266,11 +276,19 @@ class HTMLResearchAssistantUI:
                 with st.chat_message(message["role"], avatar=avatar):
                     st.markdown(message["content"], unsafe_allow_html=True)
                     
+                    # Reports served from the analysis cache say when they were generated
+                    if message_index == 0 and active_conv.get("cached_at"):
+                        cached_at_str = datetime.datetime.fromtimestamp(active_conv["cached_at"]).strftime("%b %d, %Y %H:%M")
+                        st.caption(f"Cached result generated on {cached_at_str}")
+                    
                     # Show papers section only for the first assistant message and regular analyses
                     if (message["role"] == "assistant" and message_index == 0 and 
                         "retrieved_papers" in active_conv and active_conv["retrieved_papers"] and 
                         active_conv.get("search_mode") != "custom"):
                         with st.expander("View and Download Retrieved Papers for this Analysis"):
+                            # Signed URLs are generated locally in one batch; no PDF bytes are
+                            # transferred until the user actually clicks a download link
+                            download_urls = self._get_pdf_download_urls(active_conversation_id, active_conv["retrieved_papers"])
                             for paper_index, paper in enumerate(active_conv["retrieved_papers"]):
                                 meta = paper.get('metadata', {})
                                 title = meta.get('title', 'N/A')
@@ -281,63 +299,109 @@ class HTMLResearchAssistantUI:
                                     st.markdown(f"**{paper_index+1}. {title}**")
                                 with col2:
                                     if paper_id:
-                                        pdf_bytes = self.api.get_pdf_from_gcs(self.api.config['gcs_bucket_name'], paper_id)
-                                        if pdf_bytes:
-                                            st.download_button(
-                                                label="Download PDF",
-                                                data=pdf_bytes,
-                                                file_name=paper_id,
-                                                mime="application/pdf",
-                                                key=f"download_{active_conversation_id}_{paper_id}"
-                                            )
+                                        self._render_pdf_download(active_conversation_id, paper_id, download_urls.get(paper_id))
             
             # Handle follow-up responses
             if active_conversation_id and conversations[active_conversation_id]["messages"][-1]["role"] == "user":
                 active_conv = conversations[active_conversation_id]
-                with st.spinner("Thinking..."):
-                    chat_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in active_conv["messages"]])
-                    full_context = ""
-                    if active_conv.get("retrieved_papers"):
-                        full_context += "Here is the full context of every paper found in the initial analysis:\n\n"
-                        for i, paper in enumerate(active_conv["retrieved_papers"]):
-                            meta = paper.get('metadata', {})
-                            title = meta.get('title', 'N/A')
-                            link = self.api._get_paper_link(meta)
-                            content_preview = (meta.get('abstract') or paper.get('content') or '')[:4000]
-                            full_context += f"SOURCE [{i+1}]:\nTitle: {title}\nLink: {link}\nContent: {content_preview}\n---\n\n"
+                
+                # Stream the answer into the chat as it is generated
+                with st.chat_message("assistant", avatar=self.ASSISTANT_AVATAR):
+                    try:
+                        # Sends only the new turn when the literature context is cached
+                        response_text = self._render_stream(self.api.generate_follow_up_stream(active_conv))
+                    except Exception as e:
+                        print(f"AI API error: {e}")
+                        st.error("Failed to generate a response. Please try again.")
+                        response_text = None
+                
+                if response_text:
+                    # For follow-up responses, use all retrieved papers to make citations clickable but don't include references section
+                    response_text = self.api.finalize_follow_up(active_conv, response_text)
+                    active_conv["messages"].append({"role": "assistant", "content": response_text})
+                    active_conv['last_interaction_time'] = time.time()
+                    self.set_user_session('conversations', conversations)
                     
-                    full_prompt = f"""Continue our conversation. You are the Polo-GGB Research Assistant.
-Your task is to answer the user's last message based on the chat history and the full context from the paper sources provided below.
-
-**CITATION INSTRUCTIONS:** When referencing sources, use citation markers in square brackets like [1], [2], [3], etc. Separate multiple citations with individual brackets like [2][3][4]. **IMPORTANT:** Limit citations to a maximum of 3 per sentence. If more than 3 sources support a finding, choose the 3 most relevant or representative sources.
-
---- CHAT HISTORY ---
-{chat_history}
---- END CHAT HISTORY ---
-
---- FULL LITERATURE CONTEXT FOR THIS ANALYSIS ---
-{full_context}
---- END FULL LITERATURE CONTEXT FOR THIS ANALYSIS ---
-
-Assistant Response:"""
+                    # Save conversation to backend
+                    username = st.session_state.get('username')
+                    if username:
+                        self.api.save_conversation(username, active_conversation_id, active_conv)
                     
-                    response_text = self.api.generate_ai_response(full_prompt)
-                    if response_text:
-                        retrieved_papers = active_conv.get("retrieved_papers", [])
-                        search_mode = active_conv.get("search_mode", "all_keywords")
-                        
-                        # For follow-up responses, use all retrieved papers to make citations clickable but don't include references section
-                        response_text = self.api._display_citations_separately(response_text, retrieved_papers, retrieved_papers, search_mode, include_references=False)
-                        active_conv["messages"].append({"role": "assistant", "content": response_text})
-                        active_conv['last_interaction_time'] = time.time()
-                        self.set_user_session('conversations', conversations)
-                        
-                        # Save conversation to backend
-                        username = st.session_state.get('username')
-                        if username:
-                            self.api.save_conversation(username, active_conversation_id, active_conv)
-                        
-                        st.rerun()
+                    st.rerun()
+    
+    def _render_stream(self, chunks, prefix: str = "") -> Optional[str]:
+        """
+        Render streamed text chunks incrementally and return the full text.
+        The loading overlay (if shown) is removed as soon as the first chunk arrives.
+        """
+        placeholder = st.empty()
+        placeholder.markdown(prefix + "*Thinking...*", unsafe_allow_html=True)
+        
+        text = ""
+        last_render = 0.0
+        for chunk in chunks:
+            if not text and self._loading_overlay is not None:
+                self._loading_overlay.empty()
+            text += chunk
+            # Throttle re-renders so long answers don't flood the websocket
+            now = time.time()
+            if now - last_render >= 0.1:
+                placeholder.markdown(prefix + text + " ▌", unsafe_allow_html=True)
+                last_render = now
+        
+        if not text:
+            placeholder.empty()
+            return None
+        placeholder.markdown(prefix + text, unsafe_allow_html=True)
+        return text
+    
+    def _get_pdf_download_urls(self, conv_id: str, papers: List[Dict]) -> Dict[str, Optional[str]]:
+        """Signed PDF URLs for a conversation, cached in the session until shortly before they expire"""
+        cache = st.session_state.setdefault('pdf_download_urls', {})
+        cached = cache.get(conv_id)
+        if cached and cached['expires_at'] - time.time() > 60:
+            return cached['urls']
+        
+        paper_ids = [paper.get('paper_id') for paper in papers if paper.get('paper_id')]
+        try:
+            urls = self.api.get_pdf_signed_urls(paper_ids, expiration_minutes=15)
+        except Exception as e:
+            print(f"Failed to generate PDF download URLs: {e}")
+            urls = {}
+        cache[conv_id] = {'urls': urls, 'expires_at': time.time() + 15 * 60}
+        return urls
+    
+    def _render_pdf_download(self, conv_id: str, paper_id: str, signed_url: Optional[str]):
+        """Render a signed download link, or an on-demand fetch button when signing is unavailable"""
+        if signed_url:
+            st.markdown(
+                f'<a href="{signed_url}" target="_blank" class="pdf-download-link">Download PDF</a>',
+                unsafe_allow_html=True
+            )
+            return
+        
+        # Fallback: fetch the PDF only when explicitly requested. The bytes are kept in the
+        # session, so the download button survives the rerun its own click triggers
+        fetched = st.session_state.setdefault('fetched_pdfs', {})
+        if paper_id not in fetched:
+            if not st.button("Fetch PDF", key=f"fetch_{conv_id}_{paper_id}"):
+                return
+            with st.spinner("Fetching PDF..."):
+                pdf_bytes = self.api.get_pdf_from_gcs(self.api.config['gcs_bucket_name'], paper_id)
+            if not pdf_bytes:
+                st.caption("PDF not available")  # not remembered, so the next click tries again
+                return
+            fetched[paper_id] = pdf_bytes
+            while len(fetched) > FETCHED_PDFS_LIMIT:
+                del fetched[next(iter(fetched))]
+        
+        st.download_button(
+            label="Download PDF",
+            data=fetched[paper_id],
+            file_name=os.path.basename(paper_id),
+            mime="application/pdf",
+            key=f"download_{conv_id}_{paper_id}"
+        )
     
     def render_sidebar(self):
         """Sidebar is now part of the main HTML interface"""
@@ -428,72 +492,55 @@ Assistant Response:"""
         
         return current_title  # Return original if no improvement needed
 
-    def process_keyword_search(self, keywords: List[str], time_filter_type: str, search_mode: str = "all_keywords"):
+    def process_keyword_search(self, keywords: List[str], time_filter_type: str, search_mode: str = "all_keywords",
+                               force_refresh: bool = False):
         """Process keyword search via backend"""
         try:
             print(f"Processing keyword search with {len(keywords)} keywords: {keywords}")
-            analysis_result, retrieved_papers, total_found = self.api.search_papers(keywords, time_filter_type, search_mode)
+            report_header = self._build_report_header(keywords, search_mode, time_filter_type)
+            
+            # Repeat analyses are served from the shared analysis cache
+            cached = None if force_refresh else self.api.get_cached_analysis(keywords, time_filter_type, search_mode)
+            prepared = None if cached else self.api.prepare_analysis(keywords, time_filter_type, search_mode)
+            
+            analysis_result = None
+            cached_at = None
+            retrieved_papers, total_found = [], 0
+            if cached:
+                analysis_result = cached['analysis']
+                retrieved_papers, total_found = cached['papers'], cached['total_found']
+                cached_at = cached['cached_at']
+                title_future = self.api.submit_conversation_title(cached['raw_analysis'], keywords, retrieved_papers)
+            elif prepared:
+                retrieved_papers, total_found = prepared['papers_for_references'], prepared['total_found']
+                
+                # Stream the report as it is generated, then add clickable citations and references
+                with st.chat_message("assistant", avatar=self.ASSISTANT_AVATAR):
+                    analysis_result = self._render_stream(
+                        self.api.generate_ai_response_stream(prepared['prompt']), prefix=report_header
+                    )
+                if analysis_result:
+                    # Title generation runs in the background while citations are post-processed
+                    raw_analysis = analysis_result
+                    title_future = self.api.submit_conversation_title(raw_analysis, keywords, retrieved_papers)
+                    analysis_result = self.api.finalize_analysis(prepared, raw_analysis)
+                    self.api.cache_analysis(prepared, time_filter_type, raw_analysis, analysis_result)
             print(f"API returned: analysis_result={bool(analysis_result)}, papers={len(retrieved_papers)}, total_found={total_found}")
             
             if analysis_result:
                 conv_id = f"conv_{time.time()}"
                 search_mode_display = search_mode
                 selected_keywords = keywords  # Use the actual keywords passed to the function
-                search_mode_text = "ALL keywords" if search_mode_display == "all_keywords" else "AT LEAST ONE keyword"
                 
-                initial_message = {"role": "assistant", "content": f"""
-<div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; border-radius: 12px; margin-bottom: 20px; box-shadow: 0 4px 15px rgba(0,0,0,0.1);">
-    <h2 style="color: white; margin: 0 0 10px 0; font-size: 24px; font-weight: 600;">Analysis Report</h2>
-    <div style="color: #f0f0f0; font-size: 16px; margin-bottom: 8px;">
-        <strong>Keywords:</strong> {', '.join(selected_keywords) if selected_keywords else 'None selected'}
-    </div>
-    <div style="color: #e0e0e0; font-size: 14px;">
-        <strong>Search Mode:</strong> {search_mode_text}
-    </div>
-    <div style="color: #f0f0f0; font-size: 16px;">
-        <strong>Time Window:</strong> {time_filter_type}
-    </div>
-</div>
-
-{analysis_result}
-"""}
+                initial_message = {"role": "assistant", "content": f"{report_header}{analysis_result}\n"}
                 
-                # Generate better title using keywords and analysis content
-                title = self.api.generate_conversation_title(analysis_result)
-                
-                # If AI title is too generic, create a better one from keywords
-                if title in ["Research Analysis", "Analysis", "Research"] or len(title.split()) < 3:
-                    # Create title from keywords and paper topics
-                    keyword_str = ", ".join(selected_keywords[:3])  # First 3 keywords
-                    
-                    # Extract disease/topic from retrieved papers
-                    if retrieved_papers:
-                        paper_titles = [paper.get('metadata', {}).get('title', '') for paper in retrieved_papers[:3]]
-                        # Look for common disease terms
-                        diseases = []
-                        for title_text in paper_titles:
-                            title_lower = title_text.lower()
-                            if 'lung cancer' in title_lower or 'nsclc' in title_lower:
-                                diseases.append('Lung Cancer')
-                            elif 'breast cancer' in title_lower:
-                                diseases.append('Breast Cancer')
-                            elif 'coronary' in title_lower or 'cad' in title_lower:
-                                diseases.append('CAD')
-                            elif 'diabetes' in title_lower:
-                                diseases.append('Diabetes')
-                            elif 'alzheimer' in title_lower:
-                                diseases.append('Alzheimer\'s')
-                        
-                        if diseases:
-                            # Use most common disease
-                            from collections import Counter
-                            disease_counts = Counter(diseases)
-                            main_disease = disease_counts.most_common(1)[0][0]
-                            title = f"{keyword_str}: {main_disease} Analysis"
-                        else:
-                            title = f"{keyword_str} Analysis"
-                    else:
-                        title = f"{keyword_str} Analysis"
+                # Use the generated title if it is already available; otherwise start with the
+                # local extractive title and swap in the generated one once it completes
+                title = extractive_title(selected_keywords, retrieved_papers)
+                if title_future.done():
+                    title = self._title_from_future(title_future, title)
+                else:
+                    st.session_state.setdefault('pending_conversation_titles', {})[conv_id] = (title_future, time.monotonic())
                 
                 conversations = self.get_user_session('conversations', {})
                 conversations[conv_id] = {
@@ -506,6 +553,8 @@ Assistant Response:"""
                     "created_at": time.time(),
                     "last_interaction_time": time.time()
                 }
+                if cached_at:
+                    conversations[conv_id]["cached_at"] = cached_at
                 self.set_user_session('conversations', conversations)
                 print(f"Created conversation {conv_id} with message: {initial_message['content'][:100]}...")
                 
@@ -527,6 +576,105 @@ Assistant Response:"""
             st.error(f"An error occurred while processing the search: {str(e)}")
             return False
     
+    def _ensure_conversation_loaded(self, conv_id: str) -> bool:
+        """Replace a manifest stub with the full conversation on first open; False if it can't be loaded"""
+        conversations = self.get_user_session('conversations', {})
+        conv_data = conversations.get(conv_id)
+        if not conv_data or not conv_data.get('stub'):
+            return True
+        
+        username = st.session_state.get('username')
+        body = self.api.load_conversation(username, conv_id) if username else None
+        if not body:
+            st.error("This analysis could not be loaded. Please try again later.")
+            self.set_user_session('active_conversation_id', None)
+            return False
+        conversations[conv_id] = body
+        st.session_state[self.get_user_key('conversations')] = conversations
+        return True
+    
+    def _title_from_future(self, title_future, fallback: str) -> str:
+        """Result of a finished title Future, or fallback if generation failed"""
+        try:
+            return title_future.result() or fallback
+        except Exception as e:
+            print(f"Title generation failed: {e}")
+            return fallback
+    
+    def apply_pending_titles(self):
+        """
+        Swap in background-generated titles that have completed since the last run and
+        drop ones pending longer than TITLE_MAX_WAIT_SECONDS (never waits on a future)
+        """
+        pending = st.session_state.get('pending_conversation_titles')
+        if not pending:
+            return
+        
+        conversations = self.get_user_session('conversations', {})
+        for conv_id, (title_future, submitted_at) in list(pending.items()):
+            if not title_future.done():
+                if time.monotonic() - submitted_at > TITLE_MAX_WAIT_SECONDS:
+                    title_future.cancel()
+                    del pending[conv_id]
+                    print(f"Title generation for {conv_id} timed out; keeping the extractive title")
+                continue
+            del pending[conv_id]
+            if conv_id not in conversations:
+                continue
+            
+            title = self._title_from_future(title_future, conversations[conv_id].get('title', 'Research Analysis'))
+            if title != conversations[conv_id].get('title'):
+                conversations[conv_id]['title'] = title
+                self.set_user_session('conversations', conversations)
+                username = st.session_state.get('username')
+                if username:
+                    self.api.save_conversation(username, conv_id, conversations[conv_id])
+        
+        if pending:
+            self._render_title_poller()
+    
+    def _render_title_poller(self):
+        """
+        Sidebar status for background titles. A fragment re-checks the pending futures every
+        TITLE_POLL_SECONDS and reruns the app once one has finished or timed out, so the
+        title appears without holding the script thread. Without st.fragment (older
+        Streamlit) the title appears on the next rerun.
+        """
+        fragment = getattr(st, 'fragment', None)
+        if fragment is None:
+            st.caption("Generating chat title...")
+            return
+        
+        @fragment(run_every=TITLE_POLL_SECONDS)
+        def poll_pending_titles():
+            pending = st.session_state.get('pending_conversation_titles') or {}
+            now = time.monotonic()
+            if not pending or any(title_future.done() or now - submitted_at > TITLE_MAX_WAIT_SECONDS
+                                  for title_future, submitted_at in pending.values()):
+                st.rerun()
+            st.caption("Generating chat title...")
+        
+        poll_pending_titles()
+    
+    def _build_report_header(self, keywords: List[str], search_mode: str, time_filter_type: str) -> str:
+        """HTML banner shown at the top of an analysis report"""
+        search_mode_text = "ALL keywords" if search_mode == "all_keywords" else "AT LEAST ONE keyword"
+        return f"""
+<div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; border-radius: 12px; margin-bottom: 20px; box-shadow: 0 4px 15px rgba(0,0,0,0.1);">
+    <h2 style="color: white; margin: 0 0 10px 0; font-size: 24px; font-weight: 600;">Analysis Report</h2>
+    <div style="color: #f0f0f0; font-size: 16px; margin-bottom: 8px;">
+        <strong>Keywords:</strong> {', '.join(keywords) if keywords else 'None selected'}
+    </div>
+    <div style="color: #e0e0e0; font-size: 14px;">
+        <strong>Search Mode:</strong> {search_mode_text}
+    </div>
+    <div style="color: #f0f0f0; font-size: 16px;">
+        <strong>Time Window:</strong> {time_filter_type}
+    </div>
+</div>
+
+"""
+    
     def handle_form_submissions(self):
         """Handle form submissions using Streamlit components"""
         # Use regular Streamlit components instead of complex form handling
@@ -615,6 +763,15 @@ Assistant Response:"""
             # Update session state with time filter
             self.set_user_session('time_filter', time_filter)
             
+            # Admins can bypass the shared analysis cache
+            force_refresh = False
+            if self.api.is_admin(st.session_state.get('username')):
+                force_refresh = st.checkbox(
+                    "Force refresh (ignore cached analyses)",
+                    key="html_force_refresh",
+                    disabled=analysis_locked
+                )
+            
             # Search button
             if st.button("Search & Analyze", type="primary", use_container_width=True, disabled=analysis_locked):
                 if selected_keywords:
@@ -630,6 +787,7 @@ Assistant Response:"""
                     st.session_state['pending_keywords'] = list(selected_keywords)
                     st.session_state['pending_time_filter'] = time_filter
                     st.session_state['pending_search_mode'] = search_mode
+                    st.session_state['pending_force_refresh'] = force_refresh
 
                     st.rerun()
                 else:
@@ -637,6 +795,7 @@ Assistant Response:"""
             
             # Chat history
             st.markdown("### Chat History")
+            self.apply_pending_titles()
             conversations = self.get_user_session('conversations', {})
             if conversations:
                 # Sort conversations by creation time (most recent first) - like ChatGPT
@@ -665,8 +824,8 @@ Assistant Response:"""
                     # Get and potentially improve the title
                     title = conv_data.get("title", "Chat...")
                     
-                    # Check if title needs improvement (too generic)
-                    if (title in ["Research Analysis", "Analysis", "Research", "Chat..."] or 
+                    # Check if title needs improvement (too generic); stubs have no messages to improve from
+                    if not conv_data.get("stub") and (title in ["Research Analysis", "Analysis", "Research", "Chat..."] or 
                         len(title.split()) < 3 or 
                         "Genetics via" in title or 
                         ("Medical" in title and len(title.split()) < 4)):
@@ -712,14 +871,14 @@ Assistant Response:"""
                     with col2:
                         if st.button("×", key=f"delete_{conv_id}", help="Delete this analysis", type="secondary"):
                             # Delete conversation from session
-                            del conversations[conv_id]
+                            deleted_conversation = conversations.pop(conv_id)
                             self.set_user_session('conversations', conversations)
                             
                             # Delete from GCS
                             username = st.session_state.get('username')
                             if username:
                                 try:
-                                    self.api.delete_conversation(username, conv_id)
+                                    self.api.delete_conversation(username, conv_id, deleted_conversation)
                                     st.success("Analysis deleted!")
                                 except Exception as e:
                                     st.error(f"Failed to delete from storage: {e}")
@@ -839,8 +998,24 @@ Assistant Response:"""
                     
                     st.rerun()
             
+            # Background writer status (admins only)
+            username = st.session_state.get('username')
+            if self.api.is_admin(username):
+                with st.expander("Storage Writes"):
+                    stats = self.api.get_persistence_stats()
+                    st.caption(f"Queued: {stats['depth']} · In flight: {stats['in_flight']}")
+                    st.caption(f"Completed: {stats['completed']} · Failed: {stats['failed']} · "
+                               f"Retries: {stats['retries']} · Coalesced: {stats['coalesced']}")
+                    st.caption(f"Write latency: {stats['avg_latency']:.2f}s avg, {stats['max_latency']:.2f}s max")
+
             # Logout
             if st.button("Logout", type="secondary", use_container_width=True):
+                # Make sure queued writes reach storage before the session goes away, and
+                # free the provider's cached contexts of this session's conversations
+                if username:
+                    self.api.release_context_caches((self.get_user_session('conversations') or {}).values())
+                    self.api.flush_persistence(username)
+
                 # Clear session state
                 for key in list(st.session_state.keys()):
                     if not key.startswith('_'):
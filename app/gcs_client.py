@@ -0,0 +1,66 @@
+# app/gcs_client.py
+"""
+Shared GCS access layer
+Owns a single google.cloud.storage client per process whose HTTP session uses a
+larger keep-alive connection pool, and hands out reusable bucket handles. All
+backend modules should go through get_bucket() instead of creating their own
+storage.Client(), so TLS sessions and OAuth tokens are shared.
+"""
+
+import threading
+from typing import Dict, Optional
+
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from requests.adapters import HTTPAdapter
+
+# Connection pool sizing: concurrent sidecar/conversation fetches run on worker
+# pools, so the pool must be at least as large as the biggest worker pool.
+GCS_POOL_CONNECTIONS = 8
+GCS_POOL_MAXSIZE = 32
+GCS_SCOPES = ["https://www.googleapis.com/auth/devstorage.read_write"]
+
+_lock = threading.Lock()
+_client: Optional[storage.Client] = None
+_buckets: Dict[str, storage.Bucket] = {}
+
+
+def _build_client() -> storage.Client:
+    """Create a storage client backed by a pooled, keep-alive HTTP session"""
+    credentials, project = google.auth.default(scopes=GCS_SCOPES)
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=GCS_POOL_CONNECTIONS, pool_maxsize=GCS_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    return storage.Client(project=project, credentials=credentials, _http=session)
+
+
+def get_storage_client() -> storage.Client:
+    """Return the process-wide storage client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def get_bucket(bucket_name: str) -> storage.Bucket:
+    """Return a cached bucket handle for bucket_name"""
+    bucket = _buckets.get(bucket_name)
+    if bucket is None:
+        client = get_storage_client()
+        with _lock:
+            bucket = _buckets.get(bucket_name)
+            if bucket is None:
+                bucket = client.bucket(bucket_name)
+                _buckets[bucket_name] = bucket
+    return bucket
+
+
+def reset_client():
+    """Drop the shared client and bucket handles (e.g. after a credentials change)"""
+    global _client
+    with _lock:
+        _client = None
+        _buckets.clear()
@@ -1,17 +1,110 @@
 # app/gcs_user_storage.py
+import hashlib
 import json
 import os
+import threading
 import time
-from typing import Dict, List, Any, Optional
-from google.cloud import storage
-from google.api_core.exceptions import NotFound
-import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from storage_backend import (BlobNotFound, GenerationMismatch, GCSBackend, StorageBackend, StorageError, StorageResult,
+                             is_transient_error)
+
+# Upper bound on concurrent conversation downloads of one bulk load
+CONVERSATION_LOAD_WORKERS = 16
+
+# A background compaction folds a conversation's segments into its snapshot after this many appends
+COMPACT_AFTER_SEGMENTS = 8
+
+# Retries of a manifest read-modify-write that lost a race with another writer
+MANIFEST_MAX_ATTEMPTS = 5
+
+# Retries of a conditional document write that lost a race with another tab or process
+CONFLICT_MAX_ATTEMPTS = 3
+
+def conversation_summary(conversation_id: str, conversation_data: Dict[str, Any], size: int) -> Dict[str, Any]:
+    """Manifest entry for a conversation: everything the sidebar needs, without the body"""
+    return {
+        "id": conversation_id,
+        "title": conversation_data.get("title", "Chat..."),
+        "created_at": conversation_data.get("created_at"),
+        "last_interaction_time": conversation_data.get("last_interaction_time"),
+        "keywords": conversation_data.get("keywords", [])[:5],
+        "search_mode": conversation_data.get("search_mode"),
+        "message_count": len(conversation_data.get("messages", [])),
+        "size": size
+    }
+
+def _field_hashes(conversation_data: Dict[str, Any]) -> Dict[str, str]:
+    """Hash of every top-level conversation field except the (append-only) messages"""
+    return {
+        key: hashlib.sha1(json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+        for key, value in conversation_data.items() if key != "messages"
+    }
+
+def _content_hash(data: Any) -> str:
+    """Hash of a document's content (excluding volatile metadata such as last_updated)"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def _message_hashes(messages: List[Dict[str, Any]]) -> List[str]:
+    """Hash of every message, to tell which messages of a local copy are already persisted"""
+    return [hashlib.sha1(json.dumps(message, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+            for message in messages]
+
+def _apply_segment(conversation_data: Dict[str, Any], segment: Dict[str, Any]):
+    """Apply one message-log segment to a conversation in place"""
+    conversation_data.setdefault("messages", []).extend(segment.get("messages", []))
+    conversation_data.update(segment.get("updates", {}))
+    for key in segment.get("removed", []):
+        conversation_data.pop(key, None)
+
+def _failure(error: str, retryable: bool = True) -> StorageResult:
+    """Log a failed storage operation and return it as a result"""
+    print(error)
+    return StorageResult.failure(error, retryable)
+
+def conversation_stub(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Placeholder conversation built from a manifest entry; the body is loaded on first open"""
+    stub = {key: value for key, value in summary.items()
+            if key not in ("id", "size", "log_seq", "seq") and value is not None}
+    stub["stub"] = True
+    return stub
 
 class GCSUserStorage:
-    def __init__(self, bucket_name: str):
+    """
+    Per-user documents (preferences, conversations, manifest, sessions) on a storage backend
+    
+    The backend defaults to the GCS bucket; local-disk and in-memory backends can be
+    passed in (see storage_backend.build_storage_backend). Public methods report
+    failures as StorageResult values instead of UI messages.
+    """
+    
+    def __init__(self, bucket_name: Optional[str] = None, backend: Optional[StorageBackend] = None):
         self.bucket_name = bucket_name
-        self.storage_client = storage.Client()
-        self.bucket = self.storage_client.bucket(bucket_name)
+        self.backend = backend or GCSBackend(bucket_name)
+        
+        # Persisted state of each conversation's message log, per (username, conversation_id):
+        # message_count, message_hashes, seq (last segment written), snapshot_seq, snapshot_generation
+        # (of the snapshot the state was built on), field_hashes, size
+        self._conversation_logs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._log_lock = threading.Lock()
+        self._compaction_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="conversation-compaction")
+        self._compacting = set()
+        # Conversations written to storage whose manifest update then failed; the next save
+        # records them even if it has nothing new to write
+        self._manifest_pending = set()
+        
+        # Last known generation and content ('data') of single-document blobs (e.g. preferences),
+        # plus 'base', the version this process's callers last read or saved: only the fields
+        # changed since base are written, so unchanged documents are not re-uploaded and a
+        # concurrent writer's other fields survive
+        self._blob_states: Dict[str, Dict[str, Any]] = {}
+        # Last known manifest (entries, generation) per user
+        self._manifests: Dict[str, Tuple[Dict[str, Dict[str, Any]], int]] = {}
+        
+    def close(self):
+        """Stop the background compaction workers (queued compactions are dropped)"""
+        self._compaction_executor.shutdown(wait=False, cancel_futures=True)
         
     def _get_user_path(self, username: str, data_type: str) -> str:
         """Get GCS path for user-specific data"""
@@ -21,122 +114,545 @@ class GCSUserStorage:
         """Get GCS path for specific conversation"""
         return f"user-data/users/{username}/conversations/{conversation_id}.json"
     
+    def _get_segment_prefix(self, username: str, conversation_id: Optional[str] = None) -> str:
+        """Get GCS prefix of the message-log segments of a user (or of one conversation)"""
+        prefix = f"user-data/users/{username}/conversation-log/"
+        return f"{prefix}{conversation_id}/" if conversation_id else prefix
+    
+    def _get_segment_path(self, username: str, conversation_id: str, seq: int) -> str:
+        """Get GCS path for one message-log segment"""
+        return f"{self._get_segment_prefix(username, conversation_id)}{seq:08d}.json"
+    
+    def _get_manifest_path(self, username: str) -> str:
+        """Get GCS path for the user's conversation manifest"""
+        return f"user-data/users/{username}/manifest.json"
+    
     def _get_session_path(self, username: str, session_id: str) -> str:
         """Get GCS path for specific session"""
         return f"user-data/users/{username}/sessions/{session_id}.json"
     
-    def save_user_data(self, username: str, data_type: str, data: Dict[str, Any]) -> bool:
-        """Save user-specific data to GCS"""
+    def save_user_data(self, username: str, data_type: str, data: Dict[str, Any]) -> StorageResult:
+        """
+        Save user-specific data
+        
+        Only the fields that changed since the data was last read or saved are written,
+        on top of the stored document, and nothing is written if none changed. The upload
+        is conditional on the last known generation; if another tab or process wrote in
+        between, the stored version is re-read and the changed fields are merged into it,
+        so both writers' changes are kept.
+        """
+        path = self._get_user_path(username, data_type)
         try:
-            path = self._get_user_path(username, data_type)
-            blob = self.bucket.blob(path)
-            
-            # Add metadata
-            data_with_metadata = {
-                "username": username,
-                "data_type": data_type,
-                "last_updated": time.time(),
-                "data": data
-            }
-            
-            blob.upload_from_string(
-                json.dumps(data_with_metadata, indent=2),
-                content_type='application/json'
-            )
-            return True
+            for _ in range(CONFLICT_MAX_ATTEMPTS):
+                with self._log_lock:
+                    state = dict(self._blob_states.get(path) or {})
+                if 'generation' not in state:
+                    self._read_user_document(path)
+                    continue
+                
+                base = state.get('base') or {}
+                changed = {key: value for key, value in data.items() if key not in base or base[key] != value}
+                removed = [key for key in base if key not in data]
+                if not (changed or removed):
+                    return StorageResult.success()
+                merged = dict(state.get('data') or {})
+                merged.update(changed)
+                for key in removed:
+                    merged.pop(key, None)
+                
+                # Add metadata
+                data_with_metadata = {
+                    "username": username,
+                    "data_type": data_type,
+                    "last_updated": time.time(),
+                    "data": merged
+                }
+                try:
+                    generation = self.backend.put(
+                        path,
+                        json.dumps(data_with_metadata, separators=(',', ':')),
+                        if_generation_match=state['generation']
+                    )
+                except GenerationMismatch:
+                    print(f"Concurrent update of {path}, merging the changed fields into the stored version")
+                    self._read_user_document(path, keep_base=True)
+                    continue
+                with self._log_lock:
+                    self._blob_states[path] = {'generation': generation, 'data': json.loads(json.dumps(merged)),
+                                               'base': json.loads(json.dumps(data))}
+                return StorageResult.success()
+            return _failure(f"Gave up saving {path} after {CONFLICT_MAX_ATTEMPTS} conflicting writes")
         except Exception as e:
-            st.error(f"Failed to save user data to GCS: {e}")
-            return False
+            return _failure(f"Failed to save user data: {e}", is_transient_error(e))
     
-    def load_user_data(self, username: str, data_type: str) -> Optional[Dict[str, Any]]:
-        """Load user-specific data from GCS"""
+    def _read_user_document(self, path: str, keep_base: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Download a user document in one request, recording its generation and content.
+        The content also becomes the base of the next save unless keep_base is set.
+        """
         try:
-            path = self._get_user_path(username, data_type)
-            blob = self.bucket.blob(path)
-            
-            if not blob.exists():
-                return None
-            
-            content = blob.download_as_string()
-            data_with_metadata = json.loads(content)
-            return data_with_metadata.get("data", {})
+            content, generation = self.backend.get(path)
+            data = json.loads(content).get("data", {})
+        except BlobNotFound:
+            generation, data = 0, None
+        with self._log_lock:
+            previous = self._blob_states.get(path) or {}
+            base = previous.get('base') if keep_base else data
+            # Copies: callers may modify the returned document
+            self._blob_states[path] = {'generation': generation, 'data': json.loads(json.dumps(data)),
+                                       'base': json.loads(json.dumps(base))}
+        return data
+    
+    def load_user_data(self, username: str, data_type: str) -> StorageResult:
+        """Load user-specific data; the result's value is None if there is none"""
+        try:
+            return StorageResult.success(self._read_user_document(self._get_user_path(username, data_type)))
         except Exception as e:
-            st.error(f"Failed to load user data from GCS: {e}")
-            return None
+            return _failure(f"Failed to load user data: {e}", is_transient_error(e))
     
-    def save_conversation(self, username: str, conversation_id: str, conversation_data: Dict[str, Any]) -> bool:
-        """Save conversation to GCS"""
+    def save_conversation(self, username: str, conversation_id: str, conversation_data: Dict[str, Any]) -> StorageResult:
+        """
+        Save a conversation and record it in the user's manifest
+        
+        A conversation is stored as a snapshot blob plus an append-only log of small
+        segments. When this process knows what was last persisted, only the messages not
+        persisted yet and the changed fields are written as a segment; otherwise a full
+        snapshot is written. A copy that is behind the stored conversation (e.g. another
+        tab added turns) therefore only adds its own turns and never drops the others.
+        """
+        if conversation_data.get("stub"):
+            # A stub only carries the manifest summary; saving it would wipe the stored messages
+            return _failure(f"Refusing to save unloaded conversation stub {conversation_id}", retryable=False)
+        
+        # The manifest entry doubles as the fence against compactions in other processes: a
+        # compaction records the snapshot's log_seq there before deleting folded segments, and
+        # every write below updates the entry conditionally, so it sees any such claim
+        wrote = False
         try:
-            path = self._get_conversation_path(username, conversation_id)
-            blob = self.bucket.blob(path)
-            
-            # Add metadata
-            data_with_metadata = {
-                "username": username,
-                "conversation_id": conversation_id,
-                "last_updated": time.time(),
-                "conversation": conversation_data
-            }
-            
-            blob.upload_from_string(
-                json.dumps(data_with_metadata, indent=2),
-                content_type='application/json'
-            )
-            return True
+            for attempt in range(CONFLICT_MAX_ATTEMPTS):
+                with self._log_lock:
+                    state = dict(self._conversation_logs.get((username, conversation_id)) or {})
+                try:
+                    if state:
+                        seq = self._append_segment(username, conversation_id, conversation_data, state)
+                    else:
+                        seq = self._write_snapshot(username, conversation_id, conversation_data)
+                except GenerationMismatch:
+                    # Another process wrote this conversation; catch up with it and append on top
+                    self._refresh_log_state(username, conversation_id)
+                    continue
+                if seq is None:
+                    break  # nothing changed since the last save
+                wrote = True
+                result, folded = self._record_in_manifest(username, conversation_id, conversation_data,
+                                                          seq, appended=bool(state))
+                if not folded:
+                    # Compact only after the manifest update, which would otherwise see this
+                    # process's own claim and take the segment for a lost one
+                    self._compact_if_needed(username, conversation_id)
+                    return result
+                # A compaction elsewhere folded past this segment, so readers ignore it: append again
+                print(f"Segment {seq} of conversation {conversation_id} was superseded by a compaction, rewriting")
+                self._refresh_log_state(username, conversation_id)
+            else:
+                return _failure(f"Gave up saving conversation {conversation_id} after {CONFLICT_MAX_ATTEMPTS} conflicting writes")
         except Exception as e:
-            st.error(f"Failed to save conversation to GCS: {e}")
-            return False
+            return _failure(f"Failed to save conversation: {e}", is_transient_error(e))
+        with self._log_lock:
+            pending = (username, conversation_id) in self._manifest_pending
+        if not (wrote or pending):
+            return StorageResult.success()
+        # An earlier attempt wrote before catching up with the stored conversation, or an
+        # earlier save wrote but could not update the manifest
+        with self._log_lock:
+            seq = (self._conversation_logs.get((username, conversation_id)) or {}).get('seq', 0)
+        result, _ = self._record_in_manifest(username, conversation_id, conversation_data, seq, appended=False)
+        return result
+    
+    def _record_in_manifest(self, username: str, conversation_id: str, conversation_data: Dict[str, Any],
+                            seq: int, appended: bool) -> Tuple[StorageResult, bool]:
+        """
+        Write a saved conversation's summary to the manifest; returns (result, folded).
+        folded is True (and the manifest untouched) if the appended segment seq is at or below
+        the log_seq a compaction has claimed, i.e. readers ignore it.
+        """
+        with self._log_lock:
+            state = self._conversation_logs.get((username, conversation_id), {})
+            size, message_count = state.get('size', 0), state.get('message_count')
+            snapshot_seq = state.get('snapshot_seq', 0)
+        summary = conversation_summary(conversation_id, conversation_data, size)
+        if message_count is not None:
+            summary["message_count"] = message_count
+        # seq changes on every append, so the entry is always written and a stale manifest is noticed
+        summary["seq"] = seq
+        folded = []
+        
+        def mutate(entries):
+            claimed = (entries.get(conversation_id) or {}).get("log_seq", 0)
+            if appended and claimed >= seq:
+                folded.append(claimed)
+                return
+            summary["log_seq"] = max(claimed, snapshot_seq)
+            entries[conversation_id] = summary
+        
+        result = self._update_manifest(username, mutate)
+        with self._log_lock:
+            if result:
+                self._manifest_pending.discard((username, conversation_id))
+            else:
+                self._manifest_pending.add((username, conversation_id))
+        return result, bool(folded)
+    
+    def _claim_compaction(self, username: str, conversation_id: str, log_seq: int) -> bool:
+        """Record in the manifest that the snapshot will cover segments up to log_seq; False if not recorded"""
+        claimed = []
+        
+        def mutate(entries):
+            entry = entries.get(conversation_id)
+            if entry is not None:
+                entry["log_seq"] = max(entry.get("log_seq", 0), log_seq)
+                claimed.append(entry["log_seq"])
+        
+        return bool(self._update_manifest(username, mutate)) and bool(claimed)
+
+    
+    def _append_segment(self, username: str, conversation_id: str, conversation_data: Dict[str, Any],
+                        state: Dict[str, Any]) -> Optional[int]:
+        """
+        Write the changes since the last save as the next segment; returns its seq, or None
+        if there were no changes. Raises GenerationMismatch if another writer appended first.
+        """
+        messages = conversation_data.get("messages", [])
+        hashes = _message_hashes(messages)
+        persisted = state['message_hashes']
+        common = 0
+        while common < min(len(persisted), len(hashes)) and persisted[common] == hashes[common]:
+            common += 1
+        # Normally everything after the persisted prefix; a stale copy contributes only its own turns
+        known = set(persisted[common:])
+        new = [index for index in range(common, len(messages)) if hashes[index] not in known]
+        
+        field_hashes = _field_hashes(conversation_data)
+        segment = {
+            "seq": state['seq'] + 1,
+            "written_at": time.time(),
+            "messages": [messages[index] for index in new],
+            "updates": {key: conversation_data[key] for key, digest in field_hashes.items()
+                        if state['field_hashes'].get(key) != digest},
+            "removed": [key for key in state['field_hashes'] if key not in field_hashes]
+        }
+        if not (segment["messages"] or segment["updates"] or segment["removed"]):
+            return None
+        
+        payload = json.dumps(segment, separators=(',', ':'))
+        # Create-only: raises GenerationMismatch if another writer already used this seq. A seq
+        # freed by a compaction elsewhere is caught by the manifest update (_record_in_manifest)
+        self.backend.put(self._get_segment_path(username, conversation_id, segment["seq"]), payload, if_generation_match=0)
+        
+        with self._log_lock:
+            state = self._conversation_logs[(username, conversation_id)]
+            state.update({
+                'message_count': state['message_count'] + len(new),
+                'message_hashes': state['message_hashes'] + [hashes[index] for index in new],
+                'seq': segment["seq"],
+                'field_hashes': field_hashes,
+                'size': state.get('size', 0) + len(payload)
+            })
+        return segment["seq"]
+    
+    def _write_snapshot(self, username: str, conversation_id: str, conversation_data: Dict[str, Any]) -> int:
+        """
+        Write a conversation this process has no log state for as its first snapshot and
+        return its log_seq. Create-only: raises GenerationMismatch if the conversation already exists.
+        """
+        segments = self._list_segments(username, conversation_id).get(conversation_id, [])
+        log_seq = max([seq for seq, _ in segments] + [0])
+        
+        size, generation = self._upload_snapshot(username, conversation_id, conversation_data, log_seq,
+                                                 if_generation_match=0)
+        with self._log_lock:
+            self._conversation_logs[(username, conversation_id)] = {
+                'message_count': len(conversation_data.get("messages", [])),
+                'message_hashes': _message_hashes(conversation_data.get("messages", [])),
+                'seq': log_seq,
+                'snapshot_seq': log_seq,
+                'snapshot_generation': generation,
+                'field_hashes': _field_hashes(conversation_data),
+                'size': size
+            }
+        if segments:
+            self._compaction_executor.submit(self._delete_segments, [name for _, name in segments])
+        return log_seq
     
-    def load_conversation(self, username: str, conversation_id: str) -> Optional[Dict[str, Any]]:
-        """Load conversation from GCS"""
+    def _refresh_log_state(self, username: str, conversation_id: str):
+        """Reload this process's log state of a conversation from storage (dropped if it no longer exists)"""
         try:
-            path = self._get_conversation_path(username, conversation_id)
-            blob = self.bucket.blob(path)
-            
-            if not blob.exists():
-                print(f"Conversation blob does not exist: {path}")
-                return None
-            
-            content = blob.download_as_string()
+            stored, _ = self._download_conversation(username, conversation_id)
+        except BlobNotFound:
+            stored = None
+        if not stored:
+            with self._log_lock:
+                self._conversation_logs.pop((username, conversation_id), None)
+    
+    def _upload_snapshot(self, username: str, conversation_id: str, conversation_data: Dict[str, Any],
+                         log_seq: int, if_generation_match: Optional[int] = None) -> Tuple[int, int]:
+        """Upload a snapshot that includes every segment up to log_seq; returns (size, generation)"""
+        data_with_metadata = {
+            "username": username,
+            "conversation_id": conversation_id,
+            "last_updated": time.time(),
+            "log_seq": log_seq,
+            "conversation": conversation_data
+        }
+        # Compact JSON: snapshots can be large
+        payload = json.dumps(data_with_metadata, separators=(',', ':'))
+        generation = self.backend.put(self._get_conversation_path(username, conversation_id), payload,
+                                      if_generation_match=if_generation_match)
+        return len(payload.encode('utf-8')), generation
+    
+    def _list_segments(self, username: str, conversation_id: Optional[str] = None) -> Dict[str, List[Tuple[int, str]]]:
+        """Segments (seq, blob name) per conversation id, in seq order, with one list request"""
+        prefix = self._get_segment_prefix(username)
+        segments: Dict[str, List[Tuple[int, str]]] = {}
+        for name in self.backend.list(self._get_segment_prefix(username, conversation_id)):
+            conv_id, _, filename = name[len(prefix):].rpartition('/')
+            if conv_id and filename.endswith('.json') and filename[:-5].isdigit():
+                segments.setdefault(conv_id, []).append((int(filename[:-5]), name))
+        for entries in segments.values():
+            entries.sort()
+        return segments
+    
+    def _delete_segments(self, blob_names: List[str]):
+        """Delete folded segments (background; failures only leave harmless garbage)"""
+        for name in blob_names:
+            try:
+                self.backend.delete(name)
+            except Exception as e:
+                print(f"Failed to delete conversation segment {name}: {e}")
+    
+    def _compact_if_needed(self, username: str, conversation_id: str):
+        """Schedule a compaction once COMPACT_AFTER_SEGMENTS segments follow the snapshot"""
+        with self._log_lock:
+            state = self._conversation_logs.get((username, conversation_id))
+            needs_compaction = bool(state) and state['seq'] - state['snapshot_seq'] >= COMPACT_AFTER_SEGMENTS
+        if needs_compaction:
+            self._schedule_compaction(username, conversation_id)
+    
+    def _schedule_compaction(self, username: str, conversation_id: str):
+        """Fold a conversation's segments into its snapshot in the background"""
+        key = (username, conversation_id)
+        with self._log_lock:
+            if key in self._compacting:
+                return
+            self._compacting.add(key)
+        
+        def run():
+            try:
+                self.compact_conversation(username, conversation_id)
+            except Exception as e:
+                print(f"Compaction of conversation {conversation_id} failed: {e}")
+            finally:
+                with self._log_lock:
+                    self._compacting.discard(key)
+        
+        self._compaction_executor.submit(run)
+    
+    def compact_conversation(self, username: str, conversation_id: str) -> bool:
+        """
+        Fold all segments of a conversation into a new snapshot and delete them
+        
+        The snapshot is replaced only if it has not changed since it was read, so a
+        concurrent full save always wins over the compaction. The new log_seq is claimed
+        in the manifest first, so a writer that reuses a deleted segment's seq notices.
+        """
+        content, generation = self.backend.get(self._get_conversation_path(username, conversation_id))
+        data_with_metadata = json.loads(content)
+        conversation_data = data_with_metadata.get("conversation", {})
+        log_seq = data_with_metadata.get("log_seq", 0)
+        
+        segments = self._list_segments(username, conversation_id).get(conversation_id, [])
+        new_segments = [(seq, name) for seq, name in segments if seq > log_seq]
+        if new_segments:
+            contents = self.backend.get_many([name for _, name in new_segments])
+            for _, name in new_segments:
+                if contents[name] is None:
+                    return False  # deleted by a concurrent compaction
+                _apply_segment(conversation_data, json.loads(contents[name][0]))
+            new_seq = new_segments[-1][0]
+            if not self._claim_compaction(username, conversation_id, new_seq):
+                return False
+            try:
+                size, new_generation = self._upload_snapshot(username, conversation_id, conversation_data, new_seq,
+                                                             if_generation_match=generation)
+            except GenerationMismatch:
+                return False
+            with self._log_lock:
+                state = self._conversation_logs.get((username, conversation_id))
+                # Only a state that was current and already covers every folded segment moves on to the
+                # new snapshot; a stale one keeps the old generation and is refreshed on its next append
+                if state and state['snapshot_generation'] == generation and state['seq'] >= new_seq:
+                    state['snapshot_seq'] = new_seq
+                    state['snapshot_generation'] = new_generation
+                    state['size'] = size
+            log_seq = new_seq
+        
+        self._delete_segments([name for seq, name in segments if seq <= log_seq])
+        return True
+    
+    def load_conversation(self, username: str, conversation_id: str) -> StorageResult:
+        """Load a conversation; the result's value is the conversation dict"""
+        try:
+            conversation_data, _ = self._download_conversation(username, conversation_id)
+        except BlobNotFound:
+            return _failure(f"Conversation blob does not exist: {self._get_conversation_path(username, conversation_id)}",
+                            retryable=False)
+        except json.JSONDecodeError as e:
+            return _failure(f"JSON decode error for conversation {conversation_id}: {e}", retryable=False)
+        except Exception as e:
+            return _failure(f"Failed to load conversation {conversation_id}: {e}", is_transient_error(e))
+        if not conversation_data:
+            return _failure(f"Empty conversation data for {conversation_id}", retryable=False)
+        return StorageResult.success(conversation_data)
+    
+    def _download_conversation(self, username: str, conversation_id: str,
+                               segments: Optional[List[Tuple[int, str]]] = None) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Download a conversation snapshot (one request, no exists() probe) and merge the
+        message-log segments written after it (fetched as one batch)
+        
+        A listed segment that has disappeared was folded into a newer snapshot by a
+        concurrent compaction, so the snapshot is then re-read and the merge retried.
+        
+        Args:
+            segments: The conversation's (seq, blob name) segments if already listed
+        
+        Returns:
+            (conversation dict or None if empty, stored size in bytes); raises BlobNotFound if missing
+        """
+        for _ in range(CONFLICT_MAX_ATTEMPTS):
+            content, generation = self.backend.get(self._get_conversation_path(username, conversation_id))
             data_with_metadata = json.loads(content)
             conversation_data = data_with_metadata.get("conversation", {})
-            
             if not conversation_data:
                 print(f"Empty conversation data for {conversation_id}")
-                return None
-                
-            return conversation_data
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error for conversation {conversation_id}: {e}")
-            return None
-        except Exception as e:
-            print(f"Failed to load conversation {conversation_id} from GCS: {e}")
-            return None
+                return None, len(content)
+            
+            log_seq = data_with_metadata.get("log_seq", 0)
+            if segments is None:
+                segments = self._list_segments(username, conversation_id).get(conversation_id, [])
+            new_segments = [(seq_number, name) for seq_number, name in segments if seq_number > log_seq]
+            contents = self.backend.get_many([name for _, name in new_segments])
+            if all(contents[name] is not None for _, name in new_segments):
+                break
+            segments = None  # list again along with the newer snapshot
+        else:
+            raise StorageError(f"Conversation {conversation_id} kept changing while it was loaded", retryable=True)
+        
+        size = len(content)
+        for _, name in new_segments:
+            segment_content = contents[name][0]
+            _apply_segment(conversation_data, json.loads(segment_content))
+            size += len(segment_content)
+        # Numbering continues after the snapshot's log_seq even when no segment follows it
+        seq = new_segments[-1][0] if new_segments else log_seq
+        
+        with self._log_lock:
+            self._conversation_logs[(username, conversation_id)] = {
+                'message_count': len(conversation_data.get("messages", [])),
+                'message_hashes': _message_hashes(conversation_data.get("messages", [])),
+                'seq': seq,
+                'snapshot_seq': log_seq,
+                'snapshot_generation': generation,
+                'field_hashes': _field_hashes(conversation_data),
+                'size': size
+            }
+        if seq - log_seq >= COMPACT_AFTER_SEGMENTS:
+            self._schedule_compaction(username, conversation_id)
+        return conversation_data, size
+    
+    def load_conversations(self, username: str, conversation_ids: List[str], max_workers: int = CONVERSATION_LOAD_WORKERS,
+                           deadline_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Load many conversations concurrently
+        
+        Args:
+            username: Owner of the conversations
+            conversation_ids: Conversations to load (duplicates are ignored)
+            max_workers: Upper bound on concurrent storage requests
+            deadline_seconds: Return whatever has loaded after this many seconds (no limit when None)
+        
+        Returns:
+            Dict with 'conversations' (id -> conversation), 'sizes' (id -> stored bytes),
+            'failed' (id -> error message) and 'pending' (ids not loaded before the deadline)
+        """
+        unique_ids = list(dict.fromkeys(conv_id for conv_id in conversation_ids if conv_id))
+        result = {'conversations': {}, 'sizes': {}, 'failed': {}, 'pending': []}
+        if not unique_ids:
+            return result
+        
+        deadline = time.monotonic() + deadline_seconds if deadline_seconds is not None else None
+        # One list request covers the message-log segments of every conversation
+        segments = self._list_segments(username)
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_ids))),
+                                      thread_name_prefix="conversation-load")
+        futures = {
+            executor.submit(self._download_conversation, username, conv_id, segments.get(conv_id, [])): conv_id
+            for conv_id in unique_ids
+        }
+        pending = set(futures)
+        try:
+            while pending:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    conv_id = futures[future]
+                    try:
+                        conversation_data, size = future.result()
+                    except BlobNotFound:
+                        result['failed'][conv_id] = "not found"
+                        continue
+                    except Exception as e:
+                        result['failed'][conv_id] = str(e)
+                        continue
+                    if conversation_data:
+                        result['conversations'][conv_id] = conversation_data
+                        result['sizes'][conv_id] = size
+                    else:
+                        result['failed'][conv_id] = "empty conversation"
+                if not done and timeout == 0.0:
+                    break
+        finally:
+            # Downloads still running finish in the background; queued ones are dropped
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        result['pending'] = [futures[future] for future in pending]
+        if result['failed'] or result['pending']:
+            print(f"Loaded {len(result['conversations'])}/{len(unique_ids)} conversations for {username}: "
+                  f"{len(result['failed'])} failed, {len(result['pending'])} past the deadline")
+        return result
     
     def list_user_conversations(self, username: str) -> List[str]:
         """List all conversation IDs for a user"""
         try:
             prefix = f"user-data/users/{username}/conversations/"
-            blobs = self.bucket.list_blobs(prefix=prefix)
             
             conversation_ids = []
-            for blob in blobs:
+            for name in self.backend.list(prefix):
                 # Extract conversation ID from blob name
-                filename = os.path.basename(blob.name)
+                filename = os.path.basename(name)
                 if filename.endswith('.json'):
                     conversation_id = filename[:-5]  # Remove .json extension
                     conversation_ids.append(conversation_id)
             
             return conversation_ids
         except Exception as e:
-            st.error(f"Failed to list user conversations: {e}")
+            print(f"Failed to list user conversations: {e}")
             return []
     
-    def save_user_session(self, username: str, session_id: str, session_data: Dict[str, Any]) -> bool:
-        """Save user session to GCS"""
+    def save_user_session(self, username: str, session_id: str, session_data: Dict[str, Any]) -> StorageResult:
+        """Save a user session"""
         try:
             path = self._get_session_path(username, session_id)
-            blob = self.bucket.blob(path)
             
             # Add metadata
             data_with_metadata = {
@@ -146,63 +662,136 @@ class GCSUserStorage:
                 "session": session_data
             }
             
-            blob.upload_from_string(
-                json.dumps(data_with_metadata, indent=2),
-                content_type='application/json'
-            )
-            return True
+            self.backend.put(path, json.dumps(data_with_metadata, indent=2))
+            return StorageResult.success()
         except Exception as e:
-            st.error(f"Failed to save user session to GCS: {e}")
-            return False
+            return _failure(f"Failed to save user session: {e}", is_transient_error(e))
     
-    def load_user_session(self, username: str, session_id: str) -> Optional[Dict[str, Any]]:
-        """Load user session from GCS"""
+    def load_user_session(self, username: str, session_id: str) -> StorageResult:
+        """Load a user session; the result's value is None if it does not exist"""
         try:
-            path = self._get_session_path(username, session_id)
-            blob = self.bucket.blob(path)
-            
-            if not blob.exists():
-                return None
-            
-            content = blob.download_as_string()
-            data_with_metadata = json.loads(content)
-            return data_with_metadata.get("session", {})
+            content, _ = self.backend.get(self._get_session_path(username, session_id))
+        except BlobNotFound:
+            return StorageResult.success(None)
         except Exception as e:
-            st.error(f"Failed to load user session from GCS: {e}")
-            return None
+            return _failure(f"Failed to load user session: {e}", is_transient_error(e))
+        try:
+            return StorageResult.success(json.loads(content).get("session", {}))
+        except json.JSONDecodeError as e:
+            return _failure(f"Failed to load user session: {e}", is_transient_error(e))
     
-    def delete_user_data(self, username: str, data_type: str) -> bool:
-        """Delete user-specific data from GCS"""
+    def delete_user_data(self, username: str, data_type: str) -> StorageResult:
+        """Delete user-specific data"""
         try:
             path = self._get_user_path(username, data_type)
-            blob = self.bucket.blob(path)
-            
-            if blob.exists():
-                blob.delete()
-            return True
+            self.backend.delete(path)
+            with self._log_lock:
+                self._blob_states[path] = {'generation': 0}
+            return StorageResult.success()
         except Exception as e:
-            st.error(f"Failed to delete user data from GCS: {e}")
-            return False
+            return _failure(f"Failed to delete user data: {e}", is_transient_error(e))
     
-    def delete_conversation(self, username: str, conversation_id: str) -> bool:
-        """Delete conversation from GCS"""
+    def delete_conversation(self, username: str, conversation_id: str) -> StorageResult:
+        """Delete a conversation and remove it from the user's manifest"""
         try:
-            path = self._get_conversation_path(username, conversation_id)
-            blob = self.bucket.blob(path)
-            
-            if blob.exists():
-                blob.delete()
-            return True
+            self.backend.delete(self._get_conversation_path(username, conversation_id))
+            segments = self._list_segments(username, conversation_id).get(conversation_id, [])
+            self._delete_segments([name for _, name in segments])
         except Exception as e:
-            st.error(f"Failed to delete conversation from GCS: {e}")
-            return False
+            return _failure(f"Failed to delete conversation: {e}", is_transient_error(e))
+        
+        with self._log_lock:
+            self._conversation_logs.pop((username, conversation_id), None)
+        return self._update_manifest(username, lambda entries: entries.pop(conversation_id, None))
     
-    def sync_user_data_to_gcs(self, username: str, local_data: Dict[str, Any]) -> bool:
-        """Sync all user data from local session state to GCS"""
+    def load_manifest(self, username: str) -> Tuple[Optional[Dict[str, Dict[str, Any]]], int]:
+        """
+        Load the user's conversation manifest
+        
+        Returns:
+            (conversation id -> summary, or None if there is no manifest yet; blob generation, 0 if absent)
+        """
+        try:
+            content, generation = self.backend.get(self._get_manifest_path(username))
+        except BlobNotFound:
+            return None, 0
+        entries = json.loads(content).get("conversations", {})
+        with self._log_lock:
+            self._manifests[username] = (entries, generation)
+        return json.loads(json.dumps(entries)), generation
+    
+    def _write_manifest(self, username: str, entries: Dict[str, Dict[str, Any]], if_generation_match: Optional[int] = None):
+        """Upload the manifest; if_generation_match=0 only creates it, None overwrites unconditionally"""
+        manifest = {
+            "username": username,
+            "last_updated": time.time(),
+            "conversations": entries
+        }
+        generation = self.backend.put(self._get_manifest_path(username), json.dumps(manifest, separators=(',', ':')),
+                                      if_generation_match=if_generation_match)
+        with self._log_lock:
+            self._manifests[username] = (json.loads(json.dumps(entries)), generation)
+    
+    def _update_manifest(self, username: str, mutate: Callable[[Dict[str, Dict[str, Any]]], Any]) -> StorageResult:
+        """
+        Read-modify-write of the manifest guarded by the blob generation, so concurrent
+        saves from several sessions never drop each other's entries. The last known
+        manifest is reused instead of re-read, and unchanged manifests are not written.
+        """
+        for _ in range(MANIFEST_MAX_ATTEMPTS):
+            try:
+                with self._log_lock:
+                    cached = self._manifests.get(username)
+                if cached is not None:
+                    entries, generation = json.loads(json.dumps(cached[0])), cached[1]
+                else:
+                    entries, generation = self.load_manifest(username)
+                    if entries is None:
+                        # First write for this user: index the conversations that already exist
+                        entries = self._scan_conversation_summaries(username)
+                before = _content_hash(entries) if generation else None
+                mutate(entries)
+                if before is not None and _content_hash(entries) == before:
+                    return StorageResult.success()
+                self._write_manifest(username, entries, if_generation_match=generation)
+                return StorageResult.success()
+            except GenerationMismatch:
+                with self._log_lock:
+                    self._manifests.pop(username, None)
+                continue
+            except Exception as e:
+                return _failure(f"Failed to update conversation manifest for {username}: {e}", is_transient_error(e))
+        return _failure(f"Gave up updating conversation manifest for {username} after {MANIFEST_MAX_ATTEMPTS} conflicting writes")
+    
+    def _scan_conversation_summaries(self, username: str) -> Dict[str, Dict[str, Any]]:
+        """Build manifest entries by reading every stored conversation (slow; migration only)"""
+        loaded = self.load_conversations(username, self.list_user_conversations(username))
+        for conv_id, error in loaded['failed'].items():
+            print(f"Skipping conversation {conv_id} in manifest rebuild: {error}")
+        return {
+            conv_id: conversation_summary(conv_id, conv_data, loaded['sizes'][conv_id])
+            for conv_id, conv_data in loaded['conversations'].items()
+        }
+    
+    def rebuild_manifest(self, username: str) -> int:
+        """Rebuild the manifest from the stored conversations; returns the number of entries"""
+        entries = self._scan_conversation_summaries(username)
+        self._write_manifest(username, entries)
+        return len(entries)
+    
+    def list_users(self) -> List[str]:
+        """List all usernames that have stored data"""
+        prefix = "user-data/users/"
+        return sorted(p[len(prefix):].rstrip("/") for p in self.backend.list_prefixes(prefix))
+    
+    def sync_user_data_to_gcs(self, username: str, local_data: Dict[str, Any]) -> StorageResult:
+        """Sync all user data from local session state to storage"""
         try:
             # Save conversations
             conversations = local_data.get('conversations', {})
             for conv_id, conv_data in conversations.items():
+                if conv_data.get('stub'):
+                    continue  # never loaded in this session, nothing changed
                 self.save_conversation(username, conv_id, conv_data)
             
             # Save other user data
@@ -214,38 +803,33 @@ class GCSUserStorage:
                 'active_conversation_id': local_data.get('active_conversation_id')
             }
             
-            self.save_user_data(username, 'user_preferences', user_data)
-            return True
+            return self.save_user_data(username, 'user_preferences', user_data)
         except Exception as e:
-            st.error(f"Failed to sync user data to GCS: {e}")
-            return False
+            return _failure(f"Failed to sync user data: {e}", is_transient_error(e))
     
-    def load_user_data_from_gcs(self, username: str) -> Dict[str, Any]:
-        """Load all user data from GCS"""
+    def load_user_data_from_gcs(self, username: str) -> StorageResult:
+        """Load all user data; the result's value is the session state dict"""
         try:
-            print(f"Loading user data from GCS for user: {username}")
+            print(f"Loading user data for user: {username}")
             
             # Load user preferences
-            user_preferences = self.load_user_data(username, 'user_preferences') or {}
+            preferences_result = self.load_user_data(username, 'user_preferences')
+            if not preferences_result:
+                return preferences_result
+            user_preferences = preferences_result.value or {}
             print(f"Loaded user preferences: {list(user_preferences.keys())}")
             
-            # Load conversations
-            conversation_ids = self.list_user_conversations(username)
-            print(f"Found {len(conversation_ids)} conversations for user {username}")
-            
-            conversations = {}
-            failed_conversations = []
-            for conv_id in conversation_ids:
-                conv_data = self.load_conversation(username, conv_id)
-                if conv_data:
-                    conversations[conv_id] = conv_data
-                    print(f"Loaded conversation: {conv_id}")
-                else:
-                    failed_conversations.append(conv_id)
-                    print(f"Failed to load conversation: {conv_id}")
-            
-            if failed_conversations:
-                print(f"Failed to load {len(failed_conversations)} conversations: {failed_conversations}")
+            # Load the conversation manifest only; bodies are loaded when a conversation is opened
+            entries, _ = self.load_manifest(username)
+            if entries is None:
+                print(f"No conversation manifest for {username}, building it from stored conversations")
+                entries = self._scan_conversation_summaries(username)
+                try:
+                    self._write_manifest(username, entries, if_generation_match=0)
+                except GenerationMismatch:
+                    pass  # another session created it meanwhile
+            conversations = {conv_id: conversation_stub(summary) for conv_id, summary in entries.items()}
+            print(f"Found {len(conversations)} conversations for user {username}")
             
             # Removed 'active_conversation_id' from result - never persist this, always show New Analysis page on login
             result = {
@@ -257,8 +841,6 @@ class GCSUserStorage:
             }
             
             print(f"Successfully loaded user data for {username}: {len(conversations)} conversations")
-            return result
+            return StorageResult.success(result)
         except Exception as e:
-            print(f"Failed to load user data from GCS for {username}: {e}")
-            st.error(f"Failed to load user data from GCS: {e}")
-            return {}
+            return _failure(f"Failed to load user data for {username}: {e}", is_transient_error(e))
@@ -0,0 +1,139 @@
+# app/paper_store.py
+"""
+Content-addressed paper store
+Paper texts (abstract + content) are stored once under the SHA-256 of
+their canonical JSON, so a paper retrieved by dozens of conversations is kept
+and uploaded once. Conversations store only lightweight references to them
+(see paper_reference) and resolve the texts when a follow-up needs them.
+Blobs are gzip-compressed and immutable: writes use if_generation_match=0 and
+an existing blob is simply reused.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from storage_backend import BlobNotFound, GenerationMismatch, StorageBackend
+
+PAPER_STORE_PREFIX = "user-data/paper-store/"
+PAPER_STORE_WORKERS = 16
+
+# Metadata kept inline in a conversation's paper references
+REFERENCE_METADATA_FIELDS = ('title', 'url', 'doi_url', 'link', 'publication_date')
+
+
+def paper_text(paper: Dict[str, Any]) -> Dict[str, str]:
+    """The stored (deduplicated) part of a paper"""
+    return {
+        'abstract': paper.get('metadata', {}).get('abstract') or '',
+        'content': paper.get('content') or ''
+    }
+
+
+def content_key(text: Dict[str, str]) -> str:
+    """SHA-256 of the canonical JSON of a paper text"""
+    return hashlib.sha256(json.dumps(text, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def paper_reference(paper: Dict[str, Any], key: Optional[str]) -> Dict[str, Any]:
+    """Lightweight reference to a paper: id, title, links, score and the key of its text"""
+    metadata = paper.get('metadata', {})
+    reference = {
+        'paper_id': paper.get('paper_id'),
+        'metadata': {field: metadata[field] for field in REFERENCE_METADATA_FIELDS if metadata.get(field)},
+        'relevance_score': paper.get('relevance_score')
+    }
+    if key:
+        reference['content_ref'] = key
+    return reference
+
+
+class PaperContentStore:
+    """Store of paper texts keyed by content hash on a storage backend, with a small in-memory LRU"""
+
+    def __init__(self, backend: StorageBackend, prefix: str = PAPER_STORE_PREFIX, memory_entries: int = 512):
+        self.backend = backend
+        self.prefix = prefix
+        self.memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        # Keys known to exist in storage, so repeated saves don't re-upload
+        self._stored_keys = set()
+
+    def _blob_name(self, key: str) -> str:
+        return f"{self.prefix}{key[:2]}/{key}.json.gz"
+
+    def put(self, text: Dict[str, str]) -> str:
+        """Store a paper text (if not already stored) and return its key"""
+        key = content_key(text)
+        with self._lock:
+            if key in self._stored_keys:
+                return key
+        # Metadata request only: after a restart most texts are already stored
+        if not self.backend.generation(self._blob_name(key)):
+            payload = gzip.compress(json.dumps(text, separators=(',', ':')).encode('utf-8'))
+            try:
+                self.backend.put(self._blob_name(key), payload, content_type='application/gzip', if_generation_match=0)
+            except GenerationMismatch:
+                pass  # same content stored concurrently
+        with self._lock:
+            self._stored_keys.add(key)
+            self._remember(key, text)
+        return key
+
+    def put_many(self, texts: List[Dict[str, str]]) -> List[Optional[str]]:
+        """Store several texts concurrently; returns their keys (None where the upload failed)"""
+        def store(text):
+            try:
+                return self.put(text)
+            except Exception as e:
+                print(f"Failed to store paper text: {e}")
+                return None
+
+        if not texts:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(PAPER_STORE_WORKERS, len(texts)))) as executor:
+            return list(executor.map(store, texts))
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """Return the text stored under key, or None if it does not exist"""
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                return text
+        try:
+            payload, _ = self.backend.get(self._blob_name(key))
+        except BlobNotFound:
+            return None
+        text = json.loads(gzip.decompress(payload))
+        with self._lock:
+            self._stored_keys.add(key)
+            self._remember(key, text)
+        return text
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Optional[Dict[str, str]]]:
+        """Resolve several keys concurrently; failed or missing keys map to None"""
+        def fetch(key):
+            try:
+                return self.get(key)
+            except Exception as e:
+                print(f"Failed to load paper text {key}: {e}")
+                return None
+
+        unique_keys = list(dict.fromkeys(key for key in keys if key))
+        if not unique_keys:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(PAPER_STORE_WORKERS, len(unique_keys)))) as executor:
+            return dict(zip(unique_keys, executor.map(fetch, unique_keys)))
+
+    def _remember(self, key: str, text: Dict[str, str]):
+        """Add to the memory LRU (caller holds the lock)"""
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
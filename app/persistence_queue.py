@@ -0,0 +1,170 @@
+# app/persistence_queue.py
+"""
+Write-behind persistence queue
+User documents (preferences, conversations) are written to GCS by background
+workers instead of in the Streamlit render path. Writes are keyed by the blob
+they target, so repeated saves of the same document coalesce into one upload of
+the latest state. Failed writes are retried with exponential backoff and full
+jitter (which also absorbs GCS 429s), unless the failure is permanent. The queue is flushed on logout and at
+process exit.
+"""
+
+import atexit
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from storage_backend import is_transient_error
+
+PERSISTENCE_WORKERS = 2
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+EXIT_FLUSH_TIMEOUT_SECONDS = 20.0
+
+
+class WriteBehindQueue:
+    """
+    Coalescing background write queue
+
+    A job is a callable returning a truthy value on success, e.g. a StorageResult
+    (a falsy result or a transient exception, including a StorageError marked
+    retryable, means retry; a result whose retryable attribute is False and any
+    other exception fail at once). Keys are tuples whose second element is the owning username, which
+    lets flush() wait for a single user's writes.
+    """
+
+    def __init__(self, workers: int = PERSISTENCE_WORKERS, max_attempts: int = MAX_ATTEMPTS,
+                 backoff_base: float = BACKOFF_BASE_SECONDS, backoff_max: float = BACKOFF_MAX_SECONDS):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, Dict[str, Any]] = {}
+        self._stats = {'submitted': 0, 'coalesced': 0, 'completed': 0, 'failed': 0, 'retries': 0,
+                       'last_latency': 0.0, 'max_latency': 0.0, 'total_latency': 0.0}
+
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"persistence-{i}", daemon=True).start()
+
+    def submit(self, key: Hashable, job: Callable[[], Any]):
+        """Queue job for key, replacing a not yet started job for the same key"""
+        now = time.monotonic()
+        with self._cond:
+            self._stats['submitted'] += 1
+            previous = self._pending.pop(key, None)
+            if previous is not None:
+                self._stats['coalesced'] += 1
+            self._pending[key] = {
+                'job': job,
+                # Latency is measured from the oldest write this job stands for
+                'enqueued_at': previous['enqueued_at'] if previous else now,
+                'attempt': 0,
+                'not_before': now
+            }
+            self._cond.notify()
+
+    def flush(self, timeout: Optional[float] = None, owner: Optional[str] = None) -> bool:
+        """
+        Wait until queued writes (only owner's when given) have completed or given up
+
+        Retry backoff is skipped while flushing. Returns False if timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            for entry in self._pending.values():
+                entry['not_before'] = 0.0
+            self._cond.notify_all()
+            while self._has_work(owner):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, in-flight writes, counters and flush latency (seconds, enqueue to completion)"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['depth'] = len(self._pending)
+            stats['in_flight'] = len(self._in_flight)
+        finished = stats['completed'] + stats['failed']
+        stats['avg_latency'] = stats.pop('total_latency') / finished if finished else 0.0
+        return stats
+
+    def _has_work(self, owner: Optional[str]) -> bool:
+        keys = list(self._pending) + list(self._in_flight)
+        if owner is None:
+            return bool(keys)
+        return any(isinstance(key, tuple) and len(key) > 1 and key[1] == owner for key in keys)
+
+    def _next_job(self):
+        """Wait for and claim the next runnable job (caller holds the lock)"""
+        while True:
+            now = time.monotonic()
+            wake_at = None
+            for key, entry in self._pending.items():
+                if key in self._in_flight:
+                    continue  # one write per key at a time; the newer one runs afterwards
+                if entry['not_before'] <= now:
+                    del self._pending[key]
+                    self._in_flight[key] = entry
+                    return key, entry
+                wake_at = entry['not_before'] if wake_at is None else min(wake_at, entry['not_before'])
+            self._cond.wait(None if wake_at is None else max(0.0, wake_at - now))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                key, entry = self._next_job()
+
+            try:
+                result = entry['job']()
+                succeeded = bool(result)
+                retryable = getattr(result, 'retryable', True)
+                error = getattr(result, 'error', None)
+            except Exception as e:
+                print(f"Background write {key} failed: {e}")
+                succeeded, retryable, error = False, is_transient_error(e), str(e)
+
+            with self._cond:
+                del self._in_flight[key]
+                if succeeded or not retryable or entry['attempt'] + 1 >= self.max_attempts:
+                    latency = time.monotonic() - entry['enqueued_at']
+                    self._stats['completed' if succeeded else 'failed'] += 1
+                    self._stats['last_latency'] = latency
+                    self._stats['max_latency'] = max(self._stats['max_latency'], latency)
+                    self._stats['total_latency'] += latency
+                    if not (succeeded or retryable):
+                        print(f"Background write {key} failed permanently: {error}")
+                    elif not succeeded:
+                        print(f"Giving up on background write {key} after {self.max_attempts} attempts")
+                elif key not in self._pending:
+                    # Retry unless a newer write for the same key superseded this one
+                    entry['attempt'] += 1
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** entry['attempt']))
+                    entry['not_before'] = time.monotonic() + delay
+                    self._pending[key] = entry
+                    self._stats['retries'] += 1
+                else:
+                    self._stats['coalesced'] += 1
+                self._cond.notify_all()
+
+
+_queue_lock = threading.Lock()
+_queue: Optional[WriteBehindQueue] = None
+
+
+def get_persistence_queue() -> WriteBehindQueue:
+    """Return the process-wide queue, starting it (and its exit-time flush) on first use"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteBehindQueue()
+                atexit.register(_queue.flush, EXIT_FLUSH_TIMEOUT_SECONDS)
+    return _queue
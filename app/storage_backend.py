@@ -0,0 +1,370 @@
+# app/storage_backend.py
+"""
+Pluggable blob storage for user documents and paper texts
+GCSUserStorage and PaperContentStore only need a handful of blob operations
+(get, put, conditional put, list, delete, batch get), so they go through this
+interface instead of google.cloud.storage directly. Three backends share it:
+- GCSBackend: a GCS bucket (the production backend)
+- LocalBackend: a directory on local disk; writes go to a temporary file that is
+  atomically renamed into place, reads can optionally use mmap
+- MemoryBackend: a process-local dict, for benchmarks and tests
+
+Every blob has a generation that changes on each write, so callers can make
+writes conditional (if_generation_match=0 means "only create"). The backend is
+selected by the 'storage' section of config.yaml (see build_storage_backend).
+"""
+
+import mmap
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+BATCH_GET_WORKERS = 16
+DEFAULT_LOCAL_STORAGE_PATH = ".cache/user-storage"
+# Local files smaller than this are read normally even with mmap reads enabled
+MMAP_MIN_BYTES = 64 * 1024
+# HTTP statuses of backend errors that are worth retrying
+TRANSIENT_HTTP_CODES = (408, 429)
+
+
+class StorageError(Exception):
+    """
+    Base class of storage backend errors
+
+    retryable marks contention (a write conflict, an object that kept changing) that
+    may clear up when the operation is retried; other storage errors are permanent.
+    """
+
+    retryable = False
+
+    def __init__(self, *args, retryable: Optional[bool] = None):
+        super().__init__(*args)
+        if retryable is not None:
+            self.retryable = retryable
+
+
+class BlobNotFound(StorageError):
+    """The requested blob does not exist"""
+
+
+class GenerationMismatch(StorageError):
+    """A conditional write found a different generation than required"""
+
+    retryable = True
+
+
+class StorageResult:
+    """
+    Outcome of a storage operation, returned instead of reporting errors to the UI
+
+    Truthy on success; value holds what was loaded (if anything) and error the
+    message of a failure. retryable is False for failures that would fail again
+    (e.g. a rejected or malformed document), so callers do not retry them.
+    """
+
+    __slots__ = ('ok', 'value', 'error', 'retryable')
+
+    def __init__(self, ok: bool, value: Any = None, error: Optional[str] = None, retryable: bool = True):
+        self.ok = ok
+        self.value = value
+        self.error = error
+        self.retryable = retryable
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+    def __repr__(self) -> str:
+        return f"StorageResult(ok={self.ok}, error={self.error!r})"
+
+    @classmethod
+    def success(cls, value: Any = None) -> "StorageResult":
+        return cls(True, value)
+
+    @classmethod
+    def failure(cls, error: str, retryable: bool = True) -> "StorageResult":
+        return cls(False, error=error, retryable=retryable)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether a failed storage call may succeed when retried: contention, connection errors, timeouts, HTTP 408/429/5xx"""
+    if isinstance(error, StorageError):
+        return error.retryable
+    code = getattr(error, 'code', None)  # HTTP status of google.api_core errors
+    if isinstance(code, int):
+        return code in TRANSIENT_HTTP_CODES or code >= 500
+    # Connection errors and timeouts (requests' included) are OSErrors; a denied local write is not transient
+    return isinstance(error, OSError) and not isinstance(error, PermissionError)
+
+
+class StorageBackend(ABC):
+    """Interface of a blob store addressed by '/'-separated names"""
+
+    @abstractmethod
+    def get(self, name: str) -> Tuple[bytes, int]:
+        """Return (content, generation); raises BlobNotFound if the blob does not exist"""
+
+    @abstractmethod
+    def put(self, name: str, data: Union[bytes, str], content_type: str = 'application/json',
+            if_generation_match: Optional[int] = None) -> int:
+        """
+        Write a blob and return its new generation
+
+        if_generation_match=None overwrites unconditionally, 0 only creates the blob and
+        any other value only replaces that generation; otherwise GenerationMismatch is raised.
+        """
+
+    def generation(self, name: str) -> int:
+        """Current generation of a blob without downloading it; 0 if it does not exist"""
+        try:
+            return self.get(name)[1]
+        except BlobNotFound:
+            return 0
+
+    @abstractmethod
+    def list(self, prefix: str) -> List[str]:
+        """Names of all blobs starting with prefix"""
+
+    @abstractmethod
+    def list_prefixes(self, prefix: str) -> List[str]:
+        """Immediate 'subdirectories' of prefix (which should end with '/'), each ending with '/'"""
+
+    @abstractmethod
+    def delete(self, name: str) -> bool:
+        """Delete a blob; False if it did not exist"""
+
+    def get_many(self, names: Iterable[str], max_workers: int = BATCH_GET_WORKERS) -> Dict[str, Optional[Tuple[bytes, int]]]:
+        """Fetch several blobs concurrently; missing blobs map to None, other errors are raised"""
+        def fetch(name):
+            try:
+                return self.get(name)
+            except BlobNotFound:
+                return None
+
+        unique_names = list(dict.fromkeys(names))
+        if len(unique_names) <= 1:
+            return {name: fetch(name) for name in unique_names}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_names)))) as executor:
+            return dict(zip(unique_names, executor.map(fetch, unique_names)))
+
+
+def _as_bytes(data: Union[bytes, str]) -> bytes:
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+
+class GCSBackend(StorageBackend):
+    """Blobs in a GCS bucket, through the shared client of gcs_client"""
+
+    def __init__(self, bucket_name: str):
+        from google.api_core import exceptions as gcs_exceptions
+        from gcs_client import get_bucket
+
+        self.bucket_name = bucket_name
+        self.bucket = get_bucket(bucket_name)
+        self._exceptions = gcs_exceptions
+
+    def get(self, name: str) -> Tuple[bytes, int]:
+        blob = self.bucket.blob(name)
+        try:
+            content = blob.download_as_bytes()
+        except self._exceptions.NotFound:
+            raise BlobNotFound(name)
+        return content, blob.generation or 0
+
+    def put(self, name: str, data: Union[bytes, str], content_type: str = 'application/json',
+            if_generation_match: Optional[int] = None) -> int:
+        blob = self.bucket.blob(name)
+        try:
+            blob.upload_from_string(data, content_type=content_type, if_generation_match=if_generation_match)
+        except self._exceptions.PreconditionFailed:
+            raise GenerationMismatch(name)
+        return blob.generation or 0
+
+    def generation(self, name: str) -> int:
+        blob = self.bucket.get_blob(name)  # metadata request only
+        return blob.generation if blob is not None else 0
+
+    def list(self, prefix: str) -> List[str]:
+        return [blob.name for blob in self.bucket.list_blobs(prefix=prefix)]
+
+    def list_prefixes(self, prefix: str) -> List[str]:
+        blobs = self.bucket.list_blobs(prefix=prefix, delimiter="/")
+        for _ in blobs.pages:
+            pass  # prefixes are only populated once the pages are consumed
+        return sorted(blobs.prefixes)
+
+    def delete(self, name: str) -> bool:
+        try:
+            self.bucket.blob(name).delete()
+        except self._exceptions.NotFound:
+            return False
+        return True
+
+
+class LocalBackend(StorageBackend):
+    """
+    Blobs as files under a root directory
+
+    A write goes to a temporary file in the target directory that is renamed over
+    the blob, so readers never see a partial file. The generation is the file's
+    mtime in nanoseconds, bumped to stay strictly increasing. Creates
+    (if_generation_match=0) are atomic across processes; other conditional writes
+    are atomic within this process.
+    """
+
+    def __init__(self, root: str = DEFAULT_LOCAL_STORAGE_PATH, mmap_reads: bool = False):
+        self.root = os.path.abspath(root)
+        self.mmap_reads = mmap_reads
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, *name.split('/')))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Blob name escapes the storage root: {name}")
+        return path
+
+    def _generation(self, path: str) -> int:
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get(self, name: str) -> Tuple[bytes, int]:
+        try:
+            with open(self._path(name), 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if self.mmap_reads and stat.st_size >= MMAP_MIN_BYTES:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        content = mapped[:]
+                else:
+                    content = f.read()
+        except FileNotFoundError:
+            raise BlobNotFound(name)
+        # Files are only ever replaced, never modified in place, so this mtime matches the content
+        return content, stat.st_mtime_ns
+
+    def put(self, name: str, data: Union[bytes, str], content_type: str = 'application/json',
+            if_generation_match: Optional[int] = None) -> int:
+        path = self._path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_as_bytes(data))
+            with self._lock:
+                current = self._generation(path)
+                if if_generation_match is not None and if_generation_match != current:
+                    raise GenerationMismatch(name)
+                generation = max(time.time_ns(), current + 1)
+                os.utime(tmp_path, ns=(generation, generation))
+                if if_generation_match == 0:
+                    try:
+                        os.link(tmp_path, path)  # fails if another process created it first
+                    except FileExistsError:
+                        raise GenerationMismatch(name)
+                else:
+                    os.replace(tmp_path, path)
+            return generation
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def generation(self, name: str) -> int:
+        return self._generation(self._path(name))
+
+    def list(self, prefix: str) -> List[str]:
+        directory, _, _ = prefix.rpartition('/')
+        base = self._path(directory) if directory else self.root
+        names = []
+        for dirpath, _, filenames in os.walk(base):
+            relative = os.path.relpath(dirpath, self.root).replace(os.sep, '/')
+            for filename in filenames:
+                if filename.startswith(".tmp-"):
+                    continue
+                name = filename if relative == '.' else f"{relative}/{filename}"
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def list_prefixes(self, prefix: str) -> List[str]:
+        base = self._path(prefix.rstrip('/')) if prefix.strip('/') else self.root
+        try:
+            entries = os.listdir(base)
+        except FileNotFoundError:
+            return []
+        return sorted(f"{prefix}{entry}/" for entry in entries if os.path.isdir(os.path.join(base, entry)))
+
+    def delete(self, name: str) -> bool:
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+class MemoryBackend(StorageBackend):
+    """Blobs in a process-local dict (lost on restart)"""
+
+    def __init__(self):
+        self._blobs: Dict[str, Tuple[bytes, int]] = {}
+        self._lock = threading.Lock()
+        self._next_generation = 1
+
+    def get(self, name: str) -> Tuple[bytes, int]:
+        with self._lock:
+            blob = self._blobs.get(name)
+        if blob is None:
+            raise BlobNotFound(name)
+        return blob
+
+    def put(self, name: str, data: Union[bytes, str], content_type: str = 'application/json',
+            if_generation_match: Optional[int] = None) -> int:
+        content = _as_bytes(data)
+        with self._lock:
+            current = self._blobs.get(name, (None, 0))[1]
+            if if_generation_match is not None and if_generation_match != current:
+                raise GenerationMismatch(name)
+            generation = self._next_generation
+            self._next_generation += 1
+            self._blobs[name] = (content, generation)
+        return generation
+
+    def generation(self, name: str) -> int:
+        with self._lock:
+            return self._blobs.get(name, (None, 0))[1]
+
+    def list(self, prefix: str) -> List[str]:
+        with self._lock:
+            return sorted(name for name in self._blobs if name.startswith(prefix))
+
+    def list_prefixes(self, prefix: str) -> List[str]:
+        with self._lock:
+            names = [name[len(prefix):] for name in self._blobs if name.startswith(prefix)]
+        return sorted({f"{prefix}{rest.split('/', 1)[0]}/" for rest in names if '/' in rest})
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            return self._blobs.pop(name, None) is not None
+
+    def get_many(self, names: Iterable[str], max_workers: int = BATCH_GET_WORKERS) -> Dict[str, Optional[Tuple[bytes, int]]]:
+        with self._lock:
+            return {name: self._blobs.get(name) for name in dict.fromkeys(names)}
+
+
+def build_storage_backend(config: Dict[str, Any]) -> StorageBackend:
+    """Build the backend selected by config['storage']['backend']: 'gcs' (default), 'local' or 'memory'"""
+    storage_config = config.get('storage') or {}
+    backend = storage_config.get('backend', 'gcs')
+    if backend == 'local':
+        return LocalBackend(storage_config.get('local_path', DEFAULT_LOCAL_STORAGE_PATH),
+                            mmap_reads=storage_config.get('mmap_reads', False))
+    if backend == 'memory':
+        return MemoryBackend()
+    if backend != 'gcs':
+        print(f"Unknown storage backend '{backend}', using GCS")
+    return GCSBackend(config['gcs_bucket_name'])
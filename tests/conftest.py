@@ -0,0 +1,9 @@
+# tests/conftest.py
+"""Put app/ on the import path, as app/main.py does for the running app"""
+
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
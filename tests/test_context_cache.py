@@ -0,0 +1,203 @@
+# tests/test_context_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+pytest.importorskip("google.api_core")
+
+from backend.context_cache import (ContextCacheExpired, LocalContextCache, build_context_cache,
+                                   handle_is_valid)
+
+
+def _recording_stream(prompts):
+    def generate(prompt):
+        prompts.append(prompt)
+        yield "answer"
+    return generate
+
+
+def test_create_and_generate_prepends_the_cached_context():
+    prompts = []
+    cache = LocalContextCache(_recording_stream(prompts))
+    handle = cache.create("system", "LITERATURE", ttl_seconds=3600)
+
+    assert handle_is_valid(handle)
+    assert list(cache.generate_stream(handle, "question", {})) == ["answer"]
+    assert prompts == ["system\n\nLITERATURE\n\nquestion"]
+
+
+def test_expired_or_unknown_handles_raise():
+    cache = LocalContextCache(_recording_stream([]))
+    handle = cache.create("system", "LITERATURE", ttl_seconds=0)
+
+    assert not handle_is_valid(handle)
+    with pytest.raises(ContextCacheExpired):
+        cache.generate_stream(handle, "question", {})
+    with pytest.raises(ContextCacheExpired):
+        cache.generate_stream({'name': 'local/unknown', 'expires_at': time.time() + 3600}, "question", {})
+
+
+def test_build_context_cache_is_opt_in():
+    assert build_context_cache({}, "model", _recording_stream([])) is None
+    assert isinstance(build_context_cache({'enabled': True, 'backend': 'local'}, "model", _recording_stream([])),
+                      LocalContextCache)
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModel:
+    """Stands in for the Vertex model: records every prompt it is sent"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        self.prompts.append(contents[0])
+        return [_Chunk("answer")]
+
+
+class _FakeES:
+    def get_paper_contents(self, paper_ids):
+        return {}
+
+
+def _api_module():
+    return pytest.importorskip("backend.api")
+
+
+def _api():
+    """ResearchAssistantAPI wired to fakes: local context cache, fake model, no storage or ES"""
+    api_class = _api_module().ResearchAssistantAPI
+    api = api_class.__new__(api_class)
+    api.config = {'vertexai_model_id': 'test-model'}
+    api.model = _FakeModel()
+    api.es_manager = _FakeES()
+    api._passage_indexes = OrderedDict()
+    api._passage_indexes_lock = threading.Lock()
+    api.context_cache_config = {'enabled': True, 'backend': 'local', 'min_tokens': 0, 'ttl_seconds': 3600}
+    api.context_cache = LocalContextCache(api.generate_ai_response_stream)
+    return api
+
+
+def _conversation():
+    papers = [{
+        'paper_id': f'papers/p{i}.pdf',
+        'metadata': {'title': f'Paper {i}', 'abstract': f'Abstract of paper {i} about BRCA1 variants.',
+                     'url': f'https://example.org/p{i}'},
+        'content': f'Full text of paper {i}. BRCA1 variants change risk.',
+        'relevance_score': 1.0
+    } for i in range(3)]
+    return {
+        'retrieved_papers': papers,
+        'messages': [{'role': 'assistant', 'content': 'Report'}, {'role': 'user', 'content': 'What about BRCA1?'}]
+    }
+
+
+def test_follow_up_creates_then_reuses_the_cached_context():
+    api = _api()
+    conversation = _conversation()
+
+    assert "".join(api.generate_follow_up_stream(conversation)) == "answer"
+    handle = conversation['context_cache']
+    assert handle['model'] == 'test-model'
+    # The local cache prepends the system instruction and the literature to the turn prompt
+    assert api.model.prompts[0].startswith(_api_module().FOLLOW_UP_SYSTEM_INSTRUCTION)
+    assert "Title: Paper 0" in api.model.prompts[0]
+
+    conversation['messages'] += [{'role': 'assistant', 'content': 'answer'}, {'role': 'user', 'content': 'And TP53?'}]
+    assert "".join(api.generate_follow_up_stream(conversation)) == "answer"
+    assert conversation['context_cache'] == handle
+    assert len(api.context_cache._entries) == 1
+    assert api.model.prompts[1].startswith(_api_module().FOLLOW_UP_SYSTEM_INSTRUCTION)
+
+
+def test_follow_up_falls_back_to_a_full_resend_when_the_cache_is_gone():
+    api = _api()
+    conversation = _conversation()
+    "".join(api.generate_follow_up_stream(conversation))
+    api.context_cache._entries.clear()  # the provider dropped the cached content
+
+    assert "".join(api.generate_follow_up_stream(conversation)) == "answer"
+    assert 'context_cache' not in conversation
+    # The full follow-up prompt carries the paper sources itself
+    assert api.model.prompts[-1].startswith("Continue our conversation. You are the Polo-GGB Research Assistant.")
+    assert "SOURCE [1]" in api.model.prompts[-1]
+
+
+def test_follow_up_recreates_an_expired_handle():
+    api = _api()
+    conversation = _conversation()
+    "".join(api.generate_follow_up_stream(conversation))
+    expired = dict(conversation['context_cache'], expires_at=time.time())
+    conversation['context_cache'] = expired
+
+    assert "".join(api.generate_follow_up_stream(conversation)) == "answer"
+    assert conversation['context_cache']['name'] != expired['name']
+    assert list(api.context_cache._entries) == [conversation['context_cache']['name']]
+
+
+def test_a_model_change_replaces_and_deletes_the_cached_context():
+    api = _api()
+    conversation = _conversation()
+    "".join(api.generate_follow_up_stream(conversation))
+    old = conversation['context_cache']
+
+    api.config['vertexai_model_id'] = 'other-model'
+    "".join(api.generate_follow_up_stream(conversation))
+
+    assert conversation['context_cache']['model'] == 'other-model'
+    assert old['name'] not in api.context_cache._entries
+    assert len(api.context_cache._entries) == 1
+
+
+def test_falling_below_min_tokens_deletes_the_old_cached_context():
+    api = _api()
+    conversation = _conversation()
+    "".join(api.generate_follow_up_stream(conversation))
+    conversation['context_cache']['expires_at'] = time.time()
+
+    api.context_cache_config['min_tokens'] = 10 ** 6
+    "".join(api.generate_follow_up_stream(conversation))
+
+    assert 'context_cache' not in conversation
+    assert api.context_cache._entries == {}
+
+
+def test_follow_up_without_enough_context_skips_caching():
+    api = _api()
+    api.context_cache_config['min_tokens'] = 10 ** 6
+    conversation = _conversation()
+
+    assert "".join(api.generate_follow_up_stream(conversation)) == "answer"
+    assert 'context_cache' not in conversation
+    assert api.context_cache._entries == {}
+
+
+class _FakeQueue:
+    def __init__(self):
+        self.keys = []
+
+    def submit(self, key, job):
+        self.keys.append(key)
+
+
+def test_deleting_a_conversation_or_logging_out_deletes_its_cached_context():
+    api = _api()
+    api.persistence_queue = _FakeQueue()
+    deleted, kept = _conversation(), _conversation()
+    "".join(api.generate_follow_up_stream(deleted))
+    "".join(api.generate_follow_up_stream(kept))
+    assert len(api.context_cache._entries) == 2
+
+    api.delete_conversation("alice", "c1", deleted)
+    assert api.persistence_queue.keys == [('conversation', 'alice', 'c1')]
+    assert len(api.context_cache._entries) == 1
+
+    api.release_context_caches([kept, {'title': 'never cached'}])
+    assert api.context_cache._entries == {}
+    assert 'context_cache' not in kept
@@ -0,0 +1,62 @@
+# tests/test_context_packer.py
+from backend.context_packer import count_tokens, pack_history, pack_sources, trim_to_tokens
+
+
+def _source(title, sentences, score=None):
+    return {'title': title, 'link': 'https://example.org', 'content': "Some finding. " * sentences, 'score': score}
+
+
+def test_count_tokens_charges_long_words_extra():
+    assert count_tokens("") == 0
+    assert count_tokens("a b c") == 3
+    assert count_tokens("pharmacogenomics") > count_tokens("gene")
+
+
+def test_trim_to_tokens_cuts_at_sentence_boundary():
+    text = "First sentence here. Second sentence here. Third sentence here."
+    trimmed = trim_to_tokens(text, 12)
+    assert trimmed == "First sentence here. Second sentence here."
+    assert trim_to_tokens(text, 1000) == text
+    assert trim_to_tokens(text, 0) == ""
+
+
+def test_pack_sources_stays_within_budget_and_keeps_citation_order():
+    sources = [_source("a", 400, score=1), _source("b", 400, score=5), _source("c", 400, score=2)]
+    packed = pack_sources(sources, 600)
+
+    assert packed['used_tokens'] <= 600
+    assert [source['index'] for source in packed['sources']] == [0, 1, 2]
+    tokens = {source['index']: source['tokens'] for source in packed['sources']}
+    assert tokens[1] > tokens[2] > tokens[0]
+
+
+def test_pack_sources_gives_every_kept_source_its_minimum():
+    sources = [_source("top", 1000, score=1000)] + [_source(f"low{i}", 1000, score=1) for i in range(3)]
+    packed = pack_sources(sources, 600, min_source_tokens=64)
+
+    assert not packed['dropped']
+    for source in packed['sources']:
+        assert source['tokens'] >= 64 - 2  # trimmed at a sentence boundary
+
+
+def test_pack_sources_drops_least_relevant_sources_that_do_not_fit():
+    sources = [_source(str(i), 200, score=10 - i) for i in range(10)]
+    packed = pack_sources(sources, 300, min_source_tokens=64)
+
+    assert packed['dropped']
+    kept = [source['index'] for source in packed['sources']]
+    assert max(kept) < min(packed['dropped'])
+    assert packed['used_tokens'] <= 300
+
+
+def test_pack_history_keeps_newest_messages_and_always_the_question():
+    messages = [{'role': 'user', 'content': f"message {i} " * 50} for i in range(10)]
+    history = pack_history(messages, 250)
+
+    assert history['kept'] + history['dropped'] == 10
+    assert history['dropped'] > 0
+    assert "message 9" in history['text'] and "message 0" not in history['text']
+
+    question_only = pack_history([{'role': 'user', 'content': "word " * 500}], 20)
+    assert question_only['kept'] == 1
+    assert count_tokens(question_only['text']) <= 20
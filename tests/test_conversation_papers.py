@@ -0,0 +1,51 @@
+# tests/test_conversation_papers.py
+import pytest
+
+from paper_store import PaperContentStore
+from storage_backend import MemoryBackend
+
+api_module = pytest.importorskip("backend.api")
+
+
+def _api(store):
+    api = api_module.ResearchAssistantAPI.__new__(api_module.ResearchAssistantAPI)
+    api.paper_store = store
+    return api
+
+
+def _paper(i):
+    return {
+        'paper_id': f'papers/p{i}.pdf',
+        'metadata': {'title': f'Paper {i}', 'abstract': f'Abstract {i}'},
+        'content': f'Full text {i}',
+        'relevance_score': 1.0
+    }
+
+
+def test_compact_and_hydrate_round_trip():
+    api = _api(PaperContentStore(MemoryBackend()))
+    compact = api._compact_conversation({'retrieved_papers': [_paper(0), _paper(1)]})
+
+    assert all('content' not in paper and paper['content_ref'] for paper in compact['retrieved_papers'])
+    api.hydrate_conversation_papers(compact)
+    assert [paper['content'] for paper in compact['retrieved_papers']] == ['Full text 0', 'Full text 1']
+    assert compact['retrieved_papers'][0]['metadata']['abstract'] == 'Abstract 0'
+
+
+def test_unresolved_references_keep_their_original_ref():
+    backend = MemoryBackend()
+    api = _api(PaperContentStore(backend))
+    compact = api._compact_conversation({'retrieved_papers': [_paper(0), _paper(1)]})
+    lost_ref = compact['retrieved_papers'][1]['content_ref']
+
+    # The second text cannot be fetched (e.g. a transient failure) by a fresh process
+    for name in backend.list("user-data/paper-store/"):
+        if lost_ref in name:
+            backend.delete(name)
+    api = _api(PaperContentStore(backend))
+    api.hydrate_conversation_papers(compact)
+
+    assert compact['retrieved_papers'][0]['content'] == 'Full text 0'
+    assert 'content' not in compact['retrieved_papers'][1]
+    recompacted = api._compact_conversation(compact)
+    assert recompacted['retrieved_papers'][1]['content_ref'] == lost_ref
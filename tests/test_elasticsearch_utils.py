@@ -0,0 +1,67 @@
+# tests/test_elasticsearch_utils.py
+import pytest
+
+es_utils = pytest.importorskip("elasticsearch_utils")
+
+
+class _FakeIndices:
+    def exists(self, index):
+        return True
+
+    def put_mapping(self, index, properties):
+        pass
+
+
+class _FakeClient:
+    """Elasticsearch client stand-in that answers every search with the same hits"""
+
+    def __init__(self, *args, **kwargs):
+        self.indices = _FakeIndices()
+        self.msearch_calls = 0
+
+    def ping(self):
+        return True
+
+    def msearch(self, body):
+        self.msearch_calls += 1
+        hits = [{'_id': 'p1', '_score': 2.0, '_source': {'title': 'BRCA1'}},
+                {'_id': 'p2', '_score': 1.0, '_source': {'title': 'TP53'}}]
+        return {'responses': [{'hits': {'hits': hits}} for _ in body[::2]]}
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(es_utils, "Elasticsearch", _FakeClient)
+    return es_utils.ElasticsearchManager(hosts=["http://es"], api_key="key")
+
+
+def test_query_cache_keeps_only_ids_and_scores(manager):
+    first = manager.msearch_papers([(["BRCA1"], "AND")], source_fields=["title"])
+    assert first[0][0]['_source'] == {'title': 'BRCA1'}
+
+    cached = manager.msearch_papers([(["BRCA1"], "AND")], source_fields=["title"])
+    assert manager.es_client.msearch_calls == 1
+    assert cached == [[{'_id': 'p1', '_score': 2.0}, {'_id': 'p2', '_score': 1.0}]]
+
+    # Ids do not depend on _source, so an ids-only search shares the entry
+    manager.msearch_papers([(["BRCA1"], "AND", False)])
+    assert manager.es_client.msearch_calls == 1
+
+
+def test_writes_invalidate_cached_queries(manager):
+    manager.msearch_papers([(["BRCA1"], "AND")])
+    manager.bump_write_generation()
+    manager.msearch_papers([(["BRCA1"], "AND")])
+
+    assert manager.es_client.msearch_calls == 2
+    assert manager.query_cache_stats()['invalidated'] == 1
+
+
+def test_failed_connection_raises_instead_of_stopping(monkeypatch):
+    class _DownClient(_FakeClient):
+        def ping(self):
+            return False
+
+    monkeypatch.setattr(es_utils, "Elasticsearch", _DownClient)
+    with pytest.raises(ConnectionError):
+        es_utils.ElasticsearchManager(hosts=["http://es"], api_key="key")
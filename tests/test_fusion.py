@@ -0,0 +1,24 @@
+# tests/test_fusion.py
+import pytest
+
+pytest.importorskip("numpy")
+
+from backend.fusion import RRF_K, weighted_rrf
+
+
+def test_papers_ranked_high_by_several_lists_win():
+    fused = weighted_rrf({'keywords': ['a', 'b', 'c'], 'dense': ['b', 'a', 'd']})
+
+    assert fused['ids'][:2] == ['a', 'b'] or fused['ids'][:2] == ['b', 'a']
+    assert set(fused['ids']) == {'a', 'b', 'c', 'd'}
+    assert fused['scores'] == sorted(fused['scores'], reverse=True)
+    assert fused['contributions']['d'] == {'dense': pytest.approx(1.0 / (RRF_K + 3))}
+
+
+def test_weights_and_candidates():
+    fused = weighted_rrf({'keywords': ['a', 'b'], 'dense': ['b', 'a']}, weights={'dense': 3.0}, candidates=['a', 'b'])
+    assert fused['ids'] == ['b', 'a']
+
+    restricted = weighted_rrf({'keywords': ['a', 'b', 'c']}, candidates=['c', 'a'])
+    assert restricted['ids'] == ['a', 'c']
+    assert weighted_rrf({'keywords': []}) == {'ids': [], 'scores': [], 'contributions': {}}
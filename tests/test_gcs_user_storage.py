@@ -0,0 +1,280 @@
+# tests/test_gcs_user_storage.py
+import time
+
+import pytest
+
+from gcs_user_storage import COMPACT_AFTER_SEGMENTS, GCSUserStorage
+from storage_backend import MemoryBackend, StorageError
+
+
+def _conversation(*contents):
+    return {
+        'title': 'BRCA1 analysis',
+        'keywords': ['BRCA1'],
+        'created_at': 1.0,
+        'last_interaction_time': 1.0,
+        'messages': [{'role': 'user', 'content': content} for content in contents]
+    }
+
+
+def _segments(backend, storage, username="alice", conversation_id="c1"):
+    return backend.list(storage._get_segment_prefix(username, conversation_id))
+
+
+def _wait_for_compaction(storage):
+    for _ in range(100):
+        if not storage._compacting:
+            return
+        time.sleep(0.01)
+
+
+class _InterleavingBackend(MemoryBackend):
+    """
+    MemoryBackend that runs a callback once, just before the first put matching a blob name;
+    lets a test pause one process mid-operation and run another one deterministically
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._interleave = None
+
+    def interleave(self, name_part, callback):
+        self._interleave = (name_part, callback)
+
+    def put(self, name, data, **kwargs):
+        if self._interleave and self._interleave[0] in name:
+            callback, self._interleave = self._interleave[1], None
+            callback()
+        return super().put(name, data, **kwargs)
+
+
+def _append(storage, conversation, content):
+    conversation['messages'].append({'role': 'user', 'content': content})
+    assert storage.save_conversation("alice", "c1", conversation)
+
+
+def _contents(backend):
+    conversation = GCSUserStorage(backend=backend).load_conversation("alice", "c1").value
+    return [message['content'] for message in conversation['messages']]
+
+
+@pytest.fixture
+def backend():
+    return MemoryBackend()
+
+
+def test_save_and_load_round_trip(backend):
+    storage = GCSUserStorage(backend=backend)
+    conversation = _conversation("hello")
+
+    assert storage.save_conversation("alice", "c1", conversation)
+    loaded = GCSUserStorage(backend=backend).load_conversation("alice", "c1")
+    assert loaded and loaded.value == conversation
+
+
+def test_later_turns_are_appended_as_segments(backend):
+    storage = GCSUserStorage(backend=backend)
+    conversation = _conversation("q1")
+    storage.save_conversation("alice", "c1", conversation)
+    snapshot = backend.get(storage._get_conversation_path("alice", "c1"))
+
+    conversation['messages'].append({'role': 'assistant', 'content': "a1"})
+    conversation['last_interaction_time'] = 2.0
+    assert storage.save_conversation("alice", "c1", conversation)
+
+    assert backend.get(storage._get_conversation_path("alice", "c1")) == snapshot
+    assert len(_segments(backend, storage)) == 1
+    loaded = GCSUserStorage(backend=backend).load_conversation("alice", "c1").value
+    assert loaded == conversation
+
+    # Nothing changed: nothing written
+    assert storage.save_conversation("alice", "c1", conversation)
+    assert len(_segments(backend, storage)) == 1
+
+
+def test_manifest_tracks_saves_and_deletes(backend):
+    storage = GCSUserStorage(backend=backend)
+    conversation = _conversation("q1")
+    storage.save_conversation("alice", "c1", conversation)
+    conversation['messages'].append({'role': 'assistant', 'content': "a1"})
+    conversation['title'] = "Renamed"
+    storage.save_conversation("alice", "c1", conversation)
+
+    entries, _ = GCSUserStorage(backend=backend).load_manifest("alice")
+    assert entries['c1']['title'] == "Renamed"
+    assert entries['c1']['message_count'] == 2
+
+    assert storage.delete_conversation("alice", "c1")
+    entries, _ = GCSUserStorage(backend=backend).load_manifest("alice")
+    assert entries == {}
+
+
+def test_login_loads_stubs_from_the_manifest(backend):
+    GCSUserStorage(backend=backend).save_conversation("alice", "c1", _conversation("q1"))
+
+    data = GCSUserStorage(backend=backend).load_user_data_from_gcs("alice").value
+    stub = data['conversations']['c1']
+    assert stub['stub'] is True
+    assert stub['title'] == "BRCA1 analysis"
+    assert 'messages' not in stub and 'log_seq' not in stub
+
+
+def test_stubs_are_never_saved(backend):
+    storage = GCSUserStorage(backend=backend)
+    result = storage.save_conversation("alice", "c1", {'title': 'x', 'stub': True})
+
+    assert not result and result.retryable is False
+    assert backend.list("user-data/") == []
+
+
+def test_stale_copy_only_adds_its_own_turns(backend):
+    first, second = GCSUserStorage(backend=backend), GCSUserStorage(backend=backend)
+    conversation = _conversation("q1")
+    first.save_conversation("alice", "c1", conversation)
+    stale = second.load_conversation("alice", "c1").value
+
+    conversation['messages'].append({'role': 'user', 'content': "from first"})
+    first.save_conversation("alice", "c1", conversation)
+    stale['messages'].append({'role': 'user', 'content': "from second"})
+    assert second.save_conversation("alice", "c1", stale)
+
+    loaded = GCSUserStorage(backend=backend).load_conversation("alice", "c1").value
+    assert [m['content'] for m in loaded['messages']] == ["q1", "from first", "from second"]
+
+
+def test_segment_reusing_a_compacted_seq_is_rewritten(backend):
+    first, second = GCSUserStorage(backend=backend), GCSUserStorage(backend=backend)
+    conversation = _conversation("q0")
+    first.save_conversation("alice", "c1", conversation)
+    stale = second.load_conversation("alice", "c1").value
+
+    # Enough appends for the first process to fold its segments and delete them
+    for i in range(1, COMPACT_AFTER_SEGMENTS + 1):
+        conversation['messages'].append({'role': 'user', 'content': f"q{i}"})
+        first.save_conversation("alice", "c1", conversation)
+    _wait_for_compaction(first)
+    assert _segments(backend, first) == []
+
+    # The stale copy's next seq was freed by the compaction; the manifest fence catches it
+    stale['messages'].append({'role': 'assistant', 'content': "late"})
+    assert second.save_conversation("alice", "c1", stale)
+
+    loaded = GCSUserStorage(backend=backend).load_conversation("alice", "c1").value
+    assert loaded['messages'][-1]['content'] == "late"
+    assert len(loaded['messages']) == COMPACT_AFTER_SEGMENTS + 2
+    entries, _ = GCSUserStorage(backend=backend).load_manifest("alice")
+    assert entries['c1']['message_count'] == COMPACT_AFTER_SEGMENTS + 2
+
+
+def test_concurrent_preference_writers_keep_each_others_fields(backend):
+    first, second = GCSUserStorage(backend=backend), GCSUserStorage(backend=backend)
+    first.save_user_data("alice", "user_preferences", {'search_mode': 'all_keywords', 'selected_keywords': []})
+    base = second.load_user_data("alice", "user_preferences").value
+
+    first.save_user_data("alice", "user_preferences", {'search_mode': 'any_keyword', 'selected_keywords': []})
+    assert second.save_user_data("alice", "user_preferences", dict(base, selected_keywords=['BRCA1']))
+
+    stored = GCSUserStorage(backend=backend).load_user_data("alice", "user_preferences").value
+    assert stored == {'search_mode': 'any_keyword', 'selected_keywords': ['BRCA1']}
+
+
+def test_load_conversations_reports_missing_ones(backend):
+    storage = GCSUserStorage(backend=backend)
+    storage.save_conversation("alice", "c1", _conversation("q1"))
+
+    result = GCSUserStorage(backend=backend).load_conversations("alice", ["c1", "missing"])
+    assert list(result['conversations']) == ["c1"]
+    assert "missing" in result['failed']
+
+
+@pytest.mark.parametrize("paused_before", ["manifest.json", "conversations/c1.json"])
+def test_append_racing_a_compaction_is_kept(paused_before):
+    backend = _InterleavingBackend()
+    writer, compactor = GCSUserStorage(backend=backend), GCSUserStorage(backend=backend)
+    conversation = _conversation("q0")
+    writer.save_conversation("alice", "c1", conversation)
+    for i in range(1, 4):
+        _append(writer, conversation, f"q{i}")
+
+    # The compactor has read the snapshot and segments 1-3; segment 4 lands before its claim
+    # (manifest.json) or between its claim and its snapshot upload
+    backend.interleave(paused_before, lambda: _append(writer, conversation, "q4"))
+    assert compactor.compact_conversation("alice", "c1")
+
+    assert _contents(backend) == ["q0", "q1", "q2", "q3", "q4"]
+    assert _segments(backend, writer) == [writer._get_segment_path("alice", "c1", 4)]
+    entries, _ = GCSUserStorage(backend=backend).load_manifest("alice")
+    assert entries['c1']['message_count'] == 5 and entries['c1']['log_seq'] == 3
+
+    _append(writer, conversation, "q5")
+    assert _contents(backend) == ["q0", "q1", "q2", "q3", "q4", "q5"]
+
+
+def test_compaction_that_stops_after_its_claim_loses_nothing():
+    backend = _InterleavingBackend()
+    writer, stale = GCSUserStorage(backend=backend), GCSUserStorage(backend=backend)
+    conversation = _conversation("q0")
+    writer.save_conversation("alice", "c1", conversation)
+    _append(writer, conversation, "q1")
+    stale_copy = stale.load_conversation("alice", "c1").value
+    _append(writer, conversation, "q2")
+
+    # The compactor claims segments 1-2 in the manifest, then dies before uploading the snapshot
+    def die():
+        raise StorageError("process died")
+    backend.interleave("conversations/c1.json", die)
+    with pytest.raises(StorageError):
+        GCSUserStorage(backend=backend).compact_conversation("alice", "c1")
+    assert GCSUserStorage(backend=backend).load_manifest("alice")[0]['c1']['log_seq'] == 2
+
+    # The claimed segments still exist, so readers and both writers carry on
+    assert _contents(backend) == ["q0", "q1", "q2"]
+    _append(writer, conversation, "q3")
+    stale_copy['messages'].append({'role': 'assistant', 'content': "late"})
+    assert stale.save_conversation("alice", "c1", stale_copy)
+    assert _contents(backend) == ["q0", "q1", "q2", "q3", "late"]
+
+    assert GCSUserStorage(backend=backend).compact_conversation("alice", "c1")
+    assert _segments(backend, writer) == []
+    assert _contents(backend) == ["q0", "q1", "q2", "q3", "late"]
+
+
+def test_compaction_overtaken_by_another_gives_up():
+    backend = _InterleavingBackend()
+    writer = GCSUserStorage(backend=backend)
+    conversation = _conversation("q0")
+    writer.save_conversation("alice", "c1", conversation)
+    for i in range(1, 3):
+        _append(writer, conversation, f"q{i}")
+
+    # While the slow compactor waits on its claim, another one folds everything and the
+    # writer appends on top of the new snapshot
+    def overtake():
+        assert GCSUserStorage(backend=backend).compact_conversation("alice", "c1")
+        _append(writer, conversation, "q3")
+    backend.interleave("manifest.json", overtake)
+    assert not GCSUserStorage(backend=backend).compact_conversation("alice", "c1")
+
+    assert _contents(backend) == ["q0", "q1", "q2", "q3"]
+    assert _segments(backend, writer) == [writer._get_segment_path("alice", "c1", 3)]
+
+
+def test_manifest_failure_after_the_segment_upload_is_recorded_on_retry():
+    backend = _InterleavingBackend()
+    storage = GCSUserStorage(backend=backend)
+    conversation = _conversation("q0")
+    storage.save_conversation("alice", "c1", conversation)
+
+    def unavailable():
+        raise StorageError("service unavailable", retryable=True)
+    backend.interleave("manifest.json", unavailable)
+    conversation['messages'].append({'role': 'user', 'content': "q1"})
+    result = storage.save_conversation("alice", "c1", conversation)
+    assert not result and result.retryable
+    assert _contents(backend) == ["q0", "q1"]  # the segment itself was written
+
+    # The write-behind queue retries the same save: nothing new to append, but the manifest catches up
+    assert storage.save_conversation("alice", "c1", conversation)
+    entries, _ = GCSUserStorage(backend=backend).load_manifest("alice")
+    assert entries['c1']['message_count'] == 2 and entries['c1']['seq'] == 1
+    assert len(_segments(backend, storage)) == 1
@@ -0,0 +1,44 @@
+# tests/test_paper_store.py
+from paper_store import PaperContentStore, content_key, paper_reference, paper_text
+from storage_backend import MemoryBackend
+
+
+def _paper(content="Full text.", abstract="Abstract."):
+    return {
+        'paper_id': 'papers/p1.pdf',
+        'metadata': {'title': 'A paper', 'abstract': abstract, 'url': 'https://example.org/p1', 'authors': ['X']},
+        'content': content,
+        'relevance_score': 0.9
+    }
+
+
+def test_put_get_round_trip_and_deduplication():
+    backend = MemoryBackend()
+    store = PaperContentStore(backend)
+    text = paper_text(_paper())
+
+    key = store.put(text)
+    assert key == content_key(text)
+    assert store.put(dict(text)) == key
+    assert len(backend.list(store.prefix)) == 1
+
+    # A fresh store (e.g. after a restart) reads it back from the backend
+    assert PaperContentStore(backend).get(key) == text
+
+
+def test_get_many_maps_missing_keys_to_none():
+    store = PaperContentStore(MemoryBackend())
+    key = store.put(paper_text(_paper()))
+
+    texts = store.get_many([key, "0" * 64, key])
+    assert texts[key]['content'] == "Full text."
+    assert texts["0" * 64] is None
+
+
+def test_paper_reference_keeps_only_lightweight_fields():
+    reference = paper_reference(_paper(), "abc")
+
+    assert reference['content_ref'] == "abc"
+    assert 'content' not in reference
+    assert reference['metadata'] == {'title': 'A paper', 'url': 'https://example.org/p1'}
+    assert 'content_ref' not in paper_reference(_paper(), None)
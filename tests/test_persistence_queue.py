@@ -0,0 +1,97 @@
+# tests/test_persistence_queue.py
+import threading
+
+from persistence_queue import WriteBehindQueue
+from storage_backend import BlobNotFound, GenerationMismatch, StorageError, StorageResult, is_transient_error
+
+
+def _queue():
+    return WriteBehindQueue(workers=1, max_attempts=3, backoff_base=0.001, backoff_max=0.01)
+
+
+def _flaky(failures, error=None, result=None):
+    """Job that fails (raising error or returning result) `failures` times, then succeeds"""
+    calls = []
+
+    def job():
+        calls.append(1)
+        if len(calls) <= failures:
+            if error is not None:
+                raise error
+            return result
+        return StorageResult.success()
+
+    return job, calls
+
+
+def test_pending_writes_for_the_same_key_coalesce():
+    queue = _queue()
+    release = threading.Event()
+    queue.submit(('conversation', 'alice', 'blocker'), release.wait)
+    runs = []
+    for version in range(3):
+        queue.submit(('conversation', 'alice', 'c1'), lambda version=version: runs.append(version) or True)
+    release.set()
+
+    assert queue.flush(timeout=5)
+    assert runs == [2]
+    assert queue.stats()['coalesced'] == 2
+
+
+def test_transient_failures_are_retried():
+    queue = _queue()
+    job, calls = _flaky(2, error=GenerationMismatch("x"))
+    queue.submit(('user_data', 'alice', 'prefs'), job)
+
+    assert queue.flush(timeout=5)
+    assert len(calls) == 3
+    assert queue.stats()['retries'] == 2 and queue.stats()['completed'] == 1
+
+
+def test_retryable_storage_errors_are_retried():
+    queue = _queue()
+    job, calls = _flaky(1, error=StorageError("kept changing", retryable=True))
+    queue.submit(('conversation', 'alice', 'c1'), job)
+
+    assert queue.flush(timeout=5)
+    assert len(calls) == 2
+
+
+def test_permanent_failures_are_not_retried():
+    queue = _queue()
+    raising, raising_calls = _flaky(5, error=StorageError("malformed"))
+    rejected, rejected_calls = _flaky(5, result=StorageResult.failure("stub", retryable=False))
+    queue.submit(('conversation', 'alice', 'c1'), raising)
+    queue.submit(('conversation', 'alice', 'c2'), rejected)
+
+    assert queue.flush(timeout=5)
+    assert len(raising_calls) == 1 and len(rejected_calls) == 1
+    assert queue.stats()['failed'] == 2
+
+
+def test_flush_waits_only_for_the_owner():
+    queue = WriteBehindQueue(workers=2)
+    release = threading.Event()
+    queue.submit(('conversation', 'bob', 'c1'), release.wait)
+    queue.submit(('conversation', 'alice', 'c1'), lambda: True)
+
+    assert queue.flush(timeout=5, owner='alice')
+    assert queue.flush(timeout=0.2, owner='bob') is False
+    release.set()
+    assert queue.flush(timeout=5)
+
+
+def test_is_transient_error_honours_retryable_storage_errors():
+    class HttpError(Exception):
+        def __init__(self, code):
+            self.code = code
+
+    assert is_transient_error(GenerationMismatch("x"))
+    assert is_transient_error(StorageError("kept changing", retryable=True))
+    assert not is_transient_error(StorageError("broken"))
+    assert not is_transient_error(BlobNotFound("x"))
+    assert is_transient_error(HttpError(429)) and is_transient_error(HttpError(503))
+    assert not is_transient_error(HttpError(403))
+    assert is_transient_error(ConnectionResetError())
+    assert not is_transient_error(PermissionError())
+    assert not is_transient_error(ValueError())
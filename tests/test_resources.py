@@ -0,0 +1,52 @@
+# tests/test_resources.py
+import threading
+import time
+
+from backend.resources import ResourceRegistry
+
+
+class Resource:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_resources_are_reused_until_their_config_changes():
+    registry = ResourceRegistry()
+    first = registry.get_or_build('store', {'path': 'a'}, Resource)
+
+    assert registry.get_or_build('store', {'path': 'a'}, Resource) is first
+    second = registry.get_or_build('store', {'path': 'b'}, Resource)
+    assert second is not first
+    assert first.closed and not second.closed
+
+
+def test_invalidate_closes_the_dropped_resource():
+    registry = ResourceRegistry()
+    resource = registry.get_or_build('store', {}, Resource)
+    registry.invalidate('store')
+
+    assert resource.closed
+    assert registry.get_or_build('store', {}, Resource) is not resource
+
+
+def test_a_slow_build_does_not_block_other_resources():
+    registry = ResourceRegistry()
+    release = threading.Event()
+
+    def slow_build():
+        release.wait(5)
+        return Resource()
+
+    builder = threading.Thread(target=registry.get_or_build, args=('slow', {}, slow_build))
+    builder.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    registry.get_or_build('fast', {}, Resource)
+    elapsed = time.monotonic() - started
+    release.set()
+    builder.join()
+
+    assert elapsed < 1
@@ -0,0 +1,40 @@
+# tests/test_storage_backend.py
+import pytest
+
+from storage_backend import BlobNotFound, GenerationMismatch, LocalBackend, MemoryBackend
+
+
+@pytest.fixture(params=["memory", "local"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        return LocalBackend(str(tmp_path))
+    return MemoryBackend()
+
+
+def test_generations_and_conditional_writes(backend):
+    assert backend.generation("a/b.json") == 0
+    with pytest.raises(BlobNotFound):
+        backend.get("a/b.json")
+
+    first = backend.put("a/b.json", "one", if_generation_match=0)
+    with pytest.raises(GenerationMismatch):
+        backend.put("a/b.json", "two", if_generation_match=0)
+    second = backend.put("a/b.json", "two", if_generation_match=first)
+
+    assert second != first
+    assert backend.get("a/b.json") == (b"two", second)
+    with pytest.raises(GenerationMismatch):
+        backend.put("a/b.json", "three", if_generation_match=first)
+
+
+def test_list_get_many_and_delete(backend):
+    backend.put("users/alice/x.json", "1")
+    backend.put("users/bob/y.json", "2")
+
+    assert backend.list("users/alice/") == ["users/alice/x.json"]
+    assert backend.list_prefixes("users/") == ["users/alice/", "users/bob/"]
+    fetched = backend.get_many(["users/alice/x.json", "users/missing.json"])
+    assert fetched["users/alice/x.json"][0] == b"1"
+    assert fetched["users/missing.json"] is None
+    assert backend.delete("users/bob/y.json") is True
+    assert backend.delete("users/bob/y.json") is False